@@ -20,13 +20,25 @@ Fecha: Febrero 2026
 # Includes
 import os
 import sys
+import mmap
 import getpass
 
 from Crypto.Cipher import AES       # Implementacion del algoritmo AES, usando el modo CBC de PyCryptodome
 from Crypto.Util.Padding import pad, unpad # Funciones para el padding
-from Crypto.Protocol.KDF import PBKDF2     # FUncion para la derivacion de clave usando PBKDF2
+from Crypto.Protocol.KDF import PBKDF2, HKDF # FUncion para la derivacion de clave usando PBKDF2 (y HKDF para claves aleatorias)
+from Crypto.Hash import SHA256             # Hash usado por HKDF
 from Crypto.Random import get_random_bytes # Generador de bytes aleatorios seguros
 
+from metrics import etapa, mostrar         # Medicion de etapas y mensajes de progreso (modo silencioso)
+from compression import (                  # Etapa opcional de compresion antes del cifrado
+    LectorComprimido, EscritorDescomprimido, crear_compresor, identificador_algoritmo, es_comprimible,
+    SIN_COMPRESION, MASCARA_COMPRESION, NOMBRES_ALGORITMOS, SIZE_MUESTRA,
+)
+from authenticated_stream import (         # Autenticacion por bloques (HMAC) del formato en flujo
+    EscritorAutenticado, LectorAutenticado, ErrorAutenticacion, derivar_clave_mac, mac_cabecera,
+    verificar_cabecera, verificar_ultimo_registro, SIZE_MAC_CABECERA,
+)
+
 
 # Constantes
 SIZE_SALT = 16
@@ -34,41 +46,269 @@ SIZE_IV = 16
 SIZE_CLAVE = 32
 ITERACIONES = 100000
 SIZE_BLOQUE = 16
+SIZE_CHUNK = 64 * 1024  # Tamaño de lectura por bloques (multiplo de SIZE_BLOQUE)
+SIZE_CHUNK_MMAP = 1024 * 1024   # Tamaño de cada llamada a AES cuando los archivos se mapean en memoria
+UMBRAL_MMAP = 4 * 1024 * 1024   # A partir de este tamaño los archivos se mapean en memoria en lugar de leerse por bloques
 ENC = ".enc"
 
+# Cabecera de los archivos .enc versionados
+# [MAGIC (8 bytes)][version (1 byte)][modo (1 byte)][flags (1 byte)][salt (16 bytes)][IV (16 bytes)][datos cifrados]
+# Los archivos cifrados con contraseña se siguen guardando sin cabecera, igual que en el laboratorio 02 (salvo que se compriman)
+# Los 4 bits bajos de flags indican el algoritmo de compresion aplicado antes de cifrar (ver compression.py)
+# Con FLAG_AUTENTICADO despues del IV va el MAC de la cabecera, y los datos cifrados van en registros con tag (ver authenticated_stream.py)
+MAGIC_ENC = b"AESFILE\x1a"
+VERSION_CBC = 2
+VERSION_SEGMENTADO = 3  # Segmentos AES-GCM independientes, ver segmented_encryptor.py
+SIZE_CABECERA = len(MAGIC_ENC) + 3
+FLAG_AUTENTICADO = 0x10
+
+# Modos de derivacion de la clave AES
+MODO_PASSWORD = 0   # Contraseña de usuario, PBKDF2 con 100k iteraciones
+MODO_CLAVE = 1      # Clave aleatoria de 256 bits (sobre digital), un solo paso de HKDF
+
+
+class ErrorCifrado(Exception):
+    # Error al cifrar o descifrar un archivo (archivo inexistente, corrupto o contraseña incorrecta)
+    # Se lanza en lugar de terminar el proceso, para que quien llama decida como manejarlo (ej: envio masivo)
+    pass
+
 
 def derivar_clave(password, salt):
     # Genera la clave a partir de la contraseña elegida y 16 bytes random, despues es usado para hacer 100k iteraciones de SHA256, y generar la clave de 32 bytes (Propia de AES 256)
-    clave = PBKDF2(
-        password,
-        salt,
-        dkLen=SIZE_CLAVE,
-        count=ITERACIONES
-    )
+    with etapa("kdf", algoritmo="PBKDF2"):
+        clave = PBKDF2(
+            password,
+            salt,
+            dkLen=SIZE_CLAVE,
+            count=ITERACIONES
+        )
     return clave
 
 
-def cifrar_archivo(ruta_archivo, password):
-    """
-    Cifra el archivo con AES-256-CBC y lo guarda con la extension .enc
-    Estructura:
-    [salt (16 bytes)][IV (16 bytes)][datos cifrados]
-    """
-    if os.path.isfile(ruta_archivo) != True:
-        print(f"El archivo '{ruta_archivo}' no existe.")
-        sys.exit(1)
+def derivar_clave_directa(clave_aleatoria, salt):
+    # Cuando la clave ya es aleatoria de 256 bits (ej: la que viaja en el sobre digital), estirarla con PBKDF2 no agrega seguridad
+    # Se usa un unico paso de HKDF-SHA256 con el salt para obtener una clave distinta por archivo
+    with etapa("kdf", algoritmo="HKDF"):
+        return HKDF(clave_aleatoria, SIZE_CLAVE, salt, SHA256)
+
+
+def derivar_clave_modo(password, salt, modo):
+    # Selecciona la funcion de derivacion segun el modo guardado en la cabecera
+    if modo == MODO_CLAVE:
+        return derivar_clave_directa(password, salt)
+    return derivar_clave(password, salt)
+
 
-    # Leer el archivo
-    with open(ruta_archivo, "rb") as f:
-        datos_originales = f.read()
+def crear_cabecera(modo, flags=0):
+    # Construye la cabecera de un archivo .enc versionado
+    return MAGIC_ENC + bytes([VERSION_CBC, modo, flags])
 
-    print(f"Archivo leido: {ruta_archivo} ({len(datos_originales)} bytes)")
+
+def leer_cabecera(entrada):
+    # Lee la cabecera del archivo cifrado y retorna (version, modo, flags, salt, iv)
+    # Si el archivo no empieza con MAGIC_ENC es un archivo del laboratorio 02 (sin cabecera, modo contraseña)
+    # Lanza ValueError si el archivo es muy pequeño o la version no es soportada
+    inicio = entrada.read(len(MAGIC_ENC))
+
+    if inicio == MAGIC_ENC:
+        resto = entrada.read(3)
+        if len(resto) != 3:
+            raise ValueError("Cabecera incompleta.")
+        version, modo, flags = resto
+        if version != VERSION_CBC or modo not in (MODO_PASSWORD, MODO_CLAVE):
+            raise ValueError(f"Version de archivo no soportada: {version}")
+        algoritmo = flags & MASCARA_COMPRESION
+        if flags & ~(MASCARA_COMPRESION | FLAG_AUTENTICADO) or (algoritmo and algoritmo not in NOMBRES_ALGORITMOS):
+            raise ValueError(f"Opciones de archivo no soportadas: {flags:#04x}")
+        salt = entrada.read(SIZE_SALT)
+    else:
+        version, modo, flags = 1, MODO_PASSWORD, 0
+        salt = inicio + entrada.read(SIZE_SALT - len(inicio))
+
+    iv = entrada.read(SIZE_IV)
+    if len(salt) != SIZE_SALT or len(iv) != SIZE_IV:
+        raise ValueError("Archivo corrupto, o muy pequeño para ser valido.")
+
+    return version, modo, flags, salt, iv
+
+
+def version_archivo(ruta_cifrado):
+    # Retorna la version del formato de un archivo cifrado (1 para los archivos sin cabecera del laboratorio 02)
+    with open(ruta_cifrado, "rb") as entrada:
+        inicio = entrada.read(len(MAGIC_ENC) + 1)
+
+    if len(inicio) == len(MAGIC_ENC) + 1 and inicio.startswith(MAGIC_ENC):
+        return inicio[-1]
+    return 1
+
+
+def nombre_descifrado(ruta_cifrado):
+    # Construye la ruta del archivo descifrado: archivo.txt.enc -> archivo_descifrado.txt
+    nombre_base, _ = os.path.splitext(ruta_cifrado)
+    nombre_sin_ext, extension = os.path.splitext(nombre_base)
+    return nombre_sin_ext + "_descifrado" + extension
+
+
+def leer_completo(entrada, buffer):
+    # Llena 'buffer' leyendo de 'entrada' hasta completarlo o llegar al final, sin crear objetos bytes intermedios
+    # Retorna la cantidad de bytes leidos (menor al tamaño del buffer solo al final de la entrada)
+    leidos = 0
+    with memoryview(buffer) as vista:
+        while leidos < len(vista):
+            cantidad = entrada.readinto(vista[leidos:])
+            if not cantidad:
+                break
+            leidos += cantidad
+    return leidos
+
+
+def cifrar_flujo(cifrador, entrada, salida, size_chunk=SIZE_CHUNK):
+    # Cifra en bloques de tamaño fijo lo que se lee de 'entrada' y lo escribe en 'salida'
+    # Solo se aplica padding al ultimo bloque, de esta manera la memoria usada no depende del tamaño del archivo
+    # Los buffers de lectura y de salida se reservan una sola vez y se reutilizan (readinto + output=)
+    # Retorna la cantidad de bytes originales leidos
+    actual, siguiente, cifrado = bytearray(size_chunk), bytearray(size_chunk), bytearray(size_chunk)
+    total = 0
+    leidos = leer_completo(entrada, actual)
+
+    while True:
+        leidos_siguiente = leer_completo(entrada, siguiente)
+        total += leidos
+
+        if not leidos_siguiente:
+            # Ultimo bloque: se cifran los bloques completos y se agrega el padding solo a los bytes restantes
+            completos = leidos - leidos % SIZE_BLOQUE
+            with memoryview(actual) as vista, memoryview(cifrado) as vista_cifrado:
+                cifrador.encrypt(vista[:completos], output=vista_cifrado[:completos])
+                salida.write(vista_cifrado[:completos])
+                salida.write(cifrador.encrypt(pad(bytes(vista[completos:leidos]), SIZE_BLOQUE)))
+            return total
+
+        # Un bloque que no es el ultimo siempre esta completo (size_chunk es multiplo de 16)
+        cifrador.encrypt(actual, output=cifrado)
+        salida.write(cifrado)
+        actual, siguiente = siguiente, actual
+        leidos = leidos_siguiente
+
+
+def descifrar_flujo(descifrador, entrada, salida, size_chunk=SIZE_CHUNK):
+    # Descifra en bloques de tamaño fijo lo que se lee de 'entrada' y lo escribe en 'salida'
+    # El ultimo bloque de 16 bytes se descifra aparte, ya que es el que contiene el padding
+    # Lanza ValueError si el padding no es valido (contraseña incorrecta o archivo corrupto)
+    # Retorna la cantidad de bytes originales escritos
+    actual, siguiente, descifrado = bytearray(size_chunk), bytearray(size_chunk), bytearray(size_chunk)
+    total = 0
+    leidos = leer_completo(entrada, actual)
+
+    while True:
+        leidos_siguiente = leer_completo(entrada, siguiente)
+
+        if not leidos_siguiente:
+            break
+
+        descifrador.decrypt(actual, output=descifrado)
+        salida.write(descifrado)
+        total += size_chunk
+        actual, siguiente = siguiente, actual
+        leidos = leidos_siguiente
+
+    if leidos < SIZE_BLOQUE or leidos % SIZE_BLOQUE:
+        raise ValueError("Tamaño de los datos cifrados invalido.")
+
+    # Ultimo bloque de lectura: todo menos los ultimos 16 bytes se descifra directo, y luego se remueve el padding
+    completos = leidos - SIZE_BLOQUE
+    with memoryview(actual) as vista, memoryview(descifrado) as vista_descifrado:
+        descifrador.decrypt(vista[:completos], output=vista_descifrado[:completos])
+        ultimo = unpad(descifrador.decrypt(vista[completos:leidos]), SIZE_BLOQUE)
+        salida.write(vista_descifrado[:completos])
+    salida.write(ultimo)
+
+    return total + completos + len(ultimo)
+
+
+def cifrar_mapeado(cifrador, entrada, salida, size_chunk=SIZE_CHUNK_MMAP):
+    # Cifra el archivo 'entrada' mapeandolo en memoria, y escribe directo en 'salida' tambien mapeada en memoria
+    # 'salida' debe estar abierta en modo "w+b" y posicionada despues de la cabecera; el archivo de entrada no puede estar vacio
+    # No se crean copias de los datos: AES lee de la vista de la entrada y escribe en la vista de la salida (output=)
+    # Retorna la cantidad de bytes originales leidos
+    with mmap.mmap(entrada.fileno(), 0, access=mmap.ACCESS_READ) as mapa_entrada:
+        size_original = len(mapa_entrada)
+        completos = size_original - size_original % SIZE_BLOQUE
+        inicio = salida.tell()
+
+        # Reservar el tamaño final: los bloques completos mas el ultimo bloque con padding
+        salida.truncate(inicio + completos + SIZE_BLOQUE)
+
+        with mmap.mmap(salida.fileno(), 0) as mapa_salida:
+            with memoryview(mapa_entrada) as vista, memoryview(mapa_salida) as vista_salida:
+                for posicion in range(0, completos, size_chunk):
+                    fin = min(posicion + size_chunk, completos)
+                    cifrador.encrypt(vista[posicion:fin], output=vista_salida[inicio + posicion:inicio + fin])
+
+                vista_salida[inicio + completos:] = cifrador.encrypt(pad(bytes(vista[completos:]), SIZE_BLOQUE))
+
+    salida.seek(0, os.SEEK_END)
+    return size_original
+
+
+def descifrar_mapeado(descifrador, entrada, salida, size_chunk=SIZE_CHUNK_MMAP):
+    # Descifra desde la posicion actual de 'entrada' hasta el final mapeando ambos archivos en memoria
+    # 'salida' debe estar abierta en modo "w+b". Lanza ValueError si el tamaño o el padding no son validos
+    # Retorna la cantidad de bytes originales escritos
+    inicio = entrada.tell()
+
+    with mmap.mmap(entrada.fileno(), 0, access=mmap.ACCESS_READ) as mapa_entrada:
+        size_cifrado = len(mapa_entrada) - inicio
+        if size_cifrado < SIZE_BLOQUE or size_cifrado % SIZE_BLOQUE:
+            raise ValueError("Tamaño de los datos cifrados invalido.")
+
+        completos = size_cifrado - SIZE_BLOQUE
+
+        with memoryview(mapa_entrada) as vista:
+            if completos:
+                salida.truncate(completos)
+                with mmap.mmap(salida.fileno(), 0) as mapa_salida, memoryview(mapa_salida) as vista_salida:
+                    for posicion in range(0, completos, size_chunk):
+                        fin = min(posicion + size_chunk, completos)
+                        descifrador.decrypt(vista[inicio + posicion:inicio + fin], output=vista_salida[posicion:fin])
+
+            ultimo = unpad(descifrador.decrypt(vista[inicio + completos:]), SIZE_BLOQUE)
+
+    salida.seek(completos)
+    salida.write(ultimo)
+    return completos + len(ultimo)
+
+
+def escribir_cifrado(entrada, salida, password, modo=MODO_PASSWORD, mapeado=False, compresion=None, autenticado=False):
+    # Escribe en 'salida', desde su posicion actual, el formato .enc completo de los datos de 'entrada':
+    # cabecera (con MODO_CLAVE o con compresion), salt, IV y datos cifrados
+    # Permite cifrar dentro de otro archivo (ej: el contenedor del sobre digital) en una sola pasada
+    # Con mapeado=True 'salida' debe estar abierta en modo "w+b" y la entrada no puede estar vacia
+    # Con compresion ("zlib", "lzma" o "bz2") los datos se comprimen antes de cifrar, salvo que la muestra
+    # del inicio muestre que no son comprimibles. Lanza ErrorCifrado si el algoritmo no es soportado
+    # Con autenticado=True se agrega el MAC de la cabecera y un tag por cada registro de datos cifrados
+    # Retorna la cantidad de bytes originales cifrados
+
+    try:
+        algoritmo = identificador_algoritmo(compresion)
+    except ValueError as error:
+        raise ErrorCifrado(str(error))
+
+    # Bypass adaptativo: si la muestra no se comprime, el archivo se cifra tal cual
+    # La muestra ya leida se entrega al cifrador antes que el resto de la entrada, sin volver a leerla
+    if algoritmo != SIN_COMPRESION:
+        muestra = entrada.read(SIZE_MUESTRA)
+        if not es_comprimible(muestra):
+            mostrar("  Datos poco comprimibles, se cifran sin compresion")
+            algoritmo = SIN_COMPRESION
+        entrada = LectorComprimido(entrada, crear_compresor(algoritmo) if algoritmo else None, muestra)
+        mapeado = False
 
     # Generar salt aleatorio
     salt = get_random_bytes(SIZE_SALT)
 
-    # Derivar clave con PBKDF2
-    clave = derivar_clave(password, salt)
+    # Derivar clave con PBKDF2 (o HKDF si la clave ya es aleatoria)
+    clave = derivar_clave_modo(password, salt, modo)
 
     # Generar IV 
     iv = get_random_bytes(SIZE_IV)
@@ -76,66 +316,208 @@ def cifrar_archivo(ruta_archivo, password):
     # Inicializar el cifrador AES en modo CBC (Por lo cual requerie el IV)
     cifrador = AES.new(clave, AES.MODE_CBC, iv)
 
-    # Aplicar padding y cifrar
-    datos_con_padding = pad(datos_originales, SIZE_BLOQUE)
-    datos_cifrados = cifrador.encrypt(datos_con_padding)
+    flags = algoritmo | (FLAG_AUTENTICADO if autenticado else 0)
+    cabecera = crear_cabecera(modo, flags) if modo != MODO_PASSWORD or flags else b""
+
+    with etapa("aes_cifrar", formato="CBC", compresion=NOMBRES_ALGORITMOS.get(algoritmo), autenticado=autenticado) as medicion:
+        salida.write(cabecera)
+        salida.write(salt)
+        salida.write(iv)
+
+        # Formato autenticado: el MAC de la cabecera va antes de los datos, y los datos cifrados pasan por
+        # el escritor que los separa en registros con tag (no se puede escribir directo en la salida mapeada)
+        if autenticado:
+            clave_mac = derivar_clave_mac(clave, salt)
+            salida.write(mac_cabecera(clave_mac, cabecera + salt + iv))
+            salida = EscritorAutenticado(salida, clave_mac)
+            mapeado = False
+
+        if mapeado:
+            salida.flush()
+            medicion["bytes"] = cifrar_mapeado(cifrador, entrada, salida)
+        elif isinstance(entrada, LectorComprimido):
+            medicion["bytes_cifrados"] = cifrar_flujo(cifrador, entrada, salida)
+            medicion["bytes"] = entrada.leidos
+        else:
+            medicion["bytes"] = cifrar_flujo(cifrador, entrada, salida)
+
+        if autenticado:
+            salida.cerrar()
+
+    return medicion["bytes"]
+
+
+def preparar_lectura(entrada, password, requerir_autenticado=False):
+    # Lee la cabecera del formato .enc (version 1 o 2) que empieza en la posicion actual de 'entrada' y deriva la clave
+    # En el formato autenticado verifica el MAC de la cabecera y el ultimo registro (si 'entrada' permite seek), asi
+    # una contraseña incorrecta, una cabecera modificada o un archivo truncado se detectan antes de crear la salida
+    # Con requerir_autenticado=True un archivo sin el formato autenticado se rechaza antes de descifrar nada
+    # Lanza ErrorCifrado si la cabecera no es valida o no se pudo verificar
+    # Retorna (entrada, descifrador, algoritmo, autenticado) para descifrar_preparado()
+
+    # Sacar cabecera (si existe), salt e IV, el resto del archivo se lee por bloques
+    try:
+        _, modo, flags, salt, iv = leer_cabecera(entrada)
+    except ValueError as error:
+        raise ErrorCifrado(str(error))
+    algoritmo = flags & MASCARA_COMPRESION
+    autenticado = bool(flags & FLAG_AUTENTICADO)
+    if requerir_autenticado and not autenticado:
+        raise ErrorCifrado("El archivo no usa el formato autenticado, que es obligatorio en este caso.")
+
+    # Derivar la misma clave usando la contraseña + salt extraido, con el modo indicado en la cabecera
+    clave = derivar_clave_modo(password, salt, modo)
+
+    # Formato autenticado: verificar el MAC de la cabecera y el ultimo registro antes de descifrar los datos
+    if autenticado:
+        clave_mac = derivar_clave_mac(clave, salt)
+        try:
+            verificar_cabecera(clave_mac, crear_cabecera(modo, flags) + salt + iv, entrada.read(SIZE_MAC_CABECERA))
+            if entrada.seekable():
+                verificar_ultimo_registro(entrada, clave_mac)
+            entrada = LectorAutenticado(entrada, clave_mac)
+        except ErrorAutenticacion as error:
+            raise ErrorCifrado(str(error))
+
+    # Crear descifrador AES en modo CBC con la misma clave y IV
+    return entrada, AES.new(clave, AES.MODE_CBC, iv), algoritmo, autenticado
+
+
+def descifrar_preparado(preparado, salida, mapeado=False):
+    # Descifra los datos de un archivo ya preparado con preparar_lectura() y los escribe en 'salida'
+    # Con mapeado=True 'salida' debe estar abierta en modo "w+b"
+    # Lanza ErrorCifrado al llegar a un bloque modificado (formato autenticado), y ValueError si el padding no es
+    # valido (contraseña incorrecta o archivo corrupto). Retorna la cantidad de bytes originales escritos
+    entrada, descifrador, algoritmo, autenticado = preparado
+
+    # Los registros autenticados se verifican uno a uno mientras se descifran, por lo que no se puede usar mmap
+    mapeado = mapeado and not autenticado
+
+    # Descifrar por bloques y remover padding del ultimo bloque
+    # Si el archivo fue comprimido, lo descifrado se descomprime por bloques antes de escribirse en 'salida'
+    with etapa("aes_descifrar", formato="CBC", compresion=NOMBRES_ALGORITMOS.get(algoritmo), autenticado=autenticado) as medicion:
+        try:
+            if algoritmo != SIN_COMPRESION:
+                escritor = EscritorDescomprimido(salida, algoritmo)
+                medicion["bytes_cifrados"] = descifrar_flujo(descifrador, entrada, escritor)
+                medicion["bytes"] = escritor.cerrar()
+            elif mapeado:
+                medicion["bytes"] = descifrar_mapeado(descifrador, entrada, salida)
+            else:
+                medicion["bytes"] = descifrar_flujo(descifrador, entrada, salida)
+        except ErrorAutenticacion as error:
+            raise ErrorCifrado(str(error))
+
+    return medicion["bytes"]
+
+
+def leer_cifrado(entrada, salida, password, mapeado=False, requerir_autenticado=False):
+    # Descifra el formato .enc (version 1 o 2) que empieza en la posicion actual de 'entrada' y lo escribe en 'salida'
+    # Con mapeado=True 'salida' debe estar abierta en modo "w+b"
+    # Lanza ErrorCifrado si la cabecera no es valida, y ValueError si el padding no es valido (contraseña incorrecta o archivo corrupto)
+    # En el formato autenticado lanza ErrorCifrado antes de escribir nada si la contraseña es incorrecta, la cabecera
+    # fue modificada o el archivo esta truncado (si 'entrada' permite seek), y al llegar a un bloque modificado
+    # Con requerir_autenticado=True se rechaza un archivo sin el formato autenticado (ver preparar_lectura)
+    # Retorna la cantidad de bytes originales escritos
+    return descifrar_preparado(preparar_lectura(entrada, password, requerir_autenticado), salida, mapeado)
+
+
+def cifrar_stream(entrada, salida, password, modo=MODO_PASSWORD, compresion=None, autenticado=False):
+    # Cifra lo que se lee de 'entrada' y escribe el formato .enc en 'salida', ambos objetos tipo archivo binario
+    # (stdin/stdout, sockets, pipes, io.BytesIO...). No se usan archivos temporales ni se requiere seek
+    # Lanza ErrorCifrado si hubo un error. Retorna la cantidad de bytes originales cifrados
+    return escribir_cifrado(entrada, salida, password, modo, False, compresion, autenticado)
+
+
+def descifrar_stream(entrada, salida, password, requerir_autenticado=False):
+    # Descifra el formato .enc que se lee de 'entrada' y escribe los datos originales en 'salida'
+    # Si la entrada no permite seek (ej: un pipe) el truncamiento del formato autenticado se detecta al llegar al final
+    # Con requerir_autenticado=True se rechazan los datos sin el formato autenticado (ej: recibidos por la red)
+    # Lanza ErrorCifrado si la contraseña es incorrecta o los datos estan corruptos. Retorna los bytes escritos
+    try:
+        return leer_cifrado(entrada, salida, password, requerir_autenticado=requerir_autenticado)
+    except ValueError:
+        raise ErrorCifrado("Contraseña incorrecta o archivo corrupto.")
+
+
+def cifrar_archivo(ruta_archivo, password, modo=MODO_PASSWORD, mapeado=None, compresion=None, autenticado=False):
+    """
+    Cifra el archivo con AES-256-CBC y lo guarda con la extension .enc
+    Estructura:
+    [salt (16 bytes)][IV (16 bytes)][datos cifrados]
+    Con modo=MODO_CLAVE (clave aleatoria de 256 bits) se antepone la cabecera versionada y se usa HKDF en lugar de PBKDF2.
+    El archivo se procesa por bloques de SIZE_CHUNK bytes, sin cargarlo completo en memoria.
+    Con mapeado=True (por defecto para archivos desde UMBRAL_MMAP) la entrada y la salida se mapean en memoria.
+    Con compresion ("zlib", "lzma" o "bz2") los datos se comprimen antes de cifrar y el algoritmo queda en la cabecera.
+    Con autenticado=True se agrega un MAC de la cabecera y un tag HMAC por bloque (ver authenticated_stream.py).
+    """
+    if os.path.isfile(ruta_archivo) != True:
+        raise ErrorCifrado(f"El archivo '{ruta_archivo}' no existe.")
+
+    # Validar el algoritmo de compresion antes de crear el archivo de salida
+    try:
+        identificador_algoritmo(compresion)
+    except ValueError as error:
+        raise ErrorCifrado(str(error))
 
-    # Guardar archivo cifrado
+    size_original = os.path.getsize(ruta_archivo)
+    mostrar(f"Archivo leido: {ruta_archivo} ({size_original} bytes)")
+
+    # Un archivo vacio no se puede mapear en memoria
+    if mapeado is None:
+        mapeado = size_original >= UMBRAL_MMAP
+    mapeado = mapeado and size_original > 0
+
+    # Cifrar por bloques y guardar el archivo cifrado
     ruta_cifrado = ruta_archivo + ENC
-    with open(ruta_cifrado, "wb") as f:
-        f.write(salt)
-        f.write(iv)
-        f.write(datos_cifrados)
+    with open(ruta_archivo, "rb") as entrada, open(ruta_cifrado, "w+b" if mapeado else "wb") as salida:
+        escribir_cifrado(entrada, salida, password, modo, mapeado, compresion, autenticado)
 
     size_final = os.path.getsize(ruta_cifrado)
-    print(f"Archivo cifrado: {ruta_cifrado} ({size_final} bytes)")
+    mostrar(f"Archivo cifrado: {ruta_cifrado} ({size_final} bytes)")
 
     return ruta_cifrado
 
 
-def descifrar_archivo(ruta_cifrado, password):
+def descifrar_archivo(ruta_cifrado, password, mapeado=None):
+    # Descifra un archivo .enc de cualquier version y lo guarda como <nombre>_descifrado<ext>
+    # Con mapeado=True (por defecto para archivos desde UMBRAL_MMAP) la entrada y la salida se mapean en memoria
     if os.path.isfile(ruta_cifrado) != True:
-        print(f"El archivo '{ruta_cifrado}' no existe.")
-        sys.exit(1)
+        raise ErrorCifrado(f"El archivo '{ruta_cifrado}' no existe.")
 
-    # Leer archivo cifrado
-    with open(ruta_cifrado, "rb") as f:
-        contenido = f.read()
+    size_cifrado = os.path.getsize(ruta_cifrado)
 
-    if len(contenido) < SIZE_SALT + SIZE_IV:
-        print("Archivo corrupto, o muy pequeño para ser valido.")
-        sys.exit(1)
+    if size_cifrado < SIZE_SALT + SIZE_IV:
+        raise ErrorCifrado("Archivo corrupto, o muy pequeño para ser valido.")
 
-    # Sacar salt, IV y datos cifrados
-    salt = contenido[:SIZE_SALT] # De 0 a 16 bytes lee el salt
-    iv = contenido[SIZE_SALT:SIZE_SALT + SIZE_IV] # De 16 a 32 bytes lee el IV
-    datos_cifrados = contenido[SIZE_SALT + SIZE_IV:] # El resto es el contenido del archivo cifrado
+    # Los archivos segmentados (AES-GCM) se descifran con su propio modulo
+    if version_archivo(ruta_cifrado) == VERSION_SEGMENTADO:
+        from segmented_encryptor import descifrar_archivo_segmentado
+        return descifrar_archivo_segmentado(ruta_cifrado, password)
 
-    print(f"Archivo cifrado leido: {ruta_cifrado} ({len(contenido)} bytes)")
-
-    # Derivar la misma clave usando la contraseña + salt extraido
-    clave = derivar_clave(password, salt)
-
-    # Crear descifrador AES en modo CBC con la misma clave y IV
-    descifrador = AES.new(clave, AES.MODE_CBC, iv)
+    mostrar(f"Archivo cifrado leido: {ruta_cifrado} ({size_cifrado} bytes)")
 
-    # Descifrar y remover padding
-    try:
-        datos_con_padding = descifrador.decrypt(datos_cifrados)
-        datos_originales = unpad(datos_con_padding, SIZE_BLOQUE)
-    except ValueError:
-        print("Contraseña incorrecta o archivo corrupto.")
-        sys.exit(1)
+    ruta_descifrado = nombre_descifrado(ruta_cifrado)
 
-    # Guardar archivo descifrado
-    nombre_base, _ = os.path.splitext(ruta_cifrado)
-    nombre_sin_ext, extension = os.path.splitext(nombre_base)
-    ruta_descifrado = nombre_sin_ext + "_descifrado" + extension
+    if mapeado is None:
+        mapeado = size_cifrado >= UMBRAL_MMAP
 
-    with open(ruta_descifrado, "wb") as f:
-        f.write(datos_originales)
+    # La cabecera se verifica antes de crear la salida, y se descifra en un temporal que reemplaza al archivo
+    # descifrado solo al terminar: un error nunca deja un archivo a medias ni borra uno descifrado antes
+    temporal = ruta_descifrado + ".tmp"
+    with open(ruta_cifrado, "rb") as entrada:
+        preparado = preparar_lectura(entrada, password)
+        try:
+            with open(temporal, "w+b" if mapeado else "wb") as salida:
+                size_descifrado = descifrar_preparado(preparado, salida, mapeado)
+            os.replace(temporal, ruta_descifrado)
+        except ValueError:
+            raise ErrorCifrado("Contraseña incorrecta o archivo corrupto.")
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
 
-    print(f"Archivo descifrado: {ruta_descifrado} ({len(datos_originales)} bytes)")
+    mostrar(f"Archivo descifrado: {ruta_descifrado} ({size_descifrado} bytes)")
 
     return ruta_descifrado
 
@@ -178,4 +560,8 @@ def menu():
 
 
 if __name__ == "__main__":
-    menu()
+    try:
+        menu()
+    except ErrorCifrado as error:
+        print(error)
+        sys.exit(1)
@@ -0,0 +1,187 @@
+"""
+Autenticacion por Bloques - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+AES-CBC por si solo no detecta modificaciones: una contraseña incorrecta o un archivo corrupto solo se notan al
+quitar el padding, despues de descifrar el archivo completo, y algunos cambios ni siquiera se detectan.
+Este modulo agrega autenticacion (encrypt-then-MAC con HMAC-SHA256) al formato .enc en flujo:
+
+'MAC de cabecera': Se guarda despues de la cabecera, el salt y el IV. Se verifica antes de descifrar cualquier dato,
+por lo que una contraseña incorrecta o una cabecera modificada se rechazan de inmediato.
+'Tags por bloque': Los datos cifrados se dividen en registros de SIZE_REGISTRO bytes, cada uno seguido de un tag de
+16 bytes que autentica su numero, si es el ultimo y su contenido. Se verifican a medida que se descifra, antes de
+entregar los datos, asi un bloque modificado, reordenado o eliminado se detecta al llegar a el.
+'Truncamiento': Solo el ultimo registro se autentica como final. Si la entrada permite seek, el ultimo registro se
+verifica antes de empezar a descifrar, asi una transferencia incompleta se detecta sin procesar el archivo.
+
+[cabecera .enc][salt][IV][MAC cabecera (32 bytes)] N veces: [datos cifrados (SIZE_REGISTRO bytes)][tag (16 bytes)]
+
+La clave del MAC se deriva de la clave AES con HKDF, por lo que no se necesita otra contraseña.
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import io
+import os
+import hmac
+import struct
+import hashlib
+
+from Crypto.Protocol.KDF import HKDF
+from Crypto.Hash import SHA256
+
+
+# Constantes
+SIZE_CLAVE_MAC = 32
+SIZE_MAC_CABECERA = 32
+SIZE_TAG = 16
+SIZE_REGISTRO = 64 * 1024     # Bytes cifrados por registro (cada uno lleva su propio tag)
+CONTEXTO_MAC = b"AESFILE mac"
+
+
+class ErrorAutenticacion(ValueError):
+    # Un registro o la cabecera no son autenticos (contraseña incorrecta, datos modificados o archivo truncado)
+    pass
+
+
+def derivar_clave_mac(clave, salt):
+    # Deriva la clave del HMAC a partir de la clave AES, distinta para cada archivo gracias al salt
+    return HKDF(clave, SIZE_CLAVE_MAC, salt, SHA256, context=CONTEXTO_MAC)
+
+
+def mac_cabecera(clave_mac, cabecera):
+    # MAC completo (32 bytes) de la cabecera, el salt y el IV
+    return hmac.digest(clave_mac, cabecera, "sha256")
+
+
+def tag_registro(clave_mac, indice, final, datos):
+    # Tag de un registro: HMAC-SHA256 de [indice (8 bytes)][final (1 byte)][datos], truncado a 16 bytes
+    calculo = hmac.new(clave_mac, struct.pack(">QB", indice, final), hashlib.sha256)
+    calculo.update(datos)
+    return calculo.digest()[:SIZE_TAG]
+
+
+def verificar_cabecera(clave_mac, cabecera, mac):
+    # Lanza ErrorAutenticacion si el MAC de la cabecera no corresponde
+    if len(mac) != SIZE_MAC_CABECERA or not hmac.compare_digest(mac_cabecera(clave_mac, cabecera), mac):
+        raise ErrorAutenticacion("Contraseña incorrecta o cabecera modificada.")
+
+
+def verificar_ultimo_registro(entrada, clave_mac, size_registro=SIZE_REGISTRO):
+    # Verifica el ultimo registro de 'entrada' (desde su posicion actual hasta el final) sin leer el resto
+    # Detecta de inmediato un archivo truncado, ya que solo el ultimo registro original se autentica como final
+    # Al terminar 'entrada' vuelve a su posicion inicial
+    inicio = entrada.tell()
+    total = entrada.seek(0, os.SEEK_END) - inicio
+    size_completo = size_registro + SIZE_TAG
+
+    # El ultimo registro nunca esta vacio: mide entre 1 y size_registro bytes de datos mas el tag
+    completos, resto = divmod(total, size_completo)
+    if resto:
+        indice, largo = completos, resto
+    else:
+        indice, largo = completos - 1, size_completo
+
+    try:
+        if total == 0 or largo <= SIZE_TAG:
+            raise ErrorAutenticacion("Archivo truncado.")
+
+        entrada.seek(inicio + total - largo)
+        registro = entrada.read(largo)
+        if not hmac.compare_digest(tag_registro(clave_mac, indice, 1, registro[:-SIZE_TAG]), registro[-SIZE_TAG:]):
+            raise ErrorAutenticacion("Archivo truncado o modificado (el ultimo bloque no es autentico).")
+    finally:
+        entrada.seek(inicio)
+
+
+class EscritorAutenticado:
+    # Envuelve un archivo de salida: lo que se escribe (datos cifrados) se agrupa en registros y a cada uno
+    # se le agrega su tag. cerrar() escribe el ultimo registro, marcado como final
+    # Un registro solo se escribe cuando ya hay datos para el siguiente, asi el registro final nunca queda vacio
+
+    def __init__(self, salida, clave_mac, size_registro=SIZE_REGISTRO):
+        self._salida = salida
+        self._clave_mac = clave_mac
+        self._size_registro = size_registro
+        self._pendiente = bytearray()
+        self._indice = 0
+
+    def write(self, datos):
+        self._pendiente += datos
+        while len(self._pendiente) > self._size_registro:
+            self._escribir_registro(self._size_registro, final=0)
+        return len(datos)
+
+    def _escribir_registro(self, largo, final):
+        with memoryview(self._pendiente) as vista:
+            self._salida.write(vista[:largo])
+            self._salida.write(tag_registro(self._clave_mac, self._indice, final, vista[:largo]))
+        del self._pendiente[:largo]
+        self._indice += 1
+
+    def cerrar(self):
+        self._escribir_registro(len(self._pendiente), final=1)
+
+
+class LectorAutenticado(io.RawIOBase):
+    # Envuelve un archivo de entrada: verifica el tag de cada registro y entrega solo los datos autenticos
+    # mediante readinto(), de manera que descifrar_flujo() no necesita cambios
+    # Se lee un registro por adelantado para saber cual es el ultimo. Lanza ErrorAutenticacion si un registro
+    # no es autentico o la entrada termina sin un registro final (archivo truncado)
+
+    def __init__(self, entrada, clave_mac, size_registro=SIZE_REGISTRO):
+        self._entrada = entrada
+        self._clave_mac = clave_mac
+        self._size_completo = size_registro + SIZE_TAG
+        self._indice = 0
+        self._datos = b""
+        self._posicion = 0
+        self._siguiente = self._leer_registro()
+        if not self._siguiente:
+            raise ErrorAutenticacion("Archivo truncado.")
+
+    def readable(self):
+        return True
+
+    def _leer_registro(self):
+        # Lee un registro completo (o lo que quede hasta el final de la entrada)
+        partes = []
+        faltan = self._size_completo
+        while faltan:
+            parte = self._entrada.read(faltan)
+            if not parte:
+                break
+            partes.append(parte)
+            faltan -= len(parte)
+        return b"".join(partes)
+
+    def _avanzar(self):
+        # Verifica el siguiente registro y lo deja disponible para readinto()
+        registro = self._siguiente
+        self._siguiente = self._leer_registro()
+        final = 0 if self._siguiente else 1
+
+        if len(registro) <= SIZE_TAG:
+            raise ErrorAutenticacion("Archivo truncado.")
+
+        datos, tag = registro[:-SIZE_TAG], registro[-SIZE_TAG:]
+        if not hmac.compare_digest(tag_registro(self._clave_mac, self._indice, final, datos), tag):
+            raise ErrorAutenticacion(f"Bloque {self._indice} corrupto, modificado o archivo truncado.")
+
+        self._indice += 1
+        self._datos = datos
+        self._posicion = 0
+
+    def readinto(self, buffer):
+        if self._posicion == len(self._datos):
+            if not self._siguiente:
+                return 0
+            self._avanzar()
+
+        cantidad = min(len(buffer), len(self._datos) - self._posicion)
+        buffer[:cantidad] = self._datos[self._posicion:self._posicion + cantidad]
+        self._posicion += cantidad
+        return cantidad
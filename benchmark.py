@@ -0,0 +1,297 @@
+"""
+Benchmark del Sobre Digital - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+Este modulo mide por separado el rendimiento de cada etapa del sobre digital:
+derivacion de clave (PBKDF2 y HKDF), cifrado/descifrado AES con distintos tamaños de archivo,
+cifrado/descifrado RSA-OAEP, carga y generacion de claves, y el envio/recepcion completos.
+
+Por cada etapa se reporta la latencia (percentiles p50, p90 y p99), el throughput (MB/s u operaciones/s)
+y la memoria maxima usada por el proceso (RSS). Los resultados se pueden guardar en JSON y compararse con
+una ejecucion anterior para detectar regresiones antes de actualizar.
+
+Uso:
+    python benchmark.py --tamanos 1K,1M,64M --salida resultados.json
+    python benchmark.py --comparar resultados_anteriores.json
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime
+
+try:
+    import resource     # Solo disponible en sistemas tipo Unix, se usa para medir la memoria maxima (RSS)
+except ImportError:
+    resource = None
+
+import rsa_key_manager
+from aes_file_encryptor import (
+    derivar_clave, derivar_clave_directa, cifrar_archivo, descifrar_archivo, MODO_CLAVE, SIZE_SALT,
+)
+from segmented_encryptor import cifrar_archivo_segmentado
+from rsa_key_manager import generar_par_claves, cargar_clave_publica, cargar_clave_privada, limpiar_cache_claves
+from rsa_cipher import cifrar_con_rsa, descifrar_con_rsa
+from digital_envelope_sender import crear_sobre_digital
+from digital_envelope_receiver import abrir_sobre_digital
+from metrics import silencioso, es_silencioso
+
+from Crypto.Random import get_random_bytes
+
+
+# Constantes
+TAMANOS_DEFECTO = "1K,64K,1M,16M,64M"
+REPETICIONES_DEFECTO = 20
+BYTES_POR_REPETICION = 256 * 1024 * 1024   # Con archivos grandes se reducen las repeticiones para no procesar mas de esto por etapa
+TOLERANCIA_DEFECTO = 0.10                   # Una etapa es regresion si su p50 empeora mas de un 10%
+UNIDADES = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def leer_tamano(texto):
+    # Convierte "64K", "16M" o "2G" a bytes
+    texto = texto.strip().upper()
+    if texto and texto[-1] in UNIDADES:
+        return int(float(texto[:-1]) * UNIDADES[texto[-1]])
+    return int(texto)
+
+
+def nombre_tamano(size):
+    # Convierte un tamaño en bytes a texto corto (ej: 1048576 -> "1M")
+    for sufijo, factor in sorted(UNIDADES.items(), key=lambda item: -item[1]):
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{sufijo}"
+    return str(size)
+
+
+def rss_maximo_mb():
+    # Memoria maxima usada por el proceso hasta ahora, en MB (None si no se puede medir en esta plataforma)
+    if resource is None:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB y macOS bytes
+    return maximo / (1024 * 1024) if sys.platform == "darwin" else maximo / 1024
+
+
+def percentil(valores_ordenados, porcentaje):
+    # Percentil con interpolacion lineal sobre una lista ya ordenada
+    if len(valores_ordenados) == 1:
+        return valores_ordenados[0]
+    posicion = (len(valores_ordenados) - 1) * porcentaje / 100
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(valores_ordenados) - 1)
+    return valores_ordenados[inferior] + (valores_ordenados[superior] - valores_ordenados[inferior]) * (posicion - inferior)
+
+
+def medir(funcion, repeticiones, preparar=None):
+    # Ejecuta 'funcion' varias veces y retorna la lista de duraciones en segundos
+    # 'preparar' se ejecuta antes de cada repeticion, fuera de la medicion
+    # Los mensajes de progreso se desactivan (modo silencioso) y el resto de la salida se descarta para no afectar los tiempos
+    tiempos = []
+    estado_anterior = es_silencioso()
+    silencioso(True)
+    try:
+        for _ in range(repeticiones):
+            if preparar is not None:
+                preparar()
+            with redirect_stdout(io.StringIO()):
+                inicio = time.perf_counter()
+                funcion()
+                tiempos.append(time.perf_counter() - inicio)
+    finally:
+        silencioso(estado_anterior)
+    return tiempos
+
+
+def resumir(etapa, tiempos, bytes_por_operacion=None, **extra):
+    # Construye el resultado de una etapa: percentiles de latencia, throughput y memoria maxima
+    ordenados = sorted(tiempos)
+    total = sum(tiempos)
+    resultado = {
+        "etapa": etapa,
+        "repeticiones": len(tiempos),
+        "latencia_ms": {
+            "min": ordenados[0] * 1000,
+            "p50": percentil(ordenados, 50) * 1000,
+            "p90": percentil(ordenados, 90) * 1000,
+            "p99": percentil(ordenados, 99) * 1000,
+            "max": ordenados[-1] * 1000,
+            "media": total / len(tiempos) * 1000,
+        },
+        "ops_por_segundo": len(tiempos) / total if total > 0 else None,
+        "rss_maximo_mb": rss_maximo_mb(),
+    }
+    if bytes_por_operacion is not None:
+        resultado["bytes"] = bytes_por_operacion
+        resultado["mb_por_segundo"] = bytes_por_operacion * len(tiempos) / (1024 * 1024) / total if total > 0 else None
+    resultado.update(extra)
+    return resultado
+
+
+def crear_archivo_aleatorio(ruta, size, size_bloque=1024 * 1024):
+    # Crea un archivo de datos aleatorios escribiendolo por bloques, sin cargarlo completo en memoria
+    with open(ruta, "wb") as archivo:
+        restante = size
+        while restante > 0:
+            bloque = get_random_bytes(min(size_bloque, restante))
+            archivo.write(bloque)
+            restante -= len(bloque)
+
+
+def repeticiones_para(size, repeticiones):
+    # Con archivos grandes se hacen menos repeticiones (al menos una)
+    return max(1, min(repeticiones, BYTES_POR_REPETICION // max(size, 1)))
+
+
+def ejecutar_benchmark(tamanos, repeticiones=REPETICIONES_DEFECTO, repeticiones_generacion=3, mostrar=print):
+    # Ejecuta todas las etapas y retorna un diccionario con la informacion del sistema y los resultados
+    # 'mostrar' recibe una linea de texto por cada etapa terminada
+    resultados = []
+
+    def registrar(resultado):
+        resultados.append(resultado)
+        linea = f"  {resultado['etapa']:<40} p50 {resultado['latencia_ms']['p50']:10.3f} ms"
+        if resultado.get("mb_por_segundo") is not None:
+            linea += f"  {resultado['mb_por_segundo']:10.2f} MB/s"
+        else:
+            linea += f"  {resultado['ops_por_segundo']:10.1f} ops/s"
+        mostrar(linea)
+
+    directorio = tempfile.mkdtemp(prefix="benchmark_sobre_")
+    keys_dir_original = rsa_key_manager.KEYS_DIR
+    rsa_key_manager.KEYS_DIR = os.path.join(directorio, "keys")
+
+    try:
+        # Derivacion de clave
+        salt = get_random_bytes(SIZE_SALT)
+        registrar(resumir("derivar_clave (PBKDF2)", medir(lambda: derivar_clave(b"password", salt), min(repeticiones, 10))))
+        registrar(resumir("derivar_clave_directa (HKDF)", medir(lambda: derivar_clave_directa(get_random_bytes(32), salt), repeticiones)))
+
+        # Generacion y carga de claves
+        registrar(resumir("generar_par_claves", medir(lambda: generar_par_claves("benchmark"), repeticiones_generacion)))
+        ruta_privada = os.path.join(rsa_key_manager.KEYS_DIR, "benchmark_private.pem")
+        ruta_publica = os.path.join(rsa_key_manager.KEYS_DIR, "benchmark_public.pem")
+
+        registrar(resumir("cargar_clave_publica (sin cache)", medir(lambda: cargar_clave_publica(ruta_publica), repeticiones, limpiar_cache_claves)))
+        registrar(resumir("cargar_clave_privada (sin cache)", medir(lambda: cargar_clave_privada(ruta_privada), repeticiones, limpiar_cache_claves)))
+        registrar(resumir("cargar_clave_privada (con cache)", medir(lambda: cargar_clave_privada(ruta_privada), repeticiones)))
+
+        # RSA-OAEP
+        with redirect_stdout(io.StringIO()):
+            clave_publica = cargar_clave_publica(ruta_publica)
+            clave_privada = cargar_clave_privada(ruta_privada)
+        clave_aes = get_random_bytes(32)
+        clave_cifrada = cifrar_con_rsa(clave_aes, clave_publica)
+        registrar(resumir("cifrar_con_rsa", medir(lambda: cifrar_con_rsa(clave_aes, clave_publica), repeticiones)))
+        registrar(resumir("descifrar_con_rsa", medir(lambda: descifrar_con_rsa(clave_cifrada, clave_privada), repeticiones)))
+
+        # AES y sobre digital completo, por tamaño de archivo
+        for size in tamanos:
+            nombre = nombre_tamano(size)
+            ruta = os.path.join(directorio, f"datos_{nombre}.bin")
+            crear_archivo_aleatorio(ruta, size)
+            veces = repeticiones_para(size, repeticiones)
+
+            registrar(resumir(f"cifrar_archivo CBC {nombre}", medir(lambda: cifrar_archivo(ruta, clave_aes, modo=MODO_CLAVE), veces), size))
+            registrar(resumir(f"descifrar_archivo CBC {nombre}", medir(lambda: descifrar_archivo(ruta + ".enc", clave_aes), veces), size))
+
+            registrar(resumir(f"cifrar_archivo GCM segmentado {nombre}", medir(lambda: cifrar_archivo_segmentado(ruta, clave_aes, modo=MODO_CLAVE), veces), size))
+            registrar(resumir(f"descifrar_archivo GCM segmentado {nombre}", medir(lambda: descifrar_archivo(ruta + ".enc", clave_aes), veces), size))
+
+            registrar(resumir(f"crear_sobre_digital {nombre}", medir(lambda: crear_sobre_digital(ruta, ruta_publica), veces), size))
+            registrar(resumir(f"abrir_sobre_digital {nombre}", medir(lambda: abrir_sobre_digital(ruta + ".enc", ruta + ".envelope", ruta_privada), veces), size))
+
+            # Liberar el espacio de este tamaño antes de pasar al siguiente
+            for archivo in os.listdir(directorio):
+                if archivo.startswith(f"datos_{nombre}"):
+                    os.remove(os.path.join(directorio, archivo))
+    finally:
+        rsa_key_manager.KEYS_DIR = keys_dir_original
+        limpiar_cache_claves()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "sistema": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "procesador": platform.processor() or platform.machine(),
+            "nucleos": os.cpu_count(),
+        },
+        "rss_maximo_mb": rss_maximo_mb(),
+        "resultados": resultados,
+    }
+
+
+def comparar(actual, base, tolerancia=TOLERANCIA_DEFECTO):
+    # Compara dos ejecuciones y retorna las etapas cuyo p50 empeoro mas que la tolerancia
+    # Cada regresion es una tupla (etapa, p50 base en ms, p50 actual en ms, variacion relativa)
+    base_por_etapa = {resultado["etapa"]: resultado for resultado in base.get("resultados", [])}
+    regresiones = []
+
+    for resultado in actual["resultados"]:
+        anterior = base_por_etapa.get(resultado["etapa"])
+        if anterior is None:
+            continue
+
+        p50_base = anterior["latencia_ms"]["p50"]
+        p50_actual = resultado["latencia_ms"]["p50"]
+        if p50_base > 0 and (p50_actual - p50_base) / p50_base > tolerancia:
+            regresiones.append((resultado["etapa"], p50_base, p50_actual, (p50_actual - p50_base) / p50_base))
+
+    return regresiones
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Benchmark del sobre digital RSA + AES")
+    parser.add_argument("--tamanos", default=TAMANOS_DEFECTO, help=f"Tamaños de archivo separados por coma (defecto: {TAMANOS_DEFECTO})")
+    parser.add_argument("--repeticiones", type=int, default=REPETICIONES_DEFECTO, help="Repeticiones por etapa")
+    parser.add_argument("--repeticiones-generacion", type=int, default=3, help="Repeticiones de generar_par_claves (lento)")
+    parser.add_argument("--salida", help="Ruta del archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="Ruta de un JSON de una ejecucion anterior para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_DEFECTO, help="Variacion del p50 considerada regresion (0.10 = 10%%)")
+    opciones = parser.parse_args(argumentos)
+
+    tamanos = [leer_tamano(texto) for texto in opciones.tamanos.split(",") if texto.strip()]
+
+    print("=" * 60)
+    print("   Benchmark del Sobre Digital RSA + AES")
+    print("=" * 60)
+    informe = ejecutar_benchmark(tamanos, opciones.repeticiones, opciones.repeticiones_generacion)
+    print(f"\n  Memoria maxima (RSS): {informe['rss_maximo_mb']} MB")
+
+    if opciones.salida:
+        with open(opciones.salida, "w") as archivo:
+            json.dump(informe, archivo, indent=2)
+        print(f"  Resultados guardados en: {opciones.salida}")
+
+    if opciones.comparar:
+        with open(opciones.comparar) as archivo:
+            base = json.load(archivo)
+
+        regresiones = comparar(informe, base, opciones.tolerancia)
+        if not regresiones:
+            print(f"\n  Sin regresiones respecto a {opciones.comparar}")
+            return 0
+
+        print(f"\n  Regresiones respecto a {opciones.comparar}:")
+        for etapa, p50_base, p50_actual, variacion in regresiones:
+            print(f"    - {etapa}: {p50_base:.3f} ms -> {p50_actual:.3f} ms (+{variacion * 100:.1f}%)")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Compresion antes del Cifrado - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+Este modulo agrega una etapa opcional de compresion (zlib, lzma o bz2 de la libreria estandar) antes del cifrado AES.
+Los datos cifrados no se pueden comprimir, por lo que la compresion debe hacerse antes de cifrar: con logs o CSV
+se cifran y se envian varias veces menos bytes.
+
+'Bypass adaptativo': Antes de comprimir se toma una muestra del inicio del archivo y se comprime rapidamente con zlib.
+Si la muestra casi no se reduce (imagenes, video, archivos ya comprimidos) el archivo se cifra sin comprimir, para no
+gastar CPU en datos que no se pueden comprimir.
+
+El algoritmo usado queda registrado en el byte de opciones (flags) de la cabecera del archivo cifrado, y al descifrar
+los datos se descomprimen por bloques a medida que se descifran, sin cargar el archivo completo en memoria.
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import io
+import bz2
+import lzma
+import zlib
+
+
+# Constantes
+SIZE_MUESTRA = 64 * 1024          # Bytes del inicio del archivo usados para decidir si vale la pena comprimir
+UMBRAL_COMPRESION = 0.9           # Si la muestra comprimida ocupa mas del 90% del original, no se comprime
+MASCARA_COMPRESION = 0x0F         # Bits del byte de opciones de la cabecera que indican el algoritmo
+SIZE_SALIDA_MAX = 1024 * 1024     # Bytes descomprimidos como maximo por llamada (limita la memoria ante una "bomba" de compresion)
+
+# Identificador de cada algoritmo en la cabecera (0 = sin compresion)
+SIN_COMPRESION = 0
+ALGORITMOS = {"zlib": 1, "lzma": 2, "bz2": 3}
+NOMBRES_ALGORITMOS = {identificador: nombre for nombre, identificador in ALGORITMOS.items()}
+
+
+def crear_compresor(identificador):
+    # Crea el compresor incremental del algoritmo indicado
+    if identificador == ALGORITMOS["zlib"]:
+        return zlib.compressobj(6)
+    if identificador == ALGORITMOS["lzma"]:
+        return lzma.LZMACompressor(preset=3)
+    if identificador == ALGORITMOS["bz2"]:
+        return bz2.BZ2Compressor(9)
+    raise ValueError(f"Algoritmo de compresion no soportado: {identificador}")
+
+
+def crear_descompresor(identificador):
+    # Crea el descompresor incremental del algoritmo indicado
+    if identificador == ALGORITMOS["zlib"]:
+        return zlib.decompressobj()
+    if identificador == ALGORITMOS["lzma"]:
+        return lzma.LZMADecompressor()
+    if identificador == ALGORITMOS["bz2"]:
+        return bz2.BZ2Decompressor()
+    raise ValueError(f"Algoritmo de compresion no soportado: {identificador}")
+
+
+def identificador_algoritmo(nombre):
+    # Convierte el nombre del algoritmo ("zlib", "lzma", "bz2" o None) a su identificador de la cabecera
+    if nombre is None:
+        return SIN_COMPRESION
+    if nombre not in ALGORITMOS:
+        raise ValueError(f"Algoritmo de compresion no soportado: {nombre} (use {', '.join(ALGORITMOS)})")
+    return ALGORITMOS[nombre]
+
+
+def es_comprimible(muestra):
+    # Comprime la muestra con zlib en su nivel mas rapido y decide si vale la pena comprimir el archivo completo
+    if not muestra:
+        return False
+    return len(zlib.compress(muestra, 1)) <= len(muestra) * UMBRAL_COMPRESION
+
+
+class LectorComprimido(io.RawIOBase):
+    # Envuelve un archivo de entrada y entrega sus datos comprimidos mediante readinto()
+    # De esta manera cifrar_flujo() cifra los datos comprimidos sin cambios y sin cargar el archivo en memoria
+    # 'inicial' son los bytes que ya se leyeron de la entrada (la muestra), y se entregan antes que el resto
+    # Con compresor=None los datos se entregan sin comprimir
+    # 'leidos' cuenta los bytes originales leidos de la entrada
+
+    def __init__(self, entrada, compresor, inicial=b"", size_chunk=SIZE_MUESTRA):
+        self._entrada = entrada
+        self._compresor = compresor
+        self._size_chunk = size_chunk
+        self._pendiente = bytearray()
+        self._terminado = False
+        self.leidos = 0
+        self._agregar(inicial)
+
+    def readable(self):
+        return True
+
+    def _agregar(self, datos):
+        self.leidos += len(datos)
+        self._pendiente += self._compresor.compress(datos) if self._compresor is not None else datos
+
+    def readinto(self, buffer):
+        # Lee de la entrada hasta tener datos para entregar o llegar al final
+        while not self._pendiente and not self._terminado:
+            datos = self._entrada.read(self._size_chunk)
+            if datos:
+                self._agregar(datos)
+            else:
+                self._terminado = True
+                if self._compresor is not None:
+                    self._pendiente += self._compresor.flush()
+
+        cantidad = min(len(buffer), len(self._pendiente))
+        buffer[:cantidad] = self._pendiente[:cantidad]
+        del self._pendiente[:cantidad]
+        return cantidad
+
+
+class EscritorDescomprimido:
+    # Envuelve un archivo de salida: lo que se escribe se descomprime antes de guardarse
+    # descifrar_flujo() escribe aqui los datos descifrados, que siguen comprimidos
+    # cerrar() verifica que los datos comprimidos esten completos. Lanza ValueError si estan corruptos
+    # 'escritos' cuenta los bytes originales (descomprimidos) guardados
+    # Cada llamada al descompresor entrega como maximo SIZE_SALIDA_MAX bytes: unos pocos bytes comprimidos pueden
+    # representar gigabytes, y sin el limite se cargarian completos en memoria antes de escribirse
+
+    def __init__(self, salida, identificador):
+        self._salida = salida
+        self._descompresor = crear_descompresor(identificador)
+        self.escritos = 0
+
+    def _guardar(self, descomprimidos):
+        self._salida.write(descomprimidos)
+        self.escritos += len(descomprimidos)
+
+    def write(self, datos):
+        descompresor = self._descompresor
+        try:
+            if hasattr(descompresor, "unconsumed_tail"):
+                # zlib: la entrada que no se alcanzo a descomprimir queda en unconsumed_tail
+                pendiente = datos
+                while pendiente:
+                    self._guardar(descompresor.decompress(pendiente, SIZE_SALIDA_MAX))
+                    pendiente = descompresor.unconsumed_tail
+            else:
+                # lzma y bz2 guardan la entrada internamente; needs_input=False indica que aun tienen salida pendiente
+                self._guardar(descompresor.decompress(datos, SIZE_SALIDA_MAX))
+                while not descompresor.eof and not descompresor.needs_input:
+                    self._guardar(descompresor.decompress(b"", SIZE_SALIDA_MAX))
+        except (zlib.error, lzma.LZMAError, OSError, EOFError) as error:
+            raise ValueError(f"Datos comprimidos corruptos: {error}")
+        return len(datos)
+
+    def cerrar(self):
+        # zlib puede retener datos hasta el final; lzma y bz2 entregan todo en decompress()
+        if hasattr(self._descompresor, "flush"):
+            self._guardar(self._descompresor.flush())
+
+        if not self._descompresor.eof or self._descompresor.unused_data:
+            raise ValueError("Datos comprimidos corruptos o incompletos.")
+        return self.escritos
@@ -7,6 +7,9 @@ Este modulo cumple la funcion de "abrir" el sobre digital, dado a que el recepto
 archivo, el primero (.enc) es el archivo cifrado con AES. El segundo (.envelope) es el sobre digital
 que contiene la constraseña AES cifrada con RSA. De manera que solo el receptor que es el dueño de 
 la clave privada, puede recuperar la contraseña AES, para poder descifrar el archivo .enc
+Tambien se pueden abrir los contenedores (.sobre), que traen el sobre y el archivo cifrado en un solo archivo.
+Los sobres de sesion se abren con la clave de sesion guardada en memoria, sin RSA, si ya se abrio otro sobre de la
+misma sesion (ver session_keys.py).
 
 Autor: Juan David Daza
 Fecha: Febrero 2026
@@ -16,74 +19,197 @@ Fecha: Febrero 2026
 import os   
 
 # Importar la funcion de descifrado AES, correspondiente al laboratorio 02.
-from aes_file_encryptor import descifrar_archivo
+from aes_file_encryptor import descifrar_archivo, descifrar_stream, preparar_lectura, descifrar_preparado, nombre_descifrado, ErrorCifrado, UMBRAL_MMAP
 
-# Importar la funcion para cargar claves privadas RSA
-from rsa_key_manager import cargar_clave_privada
+# Importar el lector del formato segmentado (acceso aleatorio)
+from segmented_encryptor import LectorSegmentado
 
-# Importar la funcion de descifrado RSA-OAEP
-from rsa_cipher import descifrar_con_rsa
+# Importar la funcion para cargar claves privadas RSA y calcular su huella
+from rsa_key_manager import cargar_clave_privada, huella_clave, buscar_clave_privada_por_huella
 
+# Importar la lectura del formato del sobre (legado o con varios destinatarios)
+from envelope_format import leer_sobre, leer_sesion, leer_cabecera_contenedor
 
+# Claves de sesion ya descifradas (con tiempo de vida) y derivacion de la contraseña de cada archivo
+from session_keys import derivar_password_archivo, sesiones_receptor
 
-def abrir_sobre_digital(ruta_cifrada, ruta_sobre, ruta_clave_privada):
-    # Esta funcion abre un sobre digital
-    # Primero lee el envelope, en el cual con la clave privada RSA se recupera la clave simetria AES
-    # Luego se usa la clave AES recuperada para descifrar el archivo cifrado con AES
-    # El resultado es el archivo original descifrado
+# Importar la funcion de descifrado RSA-OAEP
+from rsa_cipher import descifrar_con_rsa
 
+# Mensajes de progreso (modo silencioso)
+from metrics import mostrar, reportar_error, mensajes_fuera_de
 
-    # Verificar que el archivo cifrado (.enc) existe
-    if not os.path.isfile(ruta_cifrada):
-        print(f"Error: El archivo cifrado '{ruta_cifrada}' no existe.")
-        return None  
-
-    # Verificar que el sobre digital (.envelope) existe
-    if not os.path.isfile(ruta_sobre):
-        print(f"Error: El sobre digital '{ruta_sobre}' no existe.")
-        return None  
 
-    # Cargar la clave privada RSA del receptor desde el archivo PEM
-    clave_privada = cargar_clave_privada(ruta_clave_privada)
 
-    # Verificar que la clave se cargó correctamente
-    if clave_privada is None:
-        return None  
+def recuperar_password(ruta_sobre, claves_privadas):
+    # Lee el sobre digital (.envelope) y recupera la contraseña AES con la clave privada RSA del receptor
+    # 'claves_privadas' es una clave o un anillo de claves (ver descifrar_password)
+    # Retorna None si el sobre no es para estas claves o no se pudo descifrar
 
     # Paso 1: Leer el sobre digital (.envelope) 
 
     # El archivo .envelope contiene la contraseña AES cifrada con RSA
-    # Su tamaño es fijo: 384 bytes para clave RSA de 3072 bits
-    print("\n[Paso 1/3] Leyendo sobre digital...")
+    # En el formato legado su tamaño es fijo: 384 bytes para clave RSA de 3072 bits
+    # En el formato versionado se toma directamente la entrada con la huella de nuestra clave
+    mostrar("\n[Paso 1/3] Leyendo sobre digital...")
     with open(ruta_sobre, 'rb') as archivo_sobre:
-        password_cifrada_rsa = archivo_sobre.read()  # Leer todo el contenido (384 bytes)
+        contenido_sobre = archivo_sobre.read()
 
     # Mostrar el tamaño leído para verificación
-    print(f"  Sobre leido: {len(password_cifrada_rsa)} bytes")
+    mostrar(f"  Sobre leido: {len(contenido_sobre)} bytes")
+
+    return descifrar_password(contenido_sobre, claves_privadas)
+
+
+def cargar_claves_privadas(ruta_clave_privada):
+    # Carga la clave privada del receptor, o su anillo de claves (ej: durante una rotacion de claves)
+    # 'ruta_clave_privada' puede ser una ruta o nombre de host, una lista de ellos, o None para usar todas las
+    # claves privadas del indice. Retorna la lista de claves (vacia si se usara el indice) o None si hubo un error
+    if ruta_clave_privada is None:
+        return []
+
+    rutas = ruta_clave_privada if isinstance(ruta_clave_privada, (list, tuple)) else [ruta_clave_privada]
+    claves = []
+    for ruta in rutas:
+        clave_privada = cargar_clave_privada(ruta)
+        if clave_privada is None:
+            return None
+        claves.append(clave_privada)
+    return claves
+
+
+def seleccionar_entrada(entradas, claves_privadas):
+    # Elige la clave privada que corresponde al sobre a partir de la huella de cada entrada, sin probar con RSA
+    # Con un anillo vacio la clave se busca por huella en el indice de claves
+    # Retorna (clave_privada, contraseña_cifrada_rsa) o (None, None) si el sobre no es para ninguna de las claves
+    anillo = {huella_clave(clave): clave for clave in claves_privadas}
+
+    for huella, password_cifrada_rsa in entradas:
+        if huella is None:
+            continue
+        if huella in anillo:
+            return anillo[huella], password_cifrada_rsa
+        if not claves_privadas:
+            ruta = buscar_clave_privada_por_huella(huella)
+            clave_privada = cargar_clave_privada(ruta) if ruta is not None else None
+            if clave_privada is not None and huella_clave(clave_privada) == huella:
+                return clave_privada, password_cifrada_rsa
+
+    return None, None
+
+
+def descifrar_password(contenido_sobre, claves_privadas):
+    # Recupera la contraseña AES del contenido de un sobre (leido de un .envelope o de un contenedor)
+    # 'claves_privadas' es una clave o una lista de claves (anillo); una lista vacia usa el indice de claves
+    # Retorna None si el sobre no es para estas claves o no se pudo descifrar
+    if not isinstance(claves_privadas, list):
+        claves_privadas = [claves_privadas]
+
+    try:
+        _, entradas = leer_sobre(contenido_sobre)
+        sesion = leer_sesion(contenido_sobre)
+    except ValueError as error:
+        reportar_error(str(error))
+        return None
+
+    # Los sobres versionados traen la huella de la clave del destinatario: la clave se elige directamente
+    clave_privada, password_cifrada_rsa = seleccionar_entrada(entradas, claves_privadas)
+
+    # Sobre de sesion: si otro sobre de la misma sesion ya se abrio con esta clave, la clave de sesion esta en memoria
+    # y no se usa RSA. La cache se consulta por sesion, huella y entrada cifrada, y solo con una clave privada que
+    # tiene quien llama: sin la clave del destinatario no se puede abrir el sobre aunque su sesion este en memoria
+    if sesion is not None and clave_privada is not None:
+        llave_cache = (sesion[0], huella_clave(clave_privada), password_cifrada_rsa)
+        clave_sesion = sesiones_receptor.obtener(llave_cache)
+        if clave_sesion is not None:
+            mostrar("\n[Paso 2/3] Clave de sesion en memoria, no se descifra con RSA.")
+            return derivar_password_archivo(clave_sesion, *sesion)
 
     # Paso 2: Descifrar la contraseña AES con RSA 
 
     # Usar la clave privada RSA para descifrar la contraseña AES
-    print("\n[Paso 2/3] Descifrando contrasena AES con RSA (clave privada)...")
-    password_recuperada = descifrar_con_rsa(password_cifrada_rsa, clave_privada)
+    mostrar("\n[Paso 2/3] Descifrando contrasena AES con RSA (clave privada)...")
+    if clave_privada is not None:
+        password_recuperada = descifrar_con_rsa(password_cifrada_rsa, clave_privada)
+    elif entradas and entradas[0][0] is None and claves_privadas:
+        # Sobre legado (sin huella): la unica opcion es intentar con cada clave del anillo
+        password_recuperada = None
+        for clave_privada in claves_privadas:
+            password_recuperada = descifrar_con_rsa(entradas[0][1], clave_privada)
+            if password_recuperada is not None:
+                break
+    elif entradas and entradas[0][0] is None:
+        reportar_error("El sobre digital no indica la clave del destinatario (formato legado), indique su clave privada.")
+        return None
+    else:
+        reportar_error("El sobre digital no tiene una entrada para ninguna de las claves privadas.")
+        return None
 
     # Verificar que el descifrado RSA fue exitoso
     if password_recuperada is None:
-        print("Error: No se pudo recuperar la contrasena AES del sobre digital.")
-        print("  Posibles causas:")
-        print("    - La clave privada no corresponde a la publica usada para cifrar.")
-        print("    - El archivo .envelope esta corrupto o fue modificado.")
+        reportar_error("No se pudo recuperar la contrasena AES del sobre digital.",
+                       "  Posibles causas:",
+                       "    - La clave privada no corresponde a la publica usada para cifrar.",
+                       "    - El archivo .envelope esta corrupto o fue modificado.")
         return None  
 
+    # En un sobre de sesion lo recuperado es la clave de sesion: se guarda para los siguientes sobres de la sesion
+    # y la contraseña del archivo se deriva con su nonce
+    if sesion is not None:
+        sesiones_receptor.guardar((sesion[0], huella_clave(clave_privada), password_cifrada_rsa), password_recuperada)
+        password_recuperada = derivar_password_archivo(password_recuperada, *sesion)
+
     # Mostrar confirmación de que la contraseña fue recuperada 
     # Deberia ser 32 bytes (256 bits) para AES-256
-    print(f"  Contrasena AES recuperada: {len(password_recuperada) * 8} bits")
+    mostrar(f"  Contrasena AES recuperada: {len(password_recuperada) * 8} bits")
+
+    return password_recuperada
+
+
+def abrir_sobre_digital(ruta_cifrada, ruta_sobre, ruta_clave_privada):
+    # Esta funcion abre un sobre digital
+    # Primero lee el envelope, en el cual con la clave privada RSA se recupera la clave simetria AES
+    # Luego se usa la clave AES recuperada para descifrar el archivo cifrado con AES
+    # El resultado es el archivo original descifrado
+    # Si ruta_sobre es None, ruta_cifrada es un contenedor (.sobre) que incluye el sobre y el archivo cifrado
+    # ruta_clave_privada puede ser una lista de claves (anillo), o None para buscar la clave por la huella del sobre
+
+    if ruta_sobre is None:
+        return abrir_contenedor(ruta_cifrada, ruta_clave_privada)
+
+
+    # Verificar que el archivo cifrado (.enc) existe
+    if not os.path.isfile(ruta_cifrada):
+        reportar_error(f"El archivo cifrado '{ruta_cifrada}' no existe.")
+        return None  
+
+    # Verificar que el sobre digital (.envelope) existe
+    if not os.path.isfile(ruta_sobre):
+        reportar_error(f"El sobre digital '{ruta_sobre}' no existe.")
+        return None  
+
+    # Cargar la clave privada RSA del receptor (o su anillo de claves) desde los archivos PEM
+    claves_privadas = cargar_claves_privadas(ruta_clave_privada)
+
+    # Verificar que las claves se cargaron correctamente
+    if claves_privadas is None:
+        return None  
+
+    # Paso 1 y 2: Leer el sobre digital y recuperar la contraseña AES con RSA
+    password_recuperada = recuperar_password(ruta_sobre, claves_privadas)
+
+    if password_recuperada is None:
+        return None
 
     # Paso 3: Descifrar el archivo con AES 
 
     # Usar la contraseña AES recuperada para descifrar el archivo .enc
-    print("\n[Paso 3/3] Descifrando archivo con AES-256-CBC...")
-    ruta_descifrada = descifrar_archivo(ruta_cifrada, password_recuperada)
+    mostrar("\n[Paso 3/3] Descifrando archivo con AES-256...")
+    try:
+        ruta_descifrada = descifrar_archivo(ruta_cifrada, password_recuperada)
+    except ErrorCifrado as error:
+        reportar_error(str(error))
+        return None
 
     # Resumen final 
 
@@ -91,11 +217,135 @@ def abrir_sobre_digital(ruta_cifrada, ruta_sobre, ruta_clave_privada):
     size_descifrado = os.path.getsize(ruta_descifrada)
 
     # Mostrar resumen con el resultado
-    print(f"\n{'=' * 60}")
-    print("  SOBRE DIGITAL ABIERTO EXITOSAMENTE")
-    print(f"{'=' * 60}")
-    print(f"  Archivo descifrado: {ruta_descifrada} ({size_descifrado} bytes)")
-    print(f"{'=' * 60}")
+    mostrar(f"\n{'=' * 60}")
+    mostrar("  SOBRE DIGITAL ABIERTO EXITOSAMENTE")
+    mostrar(f"{'=' * 60}")
+    mostrar(f"  Archivo descifrado: {ruta_descifrada} ({size_descifrado} bytes)")
+    mostrar(f"{'=' * 60}")
 
     # Retornar la ruta del archivo descifrado
-    return ruta_descifrada
\ No newline at end of file
+    return ruta_descifrada
+
+
+def abrir_contenedor(ruta_contenedor, ruta_clave_privada):
+    # Abre un contenedor (.sobre): el sobre y el archivo cifrado se leen del mismo archivo abierto una sola vez
+    # La cabecera, el sobre y el inicio de los datos cifrados llegan en la misma lectura del buffer del archivo
+    if not os.path.isfile(ruta_contenedor):
+        reportar_error(f"El contenedor '{ruta_contenedor}' no existe.")
+        return None
+
+    claves_privadas = cargar_claves_privadas(ruta_clave_privada)
+    if claves_privadas is None:
+        return None
+
+    size_contenedor = os.path.getsize(ruta_contenedor)
+    mapeado = size_contenedor >= UMBRAL_MMAP
+    ruta_descifrada = nombre_descifrado(ruta_contenedor)
+
+    with open(ruta_contenedor, 'rb') as entrada:
+
+        # Paso 1: Leer el sobre desde la cabecera del contenedor
+        mostrar("\n[Paso 1/3] Leyendo sobre digital del contenedor...")
+        try:
+            contenido_sobre = leer_cabecera_contenedor(entrada)
+        except ValueError as error:
+            reportar_error(str(error))
+            return None
+        mostrar(f"  Sobre leido: {len(contenido_sobre)} bytes")
+
+        # Paso 2: Descifrar la contraseña AES con RSA
+        password_recuperada = descifrar_password(contenido_sobre, claves_privadas)
+        if password_recuperada is None:
+            return None
+
+        # Paso 3: Descifrar con AES el resto del contenedor
+        mostrar("\n[Paso 3/3] Descifrando archivo con AES-256...")
+        # La cabecera AES se verifica antes de crear la salida, y se descifra en un temporal que reemplaza al
+        # archivo descifrado solo al terminar (un error no deja un archivo a medias ni borra uno anterior)
+        temporal = ruta_descifrada + ".tmp"
+        try:
+            preparado = preparar_lectura(entrada, password_recuperada)
+            with open(temporal, 'w+b' if mapeado else 'wb') as salida:
+                size_descifrado = descifrar_preparado(preparado, salida, mapeado)
+            os.replace(temporal, ruta_descifrada)
+        except (ValueError, ErrorCifrado) as error:
+            reportar_error(str(error) if isinstance(error, ErrorCifrado) else "Contenedor corrupto o modificado.")
+            return None
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    mostrar(f"\n{'=' * 60}")
+    mostrar("  SOBRE DIGITAL ABIERTO EXITOSAMENTE")
+    mostrar(f"{'=' * 60}")
+    mostrar(f"  Archivo descifrado: {ruta_descifrada} ({size_descifrado} bytes)")
+    mostrar(f"{'=' * 60}")
+
+    return ruta_descifrada
+
+
+def abrir_flujo(entrada, salida, ruta_clave_privada):
+    # Abre un contenedor que se lee de 'entrada' y escribe los datos originales en 'salida'
+    # 'entrada' y 'salida' son objetos tipo archivo binario (stdin/stdout, sockets, pipes), sin archivos temporales
+    # Si la salida ya recibio datos cuando se detecta un error, quien llama debe descartarlos
+    # Si 'salida' es la salida estandar, los mensajes de progreso y de error se escriben en stderr
+    # Retorna la cantidad de bytes descifrados, o None si hubo un error
+    with mensajes_fuera_de(salida):
+        claves_privadas = cargar_claves_privadas(ruta_clave_privada)
+        if claves_privadas is None:
+            return None
+
+        return leer_contenedor_flujo(entrada, salida, claves_privadas)
+
+
+def leer_contenedor_flujo(entrada, salida, claves_privadas, requerir_autenticado=False):
+    # Igual que abrir_flujo(), con las claves privadas ya cargadas (ver cargar_claves_privadas)
+    # Con requerir_autenticado=True un contenedor sin el formato autenticado se rechaza antes de descifrar sus datos
+    # Retorna la cantidad de bytes descifrados, o None si hubo un error
+    with mensajes_fuera_de(salida):
+        mostrar("\n[Paso 1/3] Leyendo sobre digital del flujo...")
+        try:
+            contenido_sobre = leer_cabecera_contenedor(entrada)
+        except ValueError as error:
+            reportar_error(str(error))
+            return None
+
+        password_recuperada = descifrar_password(contenido_sobre, claves_privadas)
+        if password_recuperada is None:
+            return None
+
+        mostrar("\n[Paso 3/3] Descifrando flujo con AES-256...")
+        try:
+            size_descifrado = descifrar_stream(entrada, salida, password_recuperada, requerir_autenticado)
+            salida.flush()
+        except ErrorCifrado as error:
+            reportar_error(str(error))
+            return None
+
+    return size_descifrado
+
+
+def abrir_lector_sobre(ruta_cifrada, ruta_sobre, ruta_clave_privada):
+    # Abre un sobre digital cuyo archivo fue cifrado en el formato segmentado, sin descifrarlo completo
+    # Retorna un LectorSegmentado para leer solo los rangos de bytes necesarios, o None si hubo un error
+    if not os.path.isfile(ruta_cifrada):
+        reportar_error(f"El archivo cifrado '{ruta_cifrada}' no existe.")
+        return None
+
+    if not os.path.isfile(ruta_sobre):
+        reportar_error(f"El sobre digital '{ruta_sobre}' no existe.")
+        return None
+
+    claves_privadas = cargar_claves_privadas(ruta_clave_privada)
+    if claves_privadas is None:
+        return None
+
+    password_recuperada = recuperar_password(ruta_sobre, claves_privadas)
+    if password_recuperada is None:
+        return None
+
+    try:
+        return LectorSegmentado(ruta_cifrada, password_recuperada)
+    except ErrorCifrado as error:
+        reportar_error(str(error))
+        return None
@@ -7,6 +7,7 @@ Este modulo implementa la funcion de crear un sobre digital, que consiste en cif
 y luego cifrar la clave simetrica con RSA-OAEP usando la clave publica del receptor. 
 El resultado son dos archivos: el archivo cifrado con AES (.enc) y el sobre digital (.envelope) que contiene la clave AES cifrada con RSA.
 Estos 2 archivos son enviados al receptor, quien con su clave privada RSA puede descifrar la contraseña AES y luego usarla para descifrar el archivo original.
+Opcionalmente ambos se pueden escribir en un solo archivo contenedor (.sobre), con el sobre al inicio seguido del archivo cifrado.
 Esto tiene varias ventajas, como la eficiencia del cifrado simetrico y la seguridad de la transferencia de claves por uso de una clave asimetrica.
 
 Autor: Juan David Daza
@@ -15,12 +16,25 @@ Fecha: Febrero 2026
 
 # Include
 import os   
+import io
+import time
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Importar la función de cifrado AES del laboratorio anterior
-from aes_file_encryptor import cifrar_archivo
+from aes_file_encryptor import cifrar_archivo, cifrar_stream, escribir_cifrado, ErrorCifrado, MODO_CLAVE, ENC, UMBRAL_MMAP
 
-# Importar la función para cargar claves públicas RSA
-from rsa_key_manager import cargar_clave_publica
+# Importar el cifrado segmentado (AES-GCM con acceso aleatorio)
+from segmented_encryptor import cifrar_archivo_segmentado
+
+# Importar la función para cargar claves públicas RSA y calcular su huella
+from rsa_key_manager import cargar_clave_publica, huella_clave
+
+# Importar el formato del sobre con varios destinatarios
+from envelope_format import crear_sobre_destinatarios, crear_cabecera_contenedor, SIZE_ID_SESION, SIZE_NONCE_SESION
+
+# Modo sesion: una clave de sesion cifrada con RSA por destinatarios y ventana de tiempo
+from session_keys import derivar_password_archivo, sesiones_emisor, SIZE_CLAVE_SESION
 
 # Importar la función de cifrado RSA-OAEP
 from rsa_cipher import cifrar_con_rsa
@@ -28,6 +42,9 @@ from rsa_cipher import cifrar_con_rsa
 # Generador de bytes aleatorios seguros
 from Crypto.Random import get_random_bytes
 
+# Medicion de etapas y mensajes de progreso (modo silencioso)
+from metrics import etapa, mostrar, silencioso, reportar_error, ultimo_error, mensajes_fuera_de
+
 # CONSTANTES
 
 # Tamaño de la contraseña AES 
@@ -36,57 +53,205 @@ SIZE_PASSWORD_RANDOM = 32
 # Extension del archivo que contiene la clave AES cifrado con RSA 
 ENVELOPE_EXT = ".envelope"
 
+# Extension del contenedor: sobre y archivo cifrado en un solo archivo
+CONTENEDOR_EXT = ".sobre"
+
+# Extension del paquete cifrado de varios archivos (ver encrypted_archive.py)
+PAQUETE_EXT = ".paquete"
+
+
+
+def cargar_claves_publicas(ruta_clave_publica_receptor):
+    # Carga la clave publica de cada destinatario ('ruta_clave_publica_receptor' es una ruta o nombre de host,
+    # o una lista de ellos). Retorna la lista de claves, o None si alguna no se pudo cargar
+    rutas_claves = list(ruta_clave_publica_receptor) if isinstance(ruta_clave_publica_receptor, (list, tuple)) else [ruta_clave_publica_receptor]
+
+    if not rutas_claves:
+        reportar_error("Debe indicar al menos una clave publica.")
+        return None
+
+    claves_publicas = []
+    for ruta_clave in rutas_claves:
+        clave_publica = cargar_clave_publica(ruta_clave)
+
+        # Verificar que la clave se cargó correctamente
+        if clave_publica is None:
+            return None
+
+        claves_publicas.append(clave_publica)
+    return claves_publicas
+
+
+def envolver_password(password, claves_publicas):
+    # Cifra la contraseña AES con la clave publica RSA de cada destinatario y construye el sobre
+    # El sobre contiene la cabecera y una entrada por destinatario, identificada por la huella de su clave publica
+    # Aun con un solo destinatario se incluye la huella, para que el receptor elija su clave privada sin probar con RSA
+    entradas = [(huella_clave(clave_publica), cifrar_con_rsa(password, clave_publica)) for clave_publica in claves_publicas]
+    return crear_sobre_destinatarios(entradas)
+
+
+def envolver_password_sesion(claves_publicas):
+    # Modo sesion (ver session_keys.py): la clave de sesion de estos destinatarios se cifra con RSA solo al abrir la
+    # sesion, y se reutiliza mientras no venza. Cada archivo recibe un nonce nuevo y su propia contraseña derivada
+    # Retorna (contraseña del archivo, sobre)
+    def abrir_sesion():
+        clave_sesion = get_random_bytes(SIZE_CLAVE_SESION)
+        entradas = [(huella, cifrar_con_rsa(clave_sesion, clave_publica)) for huella, clave_publica in zip(huellas, claves_publicas)]
+        return get_random_bytes(SIZE_ID_SESION), clave_sesion, entradas
+
+    huellas = [huella_clave(clave_publica) for clave_publica in claves_publicas]
+    id_sesion, clave_sesion, entradas = sesiones_emisor.obtener_o_crear(tuple(huellas), abrir_sesion)
+
+    nonce = get_random_bytes(SIZE_NONCE_SESION)
+    return derivar_password_archivo(clave_sesion, id_sesion, nonce), crear_sobre_destinatarios(entradas, (id_sesion, nonce))
+
+
+def generar_password(claves_publicas, sesion=False):
+    # Genera la contraseña AES de un archivo y el sobre que la transporta. Retorna (contraseña, sobre)
+    # Con sesion=True se usa la clave de sesion de los destinatarios en lugar de una operacion RSA por archivo
+    if sesion:
+        return envolver_password_sesion(claves_publicas)
+    password_aleatoria = get_random_bytes(SIZE_PASSWORD_RANDOM)
+    return password_aleatoria, envolver_password(password_aleatoria, claves_publicas)
+
+
+def escribir_contenedor_flujo(entrada, salida, claves_publicas, compresion=None, autenticado=True, sesion=False):
+    # Escribe en 'salida' el contenedor (sobre + archivo cifrado) de los datos de 'entrada', con claves publicas ya cargadas
+    # Lanza ErrorCifrado si hubo un error. Retorna la cantidad de bytes originales cifrados
+    with mensajes_fuera_de(salida):
+        password_aleatoria, sobre = generar_password(claves_publicas, sesion)
+
+        with etapa("escribir_sobre", len(sobre), formato="contenedor"):
+            salida.write(crear_cabecera_contenedor(sobre))
+        size_original = cifrar_stream(entrada, salida, password_aleatoria, MODO_CLAVE, compresion, autenticado)
+        salida.flush()
+    return size_original
+
+
+def enviar_flujo(entrada, salida, ruta_clave_publica_receptor, compresion=None, autenticado=True, sesion=False):
+    # Crea el sobre digital de los datos leidos de 'entrada' y escribe el contenedor (sobre + archivo cifrado) en 'salida'
+    # 'entrada' y 'salida' son objetos tipo archivo binario (stdin/stdout, sockets, pipes), sin archivos temporales:
+    #     pg_dump | python main_rsa_envelope.py send - --clave student2 | ssh student2 "cat > respaldo.sobre"
+    # Si 'salida' es la salida estandar, los mensajes de progreso y de error se escriben en stderr
+    # Retorna la cantidad de bytes originales cifrados, o None si hubo un error
+    with mensajes_fuera_de(salida):
+        claves_publicas = cargar_claves_publicas(ruta_clave_publica_receptor)
+        if claves_publicas is None:
+            return None
+
+        try:
+            return escribir_contenedor_flujo(entrada, salida, claves_publicas, compresion, autenticado, sesion)
+        except ErrorCifrado as error:
+            reportar_error(str(error))
+            return None
+
+
+def escribir_contenedor(ruta_archivo, password, sobre, compresion=None, autenticado=True):
+    # Escribe el contenedor <archivo>.sobre en una sola pasada: cabecera, sobre y el archivo cifrado con AES (formato .enc)
+    # Retorna la ruta del contenedor. Lanza ErrorCifrado si el archivo no existe
+    if not os.path.isfile(ruta_archivo):
+        raise ErrorCifrado(f"El archivo '{ruta_archivo}' no existe.")
+
+    size_original = os.path.getsize(ruta_archivo)
+    mapeado = size_original >= UMBRAL_MMAP
+    ruta_contenedor = ruta_archivo + CONTENEDOR_EXT
+
+    with open(ruta_archivo, 'rb') as entrada, open(ruta_contenedor, 'w+b' if mapeado else 'wb') as salida:
+        with etapa("escribir_sobre", len(sobre), formato="contenedor"):
+            salida.write(crear_cabecera_contenedor(sobre))
+        escribir_cifrado(entrada, salida, password, MODO_CLAVE, mapeado, compresion, autenticado)
+
+    return ruta_contenedor
 
 
-def crear_sobre_digital(ruta_archivo, ruta_clave_publica_receptor):
+def crear_sobre_digital(ruta_archivo, ruta_clave_publica_receptor, segmentado=False, contenedor=False, compresion=None,
+                        autenticado=True, sesion=False):
 
     # Esta funcion cifra el archivo a enviar con AES y luego cifra la clave con RSA usando la clave publica del receptos
     # El receptor tendra que usar su clave privada para recuperar la contraseña AES y luego descifrar el archivo cifrado con AES
+    # Si se recibe una lista de claves publicas, el archivo se cifra una sola vez y el sobre lleva una entrada por destinatario
+    # Con segmentado=True el archivo se cifra en el formato segmentado AES-GCM, que permite descifrar rangos de bytes
+    # Con contenedor=True se genera un solo archivo (<archivo>.sobre) con el sobre seguido del archivo cifrado,
+    # en ese caso la ruta del sobre retornada es None
+    # Con compresion ("zlib", "lzma" o "bz2") el archivo se comprime antes de cifrarlo, si sus datos son comprimibles
+    # Con autenticado=True (por defecto) el archivo CBC lleva un MAC por bloque, asi el receptor detecta de inmediato
+    # una contraseña incorrecta, un archivo modificado o truncado. El formato segmentado ya esta autenticado (GCM)
+    # Con sesion=True la contraseña se deriva de la clave de sesion de los destinatarios (ver session_keys.py):
+    # solo el primer archivo de cada sesion requiere una operacion RSA, para el emisor y para el receptor
 
     # Verificar que el archivo original existe
     if not os.path.isfile(ruta_archivo):
-        print(f"Error: El archivo '{ruta_archivo}' no existe.")
+        reportar_error(f"El archivo '{ruta_archivo}' no existe.")
         return None, None  # Indica error
 
-    # Cargar la clave pública RSA del receptor desde el archivo PEM
-    # Retorna none si hubo un error
-    clave_publica = cargar_clave_publica(ruta_clave_publica_receptor)
+    if segmentado and contenedor:
+        reportar_error("El formato segmentado no se puede usar dentro de un contenedor.")
+        return None, None
+
+    if segmentado and compresion:
+        reportar_error("El formato segmentado no admite compresion (cada segmento se debe poder leer por separado).")
+        return None, None
 
-    # Verificar que la clave se cargó correctamente
-    if clave_publica is None:
-        return None, None  
+    # Cargar las claves públicas RSA de los receptores desde los archivos PEM
+    # Retorna none si hubo un error
+    claves_publicas = cargar_claves_publicas(ruta_clave_publica_receptor)
+    if claves_publicas is None:
+        return None, None
 
     # Paso 1: Generar contraseña AES aleatoria 
     # Se genera una contraseña unica aleatoria de 32 bytes, para cada archivo a cifrar
-    print("\n[Paso 1/4] Generando contrasena AES aleatoria de 256 bits...")
-    password_aleatoria = get_random_bytes(SIZE_PASSWORD_RANDOM)
+    # En modo sesion la contraseña se deriva de la clave de sesion con un nonce aleatorio del archivo
+    mostrar("\n[Paso 1/4] Generando contrasena AES aleatoria de 256 bits...")
 
-    # Mostrar el tamaño para confirmación 
-    print(f"  Contrasena generada: {len(password_aleatoria) * 8} bits de entropia")
+    # Paso 2: Cifrar la contraseña AES con RSA
 
-    # Paso 2: Cifrar el archivo con AES-256-CBC 
+    # Cifrar los 32 bytes de la contraseña con la clave pública RSA de cada receptor
+    # Se hace antes de cifrar el archivo para que el contenedor pueda escribir el sobre y el archivo cifrado en una sola pasada
+    mostrar("\n[Paso 2/4] Cifrando contrasena AES con RSA (clave publica del receptor)...")
+    password_aleatoria, password_cifrada_rsa = generar_password(claves_publicas, sesion)
 
-    # Llamar a la función del laboratorio anterior para cifrar el archivo
-    print("\n[Paso 2/4] Cifrando archivo con AES-256-CBC...")
-    ruta_cifrada = cifrar_archivo(ruta_archivo, password_aleatoria)
+    # Mostrar el tamaño para confirmación 
+    mostrar(f"  Contrasena generada: {len(password_aleatoria) * 8} bits de entropia")
+
+    # Mostrar el tamaño del sobre (una entrada de 384 bytes por destinatario para claves de 3072 bits)
+    mostrar(f"  Contrasena AES cifrada con RSA: sobre de {len(password_cifrada_rsa)} bytes para {len(claves_publicas)} destinatario(s)")
 
-    # Paso 3: Cifrar la contraseña AES con RSA
+    # Paso 3: Cifrar el archivo con AES-256-CBC 
 
-    # Cifrar los 32 bytes de la contraseña con la clave pública RSA del receptor
-    print("\n[Paso 3/4] Cifrando contrasena AES con RSA (clave publica del receptor)...")
-    password_cifrada_rsa = cifrar_con_rsa(password_aleatoria, clave_publica)
+    # Llamar a la función del laboratorio anterior para cifrar el archivo
+    # Como la contraseña ya es aleatoria de 256 bits se usa MODO_CLAVE (HKDF) en lugar de las 100k iteraciones de PBKDF2
+    mostrar(f"\n[Paso 3/4] Cifrando archivo con {'AES-256-GCM segmentado' if segmentado else 'AES-256-CBC'}...")
+    try:
+        if contenedor:
+            ruta_cifrada = escribir_contenedor(ruta_archivo, password_aleatoria, password_cifrada_rsa, compresion, autenticado)
+        elif segmentado:
+            ruta_cifrada = cifrar_archivo_segmentado(ruta_archivo, password_aleatoria, modo=MODO_CLAVE)
+        else:
+            ruta_cifrada = cifrar_archivo(ruta_archivo, password_aleatoria, modo=MODO_CLAVE, compresion=compresion,
+                                          autenticado=autenticado)
+    except ErrorCifrado as error:
+        reportar_error(str(error))
+        return None, None
 
-    # Mostrar el tamaño del resultado RSA (384 bytes para clave de 3072 bits)
-    print(f"  Contrasena AES cifrada con RSA: {len(password_cifrada_rsa)} bytes")
+    # Con el contenedor el sobre ya quedo escrito al inicio del archivo, no hay un segundo archivo
+    if contenedor:
+        size_contenedor = os.path.getsize(ruta_cifrada)
+        mostrar(f"\n[Paso 4/4] Sobre digital incluido en el contenedor.")
+        mostrar(f"\n{'=' * 60}")
+        mostrar("  SOBRE DIGITAL CREADO EXITOSAMENTE")
+        mostrar(f"{'=' * 60}")
+        mostrar(f"  Contenedor (RSA + AES): {ruta_cifrada} ({size_contenedor} bytes)")
+        mostrar(f"{'=' * 60}")
+        mostrar(f"\n  Envie el contenedor al destinatario:")
+        mostrar(f"    scp {ruta_cifrada} student@OTHER.11:~/recibido/")
+        return ruta_cifrada, None
 
     # Paso 4: Guardar el sobre digital (.envelope)
-
-    # El archivo .envelope contiene SOLO la contraseña AES cifrada con RSA
     ruta_sobre = ruta_archivo + ENVELOPE_EXT
 
     # Escribir la contraseña cifrada en el archivo .envelope (modo binario)
-    print(f"\n[Paso 4/4] Guardando sobre digital...")
-    with open(ruta_sobre, 'wb') as archivo_sobre:
+    mostrar(f"\n[Paso 4/4] Guardando sobre digital...")
+    with etapa("escribir_sobre", len(password_cifrada_rsa)), open(ruta_sobre, 'wb') as archivo_sobre:
         archivo_sobre.write(password_cifrada_rsa)
  
     # Reumen final
@@ -95,17 +260,121 @@ def crear_sobre_digital(ruta_archivo, ruta_clave_publica_receptor):
     size_sobre = os.path.getsize(ruta_sobre)        # Tamaño del sobre digital con la contraseña cifrada con RSA
 
     # Mostrar resumen con todos los archivos generados
+    mostrar(f"\n{'=' * 60}")
+    mostrar("  SOBRE DIGITAL CREADO EXITOSAMENTE")
+    mostrar(f"{'=' * 60}")
+    mostrar(f"  Archivo cifrado (AES): {ruta_cifrada} ({size_enc} bytes)")
+    mostrar(f"  Sobre digital  (RSA): {ruta_sobre} ({size_sobre} bytes)")
+    mostrar(f"{'=' * 60}")
+    mostrar(f"\n  Envie AMBOS archivos al destinatario:")
+    mostrar(f"    1. {ruta_cifrada}")
+    mostrar(f"    2. {ruta_sobre}")
+    mostrar(f"\n  Comando SCP de ejemplo:")
+    mostrar(f"    scp {ruta_cifrada} {ruta_sobre} student@OTHER.11:~/recibido/")
+
+    # Retornar las rutas de ambos archivos generados
+    return ruta_cifrada, ruta_sobre
+
+
+def recolectar_archivos(rutas):
+    # Expande la lista de rutas: los directorios se recorren completos y los archivos se toman tal cual
+    # Se omiten los archivos generados por el propio sobre digital (.enc, .envelope, .sobre y .paquete)
+    archivos = []
+
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            for raiz, _, nombres in os.walk(ruta):
+                for nombre in sorted(nombres):
+                    if not nombre.endswith((ENC, ENVELOPE_EXT, CONTENEDOR_EXT, PAQUETE_EXT)):
+                        archivos.append(os.path.join(raiz, nombre))
+        else:
+            archivos.append(ruta)
+
+    return archivos
+
+
+def _crear_sobre_en_proceso(ruta_archivo, ruta_clave_publica_receptor, contenedor=False, compresion=None, sesion=False):
+    # Funcion que ejecuta cada proceso del pool para un archivo
+    # Nunca lanza excepciones: cualquier error queda registrado en el resultado para no detener el lote
+    inicio = time.perf_counter()
+    resultado = {"archivo": ruta_archivo, "ok": False, "bytes": 0, "segundos": 0.0, "error": None}
+
+    try:
+        # Los mensajes de cada paso no se imprimen (modo silencioso), en paralelo solo generarian ruido en la consola
+        # Los mensajes de error tampoco: la causa se reporta en el resultado (ver reportar_error)
+        silencioso(True)
+        ultimo_error(limpiar=True)
+        with redirect_stdout(io.StringIO()):
+            ruta_cifrada, ruta_sobre = crear_sobre_digital(ruta_archivo, ruta_clave_publica_receptor, contenedor=contenedor,
+                                                           compresion=compresion, sesion=sesion)
+
+        if ruta_cifrada is None:
+            resultado["error"] = ultimo_error(limpiar=True) or "No se pudo crear el sobre digital."
+        else:
+            resultado.update(ok=True, cifrado=ruta_cifrada, sobre=ruta_sobre, bytes=os.path.getsize(ruta_archivo))
+    except Exception as error:
+        resultado["error"] = f"{type(error).__name__}: {error}"
+
+    resultado["segundos"] = time.perf_counter() - inicio
+    return resultado
+
+
+def crear_sobres_masivos(rutas, ruta_clave_publica_receptor, procesos=None, contenedor=False, compresion=None, sesion=False):
+    # Crea un sobre digital por cada archivo de 'rutas' (archivos o directorios) usando un pool de procesos
+    # Por defecto se usa un proceso por nucleo. Un error en un archivo no detiene el resto del lote
+    # Con contenedor=True cada archivo genera un solo .sobre (menos archivos y transferencias con muchos archivos pequeños)
+    # Con sesion=True cada proceso del pool abre una sola sesion por destinatarios (una operacion RSA por proceso)
+    # Retorna la lista de resultados por archivo y un resumen con el throughput total
+    archivos = recolectar_archivos(rutas)
+    resultados = []
+
+    if not archivos:
+        print("No se encontraron archivos para enviar.")
+        return resultados, None
+
+    procesos = procesos or os.cpu_count() or 1
+    mostrar(f"\nEnviando {len(archivos)} archivos con {procesos} procesos...")
+
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        tareas = {pool.submit(_crear_sobre_en_proceso, ruta, ruta_clave_publica_receptor, contenedor, compresion, sesion): ruta
+                  for ruta in archivos}
+
+        for tarea in as_completed(tareas):
+            # Si un proceso del pool termina de forma inesperada (ej: sin memoria) sus archivos se reportan con error
+            try:
+                resultado = tarea.result()
+            except Exception as error:
+                resultado = {"archivo": tareas[tarea], "ok": False, "bytes": 0, "segundos": 0.0,
+                             "error": f"{type(error).__name__}: {error}"}
+            resultados.append(resultado)
+
+            if resultado["ok"]:
+                mostrar(f"  [OK]    {resultado['archivo']} ({resultado['bytes']} bytes, {resultado['segundos']:.3f} s)")
+            else:
+                print(f"  [ERROR] {resultado['archivo']}: {resultado['error']}")
+
+    segundos = time.perf_counter() - inicio
+    exitosos = [r for r in resultados if r["ok"]]
+    total_bytes = sum(r["bytes"] for r in exitosos)
+
+    resumen = {
+        "archivos": len(resultados),
+        "exitosos": len(exitosos),
+        "fallidos": len(resultados) - len(exitosos),
+        "bytes": total_bytes,
+        "segundos": segundos,
+        "mb_por_segundo": total_bytes / (1024 * 1024) / segundos if segundos > 0 else 0.0,
+        "archivos_por_segundo": len(resultados) / segundos if segundos > 0 else 0.0,
+    }
+
+    # Mostrar resumen del lote
     print(f"\n{'=' * 60}")
-    print("  SOBRE DIGITAL CREADO EXITOSAMENTE")
+    print("  ENVIO MASIVO FINALIZADO")
     print(f"{'=' * 60}")
-    print(f"  Archivo cifrado (AES): {ruta_cifrada} ({size_enc} bytes)")
-    print(f"  Sobre digital  (RSA): {ruta_sobre} ({size_sobre} bytes)")
+    print(f"  Archivos procesados: {resumen['archivos']} ({resumen['exitosos']} exitosos, {resumen['fallidos']} con error)")
+    print(f"  Datos cifrados: {resumen['bytes']} bytes en {resumen['segundos']:.2f} s")
+    print(f"  Throughput: {resumen['mb_por_segundo']:.2f} MB/s, {resumen['archivos_por_segundo']:.1f} archivos/s")
     print(f"{'=' * 60}")
-    print(f"\n  Envie AMBOS archivos al destinatario:")
-    print(f"    1. {ruta_cifrada}")
-    print(f"    2. {ruta_sobre}")
-    print(f"\n  Comando SCP de ejemplo:")
-    print(f"    scp {ruta_cifrada} {ruta_sobre} student@OTHER.11:~/recibido/")
 
-    # Retornar las rutas de ambos archivos generados
-    return ruta_cifrada, ruta_sobre
\ No newline at end of file
+    return resultados, resumen
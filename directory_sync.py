@@ -0,0 +1,243 @@
+"""
+Sincronizacion Incremental de Directorios - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+Este modulo crea los sobres digitales de un directorio completo de forma incremental: en lugar de cifrar de nuevo
+todos los archivos en cada ejecucion, solo se cifran los archivos nuevos o modificados desde la ultima vez.
+
+Junto a los archivos cifrados se guarda un manifiesto (.sobres_sync.json) con la ruta, el tamaño, el mtime y el
+hash SHA-256 de cada archivo original, ademas de los archivos generados para el. En cada ejecucion:
+
+'Sin cambios': Si el tamaño y el mtime coinciden con el manifiesto el archivo se omite, sin leerlo.
+'Modificados': Si el tamaño o el mtime cambiaron se calcula el hash; si el contenido es el mismo (ej: solo se
+toco el archivo) solo se actualiza el manifiesto, si no el archivo se cifra de nuevo.
+'Eliminados': Los archivos del manifiesto que ya no existen se reportan, y sus archivos cifrados se borran.
+
+Asi el tiempo de cada ejecucion depende de la cantidad de cambios y no del tamaño del directorio.
+Si cambian los destinatarios (las claves publicas) todos los archivos se cifran de nuevo.
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Envio masivo con un pool de procesos, y recorrido del directorio
+from digital_envelope_sender import crear_sobres_masivos, recolectar_archivos
+
+# Cargar las claves publicas de los destinatarios y calcular su huella
+from rsa_key_manager import cargar_clave_publica, huella_clave
+
+# Tamaño de los bloques de lectura
+from aes_file_encryptor import SIZE_CHUNK
+
+# Mensajes de progreso (modo silencioso)
+from metrics import mostrar, reportar_error
+
+
+# Constantes
+MANIFIESTO_SYNC = ".sobres_sync.json"
+VERSION_MANIFIESTO = 1
+
+
+def ruta_manifiesto(directorio):
+    return os.path.join(directorio, MANIFIESTO_SYNC)
+
+
+def hash_archivo(ruta):
+    # Hash SHA-256 (hexadecimal) del contenido del archivo, leido por bloques de SIZE_CHUNK en un buffer reutilizado
+    resumen = hashlib.sha256()
+    buffer = bytearray(SIZE_CHUNK)
+    with open(ruta, "rb") as archivo, memoryview(buffer) as vista:
+        while True:
+            leidos = archivo.readinto(vista)
+            if not leidos:
+                break
+            resumen.update(vista[:leidos])
+    return resumen.hexdigest()
+
+
+def manifiesto_vacio(destinatarios, contenedor):
+    return {"version": VERSION_MANIFIESTO, "destinatarios": destinatarios, "contenedor": contenedor, "archivos": {}}
+
+
+def cargar_manifiesto(directorio):
+    # Lee el manifiesto del directorio. Retorna None si no existe o no es valido (se cifra todo de nuevo)
+    try:
+        with open(ruta_manifiesto(directorio)) as archivo:
+            manifiesto = json.load(archivo)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        mostrar("  Manifiesto de sincronizacion invalido, se cifran todos los archivos.")
+        return None
+
+    if not isinstance(manifiesto, dict) or manifiesto.get("version") != VERSION_MANIFIESTO:
+        mostrar("  Version del manifiesto de sincronizacion no soportada, se cifran todos los archivos.")
+        return None
+    return manifiesto
+
+
+def guardar_manifiesto(directorio, manifiesto):
+    # Escribe el manifiesto en un archivo temporal y lo reemplaza de forma atomica, para no dejarlo a medias
+    ruta = ruta_manifiesto(directorio)
+    temporal = ruta + ".tmp"
+    with open(temporal, "w") as archivo:
+        json.dump(manifiesto, archivo, indent=1, sort_keys=True)
+    os.replace(temporal, ruta)
+
+
+def huellas_destinatarios(ruta_clave_publica_receptor):
+    # Huellas (hexadecimal) de las claves publicas de los destinatarios, o None si alguna no se pudo cargar
+    rutas = ruta_clave_publica_receptor if isinstance(ruta_clave_publica_receptor, (list, tuple)) else [ruta_clave_publica_receptor]
+    huellas = []
+    for ruta in rutas:
+        clave_publica = cargar_clave_publica(ruta)
+        if clave_publica is None:
+            return None
+        huellas.append(huella_clave(clave_publica).hex())
+    return sorted(huellas)
+
+
+def borrar_salidas(directorio, salidas):
+    # Borra los archivos cifrados generados para un archivo (los que aun existan)
+    for salida in salidas:
+        ruta = os.path.join(directorio, salida)
+        if os.path.isfile(ruta):
+            os.remove(ruta)
+
+
+def salidas_existen(directorio, entrada):
+    return all(os.path.isfile(os.path.join(directorio, salida)) for salida in entrada.get("salidas", []))
+
+
+def sincronizar_directorio(directorio, ruta_clave_publica_receptor, procesos=None, contenedor=False, compresion=None,
+                           eliminar=True):
+    # Crea los sobres digitales de los archivos nuevos o modificados de 'directorio' (ver la descripcion del modulo)
+    # Con eliminar=True se borran los archivos cifrados de los archivos que ya no existen
+    # Retorna un resumen con la cantidad de archivos de cada tipo, o None si hubo un error
+    if not os.path.isdir(directorio):
+        reportar_error(f"El directorio '{directorio}' no existe.")
+        return None
+
+    destinatarios = huellas_destinatarios(ruta_clave_publica_receptor)
+    if destinatarios is None:
+        return None
+
+    inicio = time.perf_counter()
+    manifiesto = cargar_manifiesto(directorio)
+    if manifiesto is not None and (manifiesto.get("destinatarios") != destinatarios or manifiesto.get("contenedor") != contenedor):
+        # Con otros destinatarios o formato los archivos cifrados anteriores ya no sirven: se cifra todo de nuevo
+        mostrar("  Cambiaron los destinatarios o el formato, se cifran todos los archivos.")
+        anteriores = manifiesto.get("archivos", {})
+        manifiesto = manifiesto_vacio(destinatarios, contenedor)
+        manifiesto["anteriores"] = anteriores
+    elif manifiesto is None:
+        manifiesto = manifiesto_vacio(destinatarios, contenedor)
+    archivos = manifiesto["archivos"]
+    anteriores = manifiesto.pop("anteriores", {})
+
+    # Paso 1: Recorrer el directorio y comparar tamaño y mtime con el manifiesto (sin leer los archivos)
+    mostrar(f"\nRevisando {directorio}...")
+    vistos = set()
+    candidatos = []
+    sin_cambios = 0
+
+    for ruta in recolectar_archivos([directorio]):
+        relativa = os.path.relpath(ruta, directorio)
+        if relativa in (MANIFIESTO_SYNC, MANIFIESTO_SYNC + ".tmp"):
+            continue
+        vistos.add(relativa)
+
+        estado = os.stat(ruta)
+        entrada = archivos.get(relativa)
+        if (entrada is not None and entrada["size"] == estado.st_size and entrada["mtime_ns"] == estado.st_mtime_ns
+                and salidas_existen(directorio, entrada)):
+            sin_cambios += 1
+        else:
+            candidatos.append((ruta, relativa, estado))
+
+    # Paso 2: Calcular el hash de los archivos con otro tamaño o mtime, en paralelo (hashlib libera el GIL)
+    # El estado se tomo antes del hash: si el archivo cambia mientras se cifra, la siguiente ejecucion lo detecta
+    with ThreadPoolExecutor(max_workers=procesos or os.cpu_count() or 1) as pool:
+        hashes = list(pool.map(lambda candidato: hash_archivo(candidato[0]), candidatos))
+
+    pendientes = {}
+    tocados = 0
+    for (ruta, relativa, estado), hash_actual in zip(candidatos, hashes):
+        entrada = archivos.get(relativa)
+        nueva = {"size": estado.st_size, "mtime_ns": estado.st_mtime_ns, "sha256": hash_actual}
+        if entrada is not None and entrada["sha256"] == hash_actual and salidas_existen(directorio, entrada):
+            # Mismo contenido (ej: solo cambio el mtime): se actualiza el manifiesto sin cifrar
+            nueva["salidas"] = entrada["salidas"]
+            archivos[relativa] = nueva
+            tocados += 1
+        else:
+            pendientes[ruta] = (relativa, nueva)
+
+    nuevos = sum(1 for relativa, _ in pendientes.values() if relativa not in archivos)
+    modificados = len(pendientes) - nuevos
+
+    # Paso 3: Cifrar solo los archivos nuevos o modificados
+    fallidos = 0
+    if pendientes:
+        resultados, _ = crear_sobres_masivos(list(pendientes), ruta_clave_publica_receptor, procesos, contenedor, compresion)
+        for resultado in resultados:
+            relativa, nueva = pendientes[resultado["archivo"]]
+            anterior = archivos.pop(relativa, None)
+            if not resultado["ok"]:
+                # Se conserva la entrada anterior con sus salidas (si no, quedarian archivos cifrados sin registrar)
+                # Como no corresponde al archivo actual, el archivo se vuelve a intentar en la siguiente ejecucion
+                # Las de otros destinatarios o formato se guardan aparte, para no tomarlas como vigentes
+                if anterior is not None:
+                    archivos[relativa] = anterior
+                elif relativa in anteriores:
+                    manifiesto.setdefault("anteriores", {})[relativa] = anteriores[relativa]
+                fallidos += 1
+                continue
+            anterior = anterior or anteriores.get(relativa)
+
+            nueva["salidas"] = [os.path.relpath(salida, directorio) for salida in (resultado["cifrado"], resultado["sobre"])
+                                if salida is not None]
+            archivos[relativa] = nueva
+
+            # Si cambio el formato (ej: de .enc + .envelope a contenedor) se borran los archivos cifrados anteriores
+            if anterior is not None:
+                borrar_salidas(directorio, set(anterior.get("salidas", [])) - set(nueva["salidas"]))
+
+    # Paso 4: Detectar los archivos eliminados
+    eliminados = sorted((set(archivos) | set(anteriores)) - vistos)
+    for relativa in eliminados:
+        entrada = archivos.pop(relativa, None) or anteriores.get(relativa)
+        if eliminar and entrada is not None:
+            borrar_salidas(directorio, entrada.get("salidas", []))
+        mostrar(f"  [ELIMINADO] {relativa}")
+
+    guardar_manifiesto(directorio, manifiesto)
+
+    resumen = {
+        "archivos": len(vistos),
+        "sin_cambios": sin_cambios + tocados,
+        "nuevos": nuevos,
+        "modificados": modificados,
+        "eliminados": len(eliminados),
+        "fallidos": fallidos,
+        "segundos": time.perf_counter() - inicio,
+    }
+
+    print(f"\n{'=' * 60}")
+    print("  SINCRONIZACION FINALIZADA")
+    print(f"{'=' * 60}")
+    print(f"  Archivos: {resumen['archivos']} ({resumen['sin_cambios']} sin cambios, {resumen['nuevos']} nuevos, "
+          f"{resumen['modificados']} modificados, {resumen['fallidos']} con error)")
+    print(f"  Eliminados: {resumen['eliminados']}")
+    print(f"  Tiempo: {resumen['segundos']:.2f} s")
+    print(f"{'=' * 60}")
+
+    return resumen
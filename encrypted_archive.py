@@ -0,0 +1,351 @@
+"""
+Paquete Cifrado de Varios Archivos - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+Enviar miles de archivos pequeños (ej: archivos de configuracion) con un sobre por archivo cuesta una operacion RSA,
+una derivacion de clave y dos archivos de salida por cada uno. Este modulo empaqueta muchos archivos en un solo
+archivo cifrado (.paquete) con una sola contraseña AES envuelta con RSA:
+
+'Miembros': Cada archivo se cifra y autentica por separado con AES-256-GCM, usando el nonce base del paquete seguido
+del numero del miembro (igual que los segmentos de segmented_encryptor.py). Asi se puede descifrar un solo miembro
+sin leer el resto del paquete.
+'Indice': Al final del paquete va un indice cifrado con el nombre, tamaño, posicion y algoritmo de compresion de cada
+miembro. Los nombres de los archivos tambien quedan cifrados. El pie del paquete indica donde empieza el indice.
+'Compresion': Opcional por miembro, con el mismo bypass adaptativo del formato .enc (ver compression.py).
+
+Estructura:
+[MAGIC (8 bytes)][version (1 byte)][largo sobre (4 bytes)][sobre][salt (16 bytes)][nonce base (8 bytes)]
+N veces: [miembro cifrado][tag (16 bytes)]
+[indice cifrado (JSON)][tag (16 bytes)][posicion del indice (8 bytes)][largo del indice (4 bytes)]
+
+Toda la cabecera (incluido el sobre) se autentica como datos asociados de cada miembro y del indice.
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import os
+import io
+import json
+import struct
+
+from Crypto.Cipher import AES               # AES en modo GCM (cifrado autenticado)
+from Crypto.Random import get_random_bytes  # Generador de bytes aleatorios seguros
+
+# Derivacion de clave y errores compartidos con el formato .enc
+from aes_file_encryptor import derivar_clave_directa, ErrorCifrado, SIZE_SALT, SIZE_CHUNK
+
+# Compresion opcional de cada miembro
+from compression import (
+    LectorComprimido, EscritorDescomprimido, crear_compresor, identificador_algoritmo, es_comprimible,
+    SIN_COMPRESION, NOMBRES_ALGORITMOS, SIZE_MUESTRA,
+)
+
+# Sobre digital: envolver la contraseña para los destinatarios y recuperarla con la clave privada
+from digital_envelope_sender import (
+    cargar_claves_publicas, envolver_password, recolectar_archivos, SIZE_PASSWORD_RANDOM, PAQUETE_EXT,
+)
+from digital_envelope_receiver import cargar_claves_privadas, descifrar_password
+
+# Medicion de etapas y mensajes de progreso (modo silencioso)
+from metrics import etapa, mostrar, reportar_error
+
+
+# Constantes
+MAGIC_PAQUETE = b"SOBREPAQ"
+VERSION_PAQUETE = 1
+SIZE_NONCE_BASE = 8
+SIZE_TAG = 16
+FORMATO_PIE = ">QI"                 # posicion y largo del indice cifrado (con su tag)
+SIZE_PIE = struct.calcsize(FORMATO_PIE)
+INDICE_NONCE = 0xFFFFFFFF           # Numero de nonce reservado para el indice (los miembros usan 0, 1, 2...)
+
+
+def _cifrador(clave, nonce_base, cabecera, numero):
+    # Cifrador GCM del miembro 'numero' (o del indice). La cabecera del paquete se autentica como datos asociados
+    cifrador = AES.new(clave, AES.MODE_GCM, nonce=nonce_base + struct.pack(">I", numero), mac_len=SIZE_TAG)
+    cifrador.update(cabecera)
+    return cifrador
+
+
+def nombre_miembro(ruta, base):
+    # Nombre del miembro dentro del paquete: ruta relativa a 'base' con '/' como separador
+    return os.path.relpath(ruta, base).replace(os.sep, "/")
+
+
+def ruta_segura(destino, nombre):
+    # Ruta donde extraer un miembro. Lanza ValueError si el nombre intenta salir del directorio de destino
+    partes = nombre.split("/")
+    if not nombre or nombre.startswith("/") or any(parte in ("", ".", "..") for parte in partes):
+        raise ValueError(f"Nombre de miembro invalido: {nombre!r}")
+    return os.path.join(destino, *partes)
+
+
+def _cifrar_miembro(entrada, salida, cifrador, compresion):
+    # Cifra un miembro por bloques (comprimido si conviene) y escribe [datos cifrados][tag]
+    # Retorna (bytes originales, bytes cifrados sin el tag, identificador de compresion)
+    algoritmo = compresion
+    if algoritmo != SIN_COMPRESION:
+        muestra = entrada.read(SIZE_MUESTRA)
+        if not es_comprimible(muestra):
+            algoritmo = SIN_COMPRESION
+        entrada = LectorComprimido(entrada, crear_compresor(algoritmo) if algoritmo else None, muestra)
+
+    buffer, cifrado = bytearray(SIZE_CHUNK), bytearray(SIZE_CHUNK)
+    originales = cifrados = 0
+    with memoryview(buffer) as vista, memoryview(cifrado) as vista_cifrado:
+        while True:
+            leidos = entrada.readinto(vista)
+            if not leidos:
+                break
+            cifrador.encrypt(vista[:leidos], output=vista_cifrado[:leidos])
+            salida.write(vista_cifrado[:leidos])
+            cifrados += leidos
+            if not isinstance(entrada, LectorComprimido):
+                originales += leidos
+
+    salida.write(cifrador.digest())
+    if isinstance(entrada, LectorComprimido):
+        originales = entrada.leidos
+    return originales, cifrados, algoritmo
+
+
+def crear_paquete(rutas, ruta_clave_publica_receptor, ruta_paquete=None, compresion=None):
+    # Empaqueta los archivos de 'rutas' (archivos o directorios) en un solo paquete cifrado para los destinatarios
+    # Los miembros se nombran con su ruta relativa al directorio que los contiene
+    # Por defecto el paquete se llama como la primera ruta, con la extension .paquete
+    # El paquete se escribe en un temporal y se renombra al terminar. Retorna la ruta del paquete, o None si hubo un error
+    claves_publicas = cargar_claves_publicas(ruta_clave_publica_receptor)
+    if claves_publicas is None:
+        return None
+
+    try:
+        algoritmo = identificador_algoritmo(compresion)
+    except ValueError as error:
+        reportar_error(str(error))
+        return None
+
+    if ruta_paquete is None:
+        ruta_paquete = os.path.normpath(rutas[0]) + PAQUETE_EXT
+
+    # Cada miembro se nombra relativo al padre de la ruta indicada: "conf/" -> "conf/app/a.ini"
+    miembros = []
+    for ruta in rutas:
+        if not os.path.exists(ruta):
+            reportar_error(f"El archivo '{ruta}' no existe.")
+            return None
+        base = os.path.dirname(os.path.normpath(ruta))
+        miembros += [(archivo, nombre_miembro(archivo, base)) for archivo in recolectar_archivos([ruta])]
+
+    if not miembros:
+        reportar_error("No se encontraron archivos para empaquetar.")
+        return None
+
+    # Dos rutas pueden dar el mismo nombre (ej: "a/conf" y "b/conf"): el segundo miembro quedaria inaccesible
+    vistos = {}
+    for archivo, nombre in miembros:
+        if nombre in vistos:
+            reportar_error(f"'{archivo}' y '{vistos[nombre]}' tendrian el mismo nombre en el paquete ('{nombre}').")
+            return None
+        vistos[nombre] = archivo
+
+    # Una sola contraseña, un solo sobre RSA y una sola derivacion de clave para todo el paquete
+    mostrar(f"\nEmpaquetando {len(miembros)} archivos en {ruta_paquete}...")
+    password_aleatoria = get_random_bytes(SIZE_PASSWORD_RANDOM)
+    sobre = envolver_password(password_aleatoria, claves_publicas)
+    salt = get_random_bytes(SIZE_SALT)
+    nonce_base = get_random_bytes(SIZE_NONCE_BASE)
+    clave = derivar_clave_directa(password_aleatoria, salt)
+    cabecera = MAGIC_PAQUETE + struct.pack(">BI", VERSION_PAQUETE, len(sobre)) + sobre + salt + nonce_base
+
+    temporal = ruta_paquete + ".tmp"
+    indice = []
+    try:
+        with etapa("paquete_cifrar", formato="paquete", miembros=len(miembros)) as medicion, open(temporal, "wb") as salida:
+            salida.write(cabecera)
+            posicion = len(cabecera)
+
+            for numero, (archivo, nombre) in enumerate(miembros):
+                estado = os.stat(archivo)
+                with open(archivo, "rb") as entrada:
+                    size, largo, algoritmo_miembro = _cifrar_miembro(entrada, salida, _cifrador(clave, nonce_base, cabecera, numero),
+                                                                     algoritmo)
+                indice.append({"nombre": nombre, "size": size, "posicion": posicion, "largo": largo,
+                               "compresion": algoritmo_miembro, "mtime_ns": estado.st_mtime_ns})
+                posicion += largo + SIZE_TAG
+                medicion["bytes"] += size
+
+            # Indice cifrado al final, y el pie con su posicion
+            datos_indice, tag = _cifrador(clave, nonce_base, cabecera, INDICE_NONCE).encrypt_and_digest(
+                json.dumps(indice, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            salida.write(datos_indice + tag)
+            salida.write(struct.pack(FORMATO_PIE, posicion, len(datos_indice) + SIZE_TAG))
+
+        os.replace(temporal, ruta_paquete)
+    except OSError as error:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        reportar_error(str(error))
+        return None
+
+    mostrar(f"  Paquete creado: {ruta_paquete} ({os.path.getsize(ruta_paquete)} bytes, {len(indice)} miembros)")
+    return ruta_paquete
+
+
+class LectorPaquete:
+    # Permite listar los miembros de un paquete y extraer cualquiera de ellos sin descifrar el resto
+    # Uso:
+    #   with LectorPaquete("conf.paquete", "keys/student2_private.pem") as paquete:
+    #       nombres = [miembro["nombre"] for miembro in paquete.miembros]
+    #       datos = paquete.leer("conf/app.ini")
+    # Lanza ErrorCifrado si el paquete no es valido o no se puede abrir con las claves indicadas
+
+    def __init__(self, ruta_paquete, ruta_clave_privada=None):
+        if not os.path.isfile(ruta_paquete):
+            raise ErrorCifrado(f"El paquete '{ruta_paquete}' no existe.")
+
+        claves_privadas = cargar_claves_privadas(ruta_clave_privada)
+        if claves_privadas is None:
+            raise ErrorCifrado("No se pudieron cargar las claves privadas.")
+
+        self.ruta = ruta_paquete
+        self._archivo = open(ruta_paquete, "rb")
+        try:
+            self._abrir(claves_privadas)
+        except BaseException:
+            self._archivo.close()
+            raise
+
+    def _abrir(self, claves_privadas):
+        # Lee la cabecera, recupera la contraseña del sobre y descifra el indice
+        inicio = self._archivo.read(len(MAGIC_PAQUETE) + 5)
+        if len(inicio) != len(MAGIC_PAQUETE) + 5 or not inicio.startswith(MAGIC_PAQUETE):
+            raise ErrorCifrado("El archivo no es un paquete cifrado.")
+        version, largo_sobre = struct.unpack_from(">BI", inicio, len(MAGIC_PAQUETE))
+        if version != VERSION_PAQUETE:
+            raise ErrorCifrado(f"Version de paquete no soportada: {version}")
+
+        sobre = self._archivo.read(largo_sobre)
+        salt = self._archivo.read(SIZE_SALT)
+        self._nonce_base = self._archivo.read(SIZE_NONCE_BASE)
+        if len(sobre) != largo_sobre or len(salt) != SIZE_SALT or len(self._nonce_base) != SIZE_NONCE_BASE:
+            raise ErrorCifrado("Paquete truncado.")
+        self._cabecera = inicio + sobre + salt + self._nonce_base
+
+        password = descifrar_password(sobre, claves_privadas)
+        if password is None:
+            raise ErrorCifrado("No se pudo recuperar la contraseña del paquete.")
+        self._clave = derivar_clave_directa(password, salt)
+
+        # El pie indica donde esta el indice; si fue modificado el indice no se autentica
+        size_paquete = os.fstat(self._archivo.fileno()).st_size
+        if size_paquete < len(self._cabecera) + SIZE_TAG + SIZE_PIE:
+            raise ErrorCifrado("Paquete truncado.")
+        self._archivo.seek(size_paquete - SIZE_PIE)
+        posicion, largo = struct.unpack(FORMATO_PIE, self._archivo.read(SIZE_PIE))
+        if largo < SIZE_TAG or posicion + largo != size_paquete - SIZE_PIE:
+            raise ErrorCifrado("Paquete truncado o corrupto.")
+
+        self._archivo.seek(posicion)
+        bloque = self._archivo.read(largo)
+        try:
+            datos_indice = _cifrador(self._clave, self._nonce_base, self._cabecera, INDICE_NONCE).decrypt_and_verify(
+                bloque[:-SIZE_TAG], bloque[-SIZE_TAG:])
+        except ValueError:
+            raise ErrorCifrado("Indice del paquete corrupto o modificado.")
+
+        self.miembros = json.loads(datos_indice)
+        self._por_nombre = {miembro["nombre"]: numero for numero, miembro in enumerate(self.miembros)}
+        if len(self._por_nombre) != len(self.miembros):
+            raise ErrorCifrado("El indice del paquete tiene miembros con el mismo nombre.")
+
+    def _miembro(self, nombre):
+        if nombre not in self._por_nombre:
+            raise KeyError(f"El paquete no contiene '{nombre}'.")
+        numero = self._por_nombre[nombre]
+        return numero, self.miembros[numero]
+
+    def _descifrar_en(self, nombre, salida):
+        # Descifra el miembro por bloques en 'salida' y verifica su tag al final
+        # Lanza ErrorCifrado si el miembro fue modificado; quien llama debe descartar lo escrito
+        numero, miembro = self._miembro(nombre)
+        cifrador = _cifrador(self._clave, self._nonce_base, self._cabecera, numero)
+        escritor = EscritorDescomprimido(salida, miembro["compresion"]) if miembro["compresion"] != SIN_COMPRESION else salida
+
+        self._archivo.seek(miembro["posicion"])
+        restante = miembro["largo"]
+        buffer = bytearray(SIZE_CHUNK)
+        try:
+            with memoryview(buffer) as vista:
+                while restante:
+                    leidos = self._archivo.readinto(vista[:min(restante, SIZE_CHUNK)])
+                    if not leidos:
+                        raise ErrorCifrado(f"Paquete truncado en el miembro '{nombre}'.")
+                    escritor.write(cifrador.decrypt(vista[:leidos]))
+                    restante -= leidos
+
+            cifrador.verify(self._archivo.read(SIZE_TAG))
+            if escritor is not salida:
+                escritor.cerrar()
+        except ValueError:
+            raise ErrorCifrado(f"Miembro '{nombre}' corrupto o modificado.")
+
+    def leer(self, nombre):
+        # Retorna el contenido de un miembro, descifrando solo sus bytes
+        salida = io.BytesIO()
+        self._descifrar_en(nombre, salida)
+        return salida.getvalue()
+
+    def extraer(self, nombre, destino="."):
+        # Extrae un miembro en 'destino' (con su ruta relativa y su mtime) y retorna la ruta del archivo
+        # Se escribe en un temporal que solo se renombra si el miembro es autentico
+        ruta = ruta_segura(destino, nombre)
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        temporal = ruta + ".tmp"
+        try:
+            with open(temporal, "wb") as salida:
+                self._descifrar_en(nombre, salida)
+        except BaseException:
+            os.remove(temporal)
+            raise
+
+        os.replace(temporal, ruta)
+        mtime_ns = self.miembros[self._por_nombre[nombre]].get("mtime_ns")
+        if mtime_ns is not None:
+            os.utime(ruta, ns=(mtime_ns, mtime_ns))
+        return ruta
+
+    def cerrar(self):
+        self._archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.cerrar()
+
+
+def extraer_paquete(ruta_paquete, ruta_clave_privada=None, nombres=None, destino="."):
+    # Extrae los miembros 'nombres' (o todos) de un paquete en 'destino'
+    # Retorna la lista de rutas extraidas, o None si hubo un error
+    try:
+        with LectorPaquete(ruta_paquete, ruta_clave_privada) as paquete:
+            nombres = nombres if nombres is not None else [miembro["nombre"] for miembro in paquete.miembros]
+            with etapa("paquete_extraer", formato="paquete", miembros=len(nombres)):
+                return [paquete.extraer(nombre, destino) for nombre in nombres]
+    except (ErrorCifrado, KeyError, ValueError) as error:
+        reportar_error(error.args[0] if isinstance(error, KeyError) else str(error))
+        return None
+
+
+def listar_paquete(ruta_paquete, ruta_clave_privada=None):
+    # Retorna el indice del paquete (nombre, tamaño, algoritmo de compresion de cada miembro), o None si hubo un error
+    try:
+        with LectorPaquete(ruta_paquete, ruta_clave_privada) as paquete:
+            return [{"nombre": miembro["nombre"], "size": miembro["size"],
+                     "compresion": NOMBRES_ALGORITMOS.get(miembro["compresion"])} for miembro in paquete.miembros]
+    except ErrorCifrado as error:
+        reportar_error(str(error))
+        return None
@@ -0,0 +1,316 @@
+"""
+Servicio Residente del Sobre Digital - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+Cada ejecucion de main_rsa_envelope.py inicia Python, importa PyCryptodome y carga las claves RSA antes de cifrar
+el primer byte. Para quien envia o recibe archivos con mucha frecuencia ese costo es mayor que el del trabajo.
+Este modulo mantiene un proceso residente que atiende los trabajos por un socket Unix:
+
+'Procesos en caliente': Los trabajos se ejecutan en un pool de procesos que se crea una sola vez. Cada proceso ya
+tiene los modulos importados, las claves indicadas cargadas en su cache (ver rsa_key_manager.py) y las claves de
+sesion en memoria (ver session_keys.py).
+'Protocolo': Un trabajo JSON por linea, con el mismo formato del subcomando 'batch', y una linea JSON de resultado
+por trabajo. Un cliente puede enviar varios trabajos sin esperar: se ejecutan en paralelo y cada resultado lleva el
+"id" de su trabajo (llegan en el orden en que terminan). Los errores se reportan en el resultado, el servicio sigue.
+'Control': {"comando": "estado"} retorna las estadisticas del servicio y {"comando": "detener"} lo detiene: deja de
+recibir trabajos y termina cuando se completan los que ya recibio.
+
+Las rutas relativas de un trabajo se resuelven en "directorio_trabajo" si se indica (el cliente de 'batch --daemon'
+envia su directorio actual). El socket se crea con permisos 600: solo el usuario que inicio el servicio lo puede usar.
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import os
+import io
+import json
+import queue
+import time
+import socket
+import threading
+import socketserver
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Ejecucion de trabajos y lectura de manifiestos JSON-lines, igual que el subcomando 'batch'
+from main_rsa_envelope import ejecutar_trabajo, leer_manifiesto
+
+# Cargar las claves en la cache del proceso
+from rsa_key_manager import cargar_clave_privada, cargar_clave_publica, buscar_clave, nombre_y_tipo, KEYS_DIR
+
+# Modo silencioso en los procesos del pool
+from metrics import silencioso
+
+
+# Constantes
+SOCKET_DAEMON = os.path.join(KEYS_DIR, ".daemon.sock")
+TRABAJOS_POR_PROCESO = 4    # Trabajos en espera por proceso antes de dejar de leer del cliente
+CAMPOS_FLUJO = ("archivo", "cifrado", "salida")
+
+
+def precargar_claves(referencias):
+    # Carga las claves indicadas (rutas o nombres de host) en la cache de claves del proceso
+    # De un nombre de host se cargan la clave publica y la privada que existan
+    # Retorna la lista de rutas cargadas, o None si alguna referencia no corresponde a ninguna clave
+    cargadas = []
+    for referencia in referencias:
+        if os.path.isfile(referencia):
+            candidatos = [(referencia, nombre_y_tipo(os.path.basename(referencia))[1])]
+        else:
+            candidatos = [(buscar_clave(referencia, tipo), tipo) for tipo in ("publica", "privada")]
+
+        rutas = []
+        for ruta, tipo in candidatos:
+            if ruta is None:
+                continue
+            clave = cargar_clave_privada(ruta) if tipo == "privada" else cargar_clave_publica(ruta)
+            if clave is not None:
+                rutas.append(ruta)
+
+        if not rutas:
+            print(f"Error: No se encontro la clave '{referencia}'.")
+            return None
+        cargadas += rutas
+    return cargadas
+
+
+# Directorio del servicio, donde se ejecutan los trabajos que no indican "directorio_trabajo"
+_directorio_servicio = None
+
+
+def _iniciar_proceso(claves):
+    # Cada proceso del pool trabaja en modo silencioso y carga las claves una sola vez al iniciar
+    global _directorio_servicio
+    _directorio_servicio = os.getcwd()
+    silencioso(True)
+    precargar_claves(claves)
+
+
+def _calentar(_):
+    # Tarea vacia para iniciar los procesos del pool (y cargar sus claves) antes del primer trabajo
+    return os.getpid()
+
+
+def _ejecutar_en_proceso(trabajo):
+    # Cada proceso ejecuta un trabajo a la vez, por eso puede cambiar de directorio y capturar su salida
+    os.chdir(trabajo.pop("directorio_trabajo", None) or _directorio_servicio)
+    return ejecutar_trabajo(trabajo)
+
+
+def resultado_error(trabajo, error):
+    # Resultado de un trabajo que no se llego a ejecutar, con el mismo formato de ejecutar_trabajo()
+    resultado = {"id": trabajo["id"]} if "id" in trabajo else {}
+    resultado.update(comando=trabajo.get("comando"), ok=False, error=error, segundos=0.0)
+    return resultado
+
+
+class ManejadorDaemon(socketserver.StreamRequestHandler):
+    # Atiende una conexion: cada linea es un trabajo, y su resultado se escribe apenas termina
+    # Los resultados se escriben en un hilo propio de la conexion: el callback de cada trabajo corre en el hilo del
+    # pool que comparten todas las conexiones, por eso solo encola el resultado y nunca escribe en el socket
+
+    def handle(self):
+        servidor = self.server
+        cola = queue.Queue()
+        # Resultados de esta conexion sin escribir: si el cliente no los lee, se deja de leer trabajos de el
+        limite = servidor.procesos * TRABAJOS_POR_PROCESO
+        lugares = threading.BoundedSemaphore(limite)
+
+        def escribir():
+            # Hilo escritor: escribe los resultados en el orden en que se encolan, hasta recibir None
+            for resultado in iter(cola.get, None):
+                try:
+                    self.wfile.write((json.dumps(resultado, ensure_ascii=False) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+                except OSError:
+                    pass    # El cliente cerro la conexion, el trabajo igual se completo
+                lugares.release()
+
+        def al_terminar(futuro, trabajo):
+            servidor.espacio.release()
+            try:
+                resultado = futuro.result()
+            except Exception as error:
+                resultado = resultado_error(trabajo, f"{type(error).__name__}: {error}")
+            servidor.contar(resultado)
+            cola.put(resultado)
+
+        escritor = threading.Thread(target=escribir, daemon=True)
+        escritor.start()
+
+        try:
+            for trabajo in leer_manifiesto(io.TextIOWrapper(self.rfile, encoding="utf-8")):
+                # Cada trabajo toma un lugar, que el escritor libera al escribir su resultado
+                lugares.acquire()
+                comando = trabajo.get("comando")
+                if "_error" in trabajo:
+                    cola.put(resultado_error(trabajo, trabajo["_error"]))
+                elif comando == "estado":
+                    cola.put(servidor.estado())
+                elif comando == "detener":
+                    servidor.detener()
+                    cola.put({"comando": "detener", "ok": True})
+                    break
+                elif "-" in (trabajo.get(campo) for campo in CAMPOS_FLUJO):
+                    cola.put(resultado_error(trabajo, "El servicio no tiene entrada ni salida estandar, indique rutas de archivos."))
+                else:
+                    # Si hay muchos trabajos en espera se deja de leer del cliente hasta que termine alguno
+                    servidor.espacio.acquire()
+                    try:
+                        futuro = servidor.enviar(trabajo)
+                    except Exception as error:
+                        servidor.espacio.release()
+                        cola.put(resultado_error(trabajo, f"{type(error).__name__}: {error}"))
+                        continue
+                    futuro.add_done_callback(lambda futuro, trabajo=trabajo: al_terminar(futuro, trabajo))
+        finally:
+            # El cliente termino de enviar: se espera a que todos sus resultados se escriban antes de cerrar la conexion
+            for _ in range(limite):
+                lugares.acquire()
+            cola.put(None)
+            escritor.join()
+
+
+class ServidorDaemon(socketserver.ThreadingUnixStreamServer):
+    # Un hilo por conexion; los trabajos de todas las conexiones comparten el pool de procesos
+
+    daemon_threads = True
+
+    def __init__(self, ruta_socket, procesos, claves):
+        self.ruta_socket = ruta_socket
+        self.procesos = procesos
+        self.claves = claves
+        self.espacio = threading.BoundedSemaphore(procesos * TRABAJOS_POR_PROCESO)
+        self.inicio = time.monotonic()
+        self.trabajos = 0
+        self.errores = 0
+        self.deteniendo = False
+        self._lock = threading.Lock()
+        self.pool = self._crear_pool()
+
+        # El socket se crea sin permisos para otros usuarios (umask), no solo despues con chmod
+        mascara = os.umask(0o177)
+        try:
+            super().__init__(ruta_socket, ManejadorDaemon)
+        except BaseException:
+            # El calentamiento ya termino: no quedan trabajos pendientes en el pool
+            self.pool.shutdown()
+            raise
+        finally:
+            os.umask(mascara)
+
+    def _crear_pool(self):
+        # Los procesos se inician de inmediato, para que el primer trabajo no pague el inicio ni la carga de claves
+        pool = ProcessPoolExecutor(max_workers=self.procesos, initializer=_iniciar_proceso, initargs=(self.claves,))
+        list(pool.map(_calentar, range(self.procesos)))
+        return pool
+
+    def enviar(self, trabajo):
+        # Envia el trabajo al pool y retorna su Future
+        # Lanza RuntimeError si el servicio se esta deteniendo
+        with self._lock:
+            if self.deteniendo:
+                raise RuntimeError("El servicio se esta deteniendo, no recibe trabajos nuevos.")
+            try:
+                return self.pool.submit(_ejecutar_en_proceso, trabajo)
+            except BrokenProcessPool:
+                # Un proceso termino de forma inesperada (ej: sin memoria): se crea un pool nuevo
+                self.pool.shutdown(wait=False)
+                self.pool = self._crear_pool()
+                return self.pool.submit(_ejecutar_en_proceso, trabajo)
+
+    def contar(self, resultado):
+        with self._lock:
+            self.trabajos += 1
+            self.errores += not resultado["ok"]
+
+    def estado(self):
+        with self._lock:
+            return {"comando": "estado", "ok": True, "procesos": self.procesos, "claves": self.claves,
+                    "trabajos": self.trabajos, "errores": self.errores,
+                    "segundos_activo": time.monotonic() - self.inicio}
+
+    def detener(self):
+        # Deja de recibir trabajos y detiene serve_forever() desde otro hilo (llamarlo desde el hilo de una conexion)
+        with self._lock:
+            self.deteniendo = True
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def cerrar(self):
+        # Deja de recibir trabajos y espera los que ya fueron recibidos (en curso o en espera), cuyos resultados
+        # se envian a sus clientes. Luego cierra el socket, termina el pool y borra el archivo del socket
+        with self._lock:
+            self.deteniendo = True
+        self.server_close()
+        self.pool.shutdown(wait=True)
+        if os.path.exists(self.ruta_socket):
+            os.remove(self.ruta_socket)
+
+
+def socket_activo(ruta_socket):
+    # Retorna True si hay un servicio atendiendo en el socket
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as cliente:
+        try:
+            cliente.connect(ruta_socket)
+            return True
+        except OSError:
+            return False
+
+
+def crear_daemon(ruta_socket=None, procesos=None, claves=()):
+    # Crea el servicio residente en 'ruta_socket' con 'procesos' procesos y las claves indicadas ya cargadas
+    # Retorna el servidor (usar serve_forever() y luego cerrar()), o None si hubo un error
+    ruta_socket = ruta_socket or SOCKET_DAEMON
+    procesos = procesos or os.cpu_count() or 1
+
+    # Las claves se cargan primero aqui, para reportar una clave invalida antes de iniciar el servicio
+    claves = precargar_claves(list(claves))
+    if claves is None:
+        return None
+    claves = [os.path.abspath(ruta) for ruta in claves]
+
+    if os.path.exists(ruta_socket):
+        if socket_activo(ruta_socket):
+            print(f"Error: Ya hay un servicio atendiendo en '{ruta_socket}'.")
+            return None
+        os.remove(ruta_socket)      # Socket de un servicio anterior que no se cerro bien
+    os.makedirs(os.path.dirname(ruta_socket) or ".", mode=0o700, exist_ok=True)
+
+    try:
+        return ServidorDaemon(ruta_socket, procesos, claves)
+    except OSError as error:
+        print(f"Error: {error}")
+        return None
+
+
+def enviar_trabajos(trabajos, ruta_socket=None):
+    # Cliente: envia los trabajos al servicio y genera sus resultados a medida que llegan (en el orden en que terminan)
+    # A cada trabajo se le agrega el directorio actual, para que sus rutas relativas sean las del cliente
+    # Lanza OSError si no hay un servicio atendiendo en el socket
+    cliente = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    cliente.connect(ruta_socket or SOCKET_DAEMON)
+    directorio = os.getcwd()
+
+    def escribir():
+        # Los trabajos se envian desde otro hilo, mientras este lee los resultados (sin bloquearse entre si)
+        try:
+            with cliente.makefile("w", encoding="utf-8") as salida:
+                for trabajo in trabajos:
+                    trabajo.setdefault("directorio_trabajo", directorio)
+                    salida.write(json.dumps(trabajo, ensure_ascii=False) + "\n")
+            cliente.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    escritor = threading.Thread(target=escribir, daemon=True)
+    escritor.start()
+    try:
+        with cliente.makefile("r", encoding="utf-8") as entrada:
+            for linea in entrada:
+                yield json.loads(linea)
+    finally:
+        escritor.join()
+        cliente.close()
@@ -0,0 +1,156 @@
+"""
+Formato del Sobre Digital - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+Este modulo define la estructura binaria del archivo .envelope, para que el emisor y el receptor
+la escriban y la lean de la misma manera.
+
+Existen dos formatos:
+'Legado': El sobre contiene unicamente la contraseña AES cifrada con RSA (384 bytes para RSA 3072 bits).
+Ya no se genera, pero se sigue leyendo.
+'Versionado': El sobre empieza con una cabecera y contiene una entrada por cada destinatario (uno o varios), cada una
+etiquetada con la huella (SHA-256) de la clave publica con la que se cifro. Asi el receptor elige directamente
+la entrada y la clave privada que le corresponden, sin intentar descifrar con RSA con cada una de sus claves.
+
+[MAGIC (8 bytes)][version (1 byte)][tipo (1 byte)][N destinatarios (2 bytes)]
+N veces: [huella (32 bytes)][largo (2 bytes)][contraseña AES cifrada con RSA (largo bytes)]
+
+'Sesion': Igual al versionado, pero cada entrada lleva la clave de sesion cifrada con RSA, y despues de la cabecera
+van el identificador de la sesion y el nonce del archivo, con los que se deriva su contraseña (ver session_keys.py):
+
+[MAGIC (8 bytes)][version (1 byte)][tipo (1 byte)][N destinatarios (2 bytes)][id sesion (16 bytes)][nonce (16 bytes)]
+N veces: [huella (32 bytes)][largo (2 bytes)][clave de sesion cifrada con RSA (largo bytes)]
+
+Tambien se define el 'contenedor': un solo archivo con el sobre seguido del archivo cifrado (.enc), para enviar
+un archivo en lugar de dos. Se escribe en una sola pasada y el receptor lo abre con una sola apertura:
+
+[MAGIC (8 bytes)][version (1 byte)][largo del sobre (4 bytes)][sobre (largo bytes)][archivo .enc completo]
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import struct
+
+
+# Constantes
+MAGIC_SOBRE = b"SOBREDIG"
+VERSION_SOBRE = 2
+SIZE_HUELLA = 32    # SHA-256 de la clave publica en formato DER
+SIZE_ID_SESION = 16
+SIZE_NONCE_SESION = 16
+
+MAGIC_CONTENEDOR = b"SOBRECNT"
+VERSION_CONTENEDOR = 1
+FORMATO_CONTENEDOR = ">BI"     # version, largo del sobre
+SIZE_CABECERA_CONTENEDOR = len(MAGIC_CONTENEDOR) + struct.calcsize(FORMATO_CONTENEDOR)
+
+# Tipos de sobre
+TIPO_LEGADO = 0          # Sobre sin cabecera (un solo destinatario, sin huella)
+TIPO_DESTINATARIOS = 1   # Una entrada por destinatario, etiquetada con su huella
+TIPO_SESION = 2          # Como TIPO_DESTINATARIOS, con la clave de sesion y el nonce del archivo
+
+
+def crear_sobre_destinatarios(entradas, sesion=None):
+    # Construye el contenido de un sobre versionado
+    # 'entradas' es una lista de tuplas (huella, contraseña_cifrada_rsa), una por destinatario
+    # Con 'sesion' = (id_sesion, nonce) se construye un sobre de sesion y cada entrada lleva la clave de sesion cifrada
+    tipo = TIPO_DESTINATARIOS if sesion is None else TIPO_SESION
+    partes = [MAGIC_SOBRE, struct.pack(">BBH", VERSION_SOBRE, tipo, len(entradas))]
+    if sesion is not None:
+        partes += sesion
+
+    for huella, clave_cifrada in entradas:
+        partes.append(huella)
+        partes.append(struct.pack(">H", len(clave_cifrada)))
+        partes.append(clave_cifrada)
+
+    return b"".join(partes)
+
+
+def leer_sobre(contenido):
+    # Interpreta el contenido de un archivo .envelope y retorna (tipo, entradas)
+    # 'entradas' es una lista de tuplas (huella, contraseña_cifrada_rsa). En un sobre legado la huella es None
+    # Lanza ValueError si la cabecera esta incompleta o la version no es soportada
+    if not contenido.startswith(MAGIC_SOBRE):
+        return TIPO_LEGADO, [(None, contenido)]
+
+    posicion = len(MAGIC_SOBRE)
+    if len(contenido) < posicion + 4:
+        raise ValueError("Cabecera del sobre incompleta.")
+
+    version, tipo, cantidad = struct.unpack_from(">BBH", contenido, posicion)
+    posicion += 4
+
+    if version != VERSION_SOBRE or tipo not in (TIPO_DESTINATARIOS, TIPO_SESION):
+        raise ValueError(f"Version de sobre no soportada: {version}")
+
+    if tipo == TIPO_SESION:
+        # El identificador de la sesion y el nonce se leen con leer_sesion()
+        posicion += SIZE_ID_SESION + SIZE_NONCE_SESION
+
+    entradas = []
+    for _ in range(cantidad):
+        if len(contenido) < posicion + SIZE_HUELLA + 2:
+            raise ValueError("Sobre digital truncado.")
+
+        huella = contenido[posicion:posicion + SIZE_HUELLA]
+        (largo,) = struct.unpack_from(">H", contenido, posicion + SIZE_HUELLA)
+        posicion += SIZE_HUELLA + 2
+
+        clave_cifrada = contenido[posicion:posicion + largo]
+        if len(clave_cifrada) != largo:
+            raise ValueError("Sobre digital truncado.")
+        posicion += largo
+
+        entradas.append((huella, clave_cifrada))
+
+    return tipo, entradas
+
+
+def leer_sesion(contenido):
+    # Retorna (id_sesion, nonce) de un sobre de sesion, o None si el sobre no es de sesion
+    # Lanza ValueError si la cabecera esta incompleta o la version no es soportada
+    if not contenido.startswith(MAGIC_SOBRE):
+        return None
+
+    posicion = len(MAGIC_SOBRE)
+    if len(contenido) < posicion + 4:
+        raise ValueError("Cabecera del sobre incompleta.")
+
+    version, tipo, _ = struct.unpack_from(">BBH", contenido, posicion)
+    if version != VERSION_SOBRE:
+        raise ValueError(f"Version de sobre no soportada: {version}")
+    if tipo != TIPO_SESION:
+        return None
+
+    posicion += 4
+    if len(contenido) < posicion + SIZE_ID_SESION + SIZE_NONCE_SESION:
+        raise ValueError("Cabecera del sobre incompleta.")
+    return contenido[posicion:posicion + SIZE_ID_SESION], contenido[posicion + SIZE_ID_SESION:posicion + SIZE_ID_SESION + SIZE_NONCE_SESION]
+
+
+def crear_cabecera_contenedor(sobre):
+    # Cabecera del contenedor seguida del sobre, lo que se escribe antes del archivo cifrado
+    return MAGIC_CONTENEDOR + struct.pack(FORMATO_CONTENEDOR, VERSION_CONTENEDOR, len(sobre)) + sobre
+
+
+def leer_cabecera_contenedor(entrada):
+    # Lee la cabecera del contenedor desde un archivo abierto y retorna el contenido del sobre
+    # Al terminar, 'entrada' queda posicionada al inicio del archivo cifrado
+    # Lanza ValueError si no es un contenedor o esta truncado
+    cabecera = entrada.read(SIZE_CABECERA_CONTENEDOR)
+    if len(cabecera) != SIZE_CABECERA_CONTENEDOR or not cabecera.startswith(MAGIC_CONTENEDOR):
+        raise ValueError("El archivo no es un contenedor de sobre digital.")
+
+    version, largo = struct.unpack_from(FORMATO_CONTENEDOR, cabecera, len(MAGIC_CONTENEDOR))
+    if version != VERSION_CONTENEDOR:
+        raise ValueError(f"Version de contenedor no soportada: {version}")
+
+    sobre = entrada.read(largo)
+    if len(sobre) != largo:
+        raise ValueError("Contenedor truncado.")
+
+    return sobre
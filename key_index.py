@@ -0,0 +1,170 @@
+"""
+Indice de Claves RSA - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+Este modulo guarda un indice persistente (SQLite) de las claves del directorio keys/, para no tener que listar,
+ordenar y filtrar el directorio completo en cada envio o recepcion cuando hay miles de claves.
+
+Por cada archivo .pem se guarda el nombre del host, el tipo (publica o privada), la huella SHA-256 de la clave
+publica, el tamaño en bits y el mtime del archivo. Las busquedas por nombre o por huella usan indices de SQLite,
+y el listado se hace por paginas.
+
+El indice se guarda en keys/.indice/ (y no directamente en keys/) para que los archivos temporales de SQLite no
+modifiquen el directorio de claves: asi el mtime de keys/ solo cambia cuando se agregan o borran claves, y con un
+solo stat() se puede saber si hay claves nuevas. Una clave reescrita en el mismo archivo se detecta por el mtime y el
+tamaño de ese archivo (ver rsa_key_manager.py).
+
+Este modulo solo se encarga del almacenamiento. Calcular la huella y recorrer el directorio lo hace rsa_key_manager.py.
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import os
+import sqlite3
+import threading
+
+
+# Constantes
+DIRECTORIO_INDICE = ".indice"
+ARCHIVO_INDICE = "claves.sqlite3"
+POR_PAGINA = 50
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS claves (
+    archivo TEXT PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    huella BLOB,
+    bits INTEGER,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS claves_nombre ON claves (nombre, tipo);
+CREATE INDEX IF NOT EXISTS claves_huella ON claves (huella, tipo);
+CREATE TABLE IF NOT EXISTS meta (
+    clave TEXT PRIMARY KEY,
+    valor INTEGER
+);
+"""
+
+# Una conexion por hilo y por directorio de claves (sqlite3 no permite compartir conexiones entre hilos)
+_conexiones = threading.local()
+
+
+def ruta_indice(directorio):
+    # Ruta del archivo SQLite del indice de un directorio de claves
+    return os.path.join(directorio, DIRECTORIO_INDICE, ARCHIVO_INDICE)
+
+
+def conectar(directorio):
+    # Retorna la conexion al indice del directorio, creandolo si no existe (directorio del indice con permisos 700)
+    ruta = os.path.abspath(ruta_indice(directorio))
+    conexiones = getattr(_conexiones, "por_ruta", None)
+    if conexiones is None:
+        conexiones = _conexiones.por_ruta = {}
+
+    conexion = conexiones.get(ruta)
+    if conexion is None or not os.path.isfile(ruta):
+        os.makedirs(os.path.dirname(ruta), mode=0o700, exist_ok=True)
+        nuevo = not os.path.isfile(ruta)
+        conexion = sqlite3.connect(ruta)
+        if nuevo:
+            os.chmod(ruta, 0o600)
+        conexion.row_factory = sqlite3.Row
+        conexion.executescript(ESQUEMA)
+        conexiones[ruta] = conexion
+
+    return conexion
+
+
+def cerrar(directorio=None):
+    # Cierra las conexiones de este hilo (todas, o solo la del directorio indicado)
+    conexiones = getattr(_conexiones, "por_ruta", {})
+    for ruta in list(conexiones):
+        if directorio is None or ruta == os.path.abspath(ruta_indice(directorio)):
+            conexiones.pop(ruta).close()
+
+
+def leer_meta(directorio, clave):
+    fila = conectar(directorio).execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+    return fila["valor"] if fila is not None else None
+
+
+def guardar_meta(directorio, clave, valor):
+    conexion = conectar(directorio)
+    with conexion:
+        conexion.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)", (clave, valor))
+
+
+def registrar(directorio, filas):
+    # Agrega o actualiza entradas en una sola transaccion
+    # Cada fila es (archivo, nombre, tipo, huella, bits, mtime_ns, size), 'archivo' es el nombre del archivo dentro del directorio
+    conexion = conectar(directorio)
+    with conexion:
+        conexion.executemany(
+            "INSERT OR REPLACE INTO claves (archivo, nombre, tipo, huella, bits, mtime_ns, size) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            filas,
+        )
+
+
+def quitar(directorio, archivos):
+    # Elimina las entradas de una lista de archivos de clave en una sola transaccion
+    conexion = conectar(directorio)
+    with conexion:
+        conexion.executemany("DELETE FROM claves WHERE archivo = ?", [(archivo,) for archivo in archivos])
+
+
+def entradas(directorio):
+    # Retorna {archivo: (mtime_ns, size)} de todas las entradas, para comparar con el directorio al sincronizar
+    filas = conectar(directorio).execute("SELECT archivo, mtime_ns, size FROM claves")
+    return {fila["archivo"]: (fila["mtime_ns"], fila["size"]) for fila in filas}
+
+
+def estado_entrada(directorio, archivo):
+    # Retorna (mtime_ns, size) guardados para un archivo de clave, o None si no esta en el indice
+    fila = conectar(directorio).execute("SELECT mtime_ns, size FROM claves WHERE archivo = ?", (archivo,)).fetchone()
+    return (fila["mtime_ns"], fila["size"]) if fila is not None else None
+
+
+def buscar_nombre(directorio, nombre, tipo):
+    # Retorna el archivo de la clave del host 'nombre' del tipo indicado ("publica" o "privada"), o None
+    fila = conectar(directorio).execute(
+        "SELECT archivo FROM claves WHERE nombre = ? AND tipo = ? ORDER BY archivo LIMIT 1", (nombre, tipo)
+    ).fetchone()
+    return fila["archivo"] if fila is not None else None
+
+
+def buscar_huella(directorio, huella, tipo):
+    # Retorna el archivo de la clave con la huella indicada (32 bytes) del tipo indicado, o None
+    fila = conectar(directorio).execute(
+        "SELECT archivo FROM claves WHERE huella = ? AND tipo = ? ORDER BY archivo LIMIT 1", (huella, tipo)
+    ).fetchone()
+    return fila["archivo"] if fila is not None else None
+
+
+def listar(directorio, tipo=None, pagina=0, por_pagina=None):
+    # Retorna las entradas ordenadas por nombre de archivo como diccionarios, opcionalmente filtradas por tipo
+    # Con 'por_pagina' se retorna solo la pagina indicada (la primera es la 0)
+    consulta = "SELECT * FROM claves"
+    parametros = []
+    if tipo is not None:
+        consulta += " WHERE tipo = ?"
+        parametros.append(tipo)
+    consulta += " ORDER BY archivo"
+    if por_pagina is not None:
+        consulta += " LIMIT ? OFFSET ?"
+        parametros += [por_pagina, pagina * por_pagina]
+
+    return [dict(fila) for fila in conectar(directorio).execute(consulta, parametros)]
+
+
+def contar(directorio, tipo=None):
+    # Cantidad de claves en el indice, opcionalmente de un solo tipo
+    if tipo is None:
+        fila = conectar(directorio).execute("SELECT COUNT(*) FROM claves").fetchone()
+    else:
+        fila = conectar(directorio).execute("SELECT COUNT(*) FROM claves WHERE tipo = ?", (tipo,)).fetchone()
+    return fila[0]
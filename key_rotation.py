@@ -0,0 +1,303 @@
+"""
+Rotacion de Claves RSA - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+Cuando la clave RSA de un host cambia, los archivos que se le enviaron se pueden seguir abriendo sin cifrarlos de
+nuevo: el archivo .enc esta cifrado con una contraseña AES aleatoria, y solo el sobre (.envelope) depende de la
+clave RSA. Este modulo "re-envuelve" cada sobre: descifra la contraseña AES de 32 bytes con la clave privada
+antigua y la cifra con la clave publica nueva, sin leer ni modificar los archivos .enc.
+
+'Paralelo': Los sobres se reparten entre un pool de procesos. Las claves se cargan una sola vez en cada proceso.
+'Checkpoint': Cada sobre terminado se registra en un archivo JSON-lines, si la rotacion se interrumpe la siguiente
+ejecucion continua donde quedo. Ademas un sobre que ya fue rotado se reconoce por sus huellas y no se modifica.
+'Escritura atomica': El nuevo sobre se escribe en un archivo temporal y reemplaza al anterior con os.replace(),
+por lo que un sobre nunca queda a medias aunque el proceso se detenga.
+
+Las entradas de otros destinatarios del mismo sobre se conservan, y en los sobres de sesion se re-envuelve la clave
+de sesion una sola vez: todos los sobres de la sesion reciben las mismas entradas nuevas. Los contenedores (.sobre) no se rotan: el sobre esta al inicio del archivo y cambiarlo de forma atomica
+implicaria copiar todo el archivo cifrado.
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Crypto.PublicKey import RSA       # Para reconstruir las claves en los procesos del pool
+
+# Cargar las claves (por ruta o por nombre de host) y calcular su huella
+from rsa_key_manager import cargar_clave_privada, cargar_clave_publica, huella_clave
+
+# Formato del sobre digital
+from envelope_format import leer_sobre, leer_sesion, crear_sobre_destinatarios, MAGIC_SOBRE, SIZE_ID_SESION, SIZE_NONCE_SESION
+
+# Contexto RSA-OAEP reutilizable, y tamaño minimo de lote para usar procesos
+from rsa_cipher import ContextoRSA, MIN_LOTE_PARALELO
+
+# Extension de los sobres
+from digital_envelope_sender import ENVELOPE_EXT
+
+# Mensajes de progreso (modo silencioso)
+from metrics import mostrar, reportar_error
+
+
+# Constantes
+SIZE_CABECERA_SESION = len(MAGIC_SOBRE) + 4 + SIZE_ID_SESION + SIZE_NONCE_SESION    # Cabecera del sobre hasta el nonce
+
+# Claves de cada proceso del pool, se cargan una sola vez en _iniciar_proceso
+_claves_proceso = None
+
+
+def preparar_claves(antiguas, nuevas):
+    # Construye las claves que usa rotar_sobre() a partir de claves RSA ya cargadas:
+    # ({huella: ContextoRSA} de las claves privadas antiguas, [(huella, ContextoRSA)] de las claves publicas nuevas)
+    anillo = {huella_clave(clave): ContextoRSA(clave) for clave in antiguas}
+    destinos = [(huella_clave(clave), ContextoRSA(clave)) for clave in nuevas]
+    return anillo, destinos
+
+
+def _iniciar_proceso(antiguas_der, nuevas_der):
+    global _claves_proceso
+    _claves_proceso = preparar_claves([RSA.import_key(der) for der in antiguas_der], [RSA.import_key(der) for der in nuevas_der])
+
+
+def _rotar_en_proceso(rutas, sesiones):
+    # Rota un lote de sobres con las claves del proceso y retorna (resultados, sesiones re-envueltas)
+    return [rotar_sobre(ruta, *_claves_proceso, sesiones) for ruta in rutas], sesiones
+
+
+def escribir_atomico(ruta, contenido):
+    # Escribe 'contenido' en un temporal del mismo directorio y reemplaza 'ruta' de forma atomica (mismos permisos)
+    temporal = ruta + ".tmp"
+    with open(temporal, "wb") as archivo:
+        archivo.write(contenido)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.chmod(temporal, os.stat(ruta).st_mode & 0o777)
+    os.replace(temporal, ruta)
+
+
+def rotar_sobre(ruta_sobre, anillo, destinos, sesiones=None):
+    # Re-envuelve la contraseña AES de un sobre: la descifra con la clave antigua ('anillo') y la cifra con las
+    # claves nuevas ('destinos'), ver preparar_claves(). El archivo cifrado no se toca
+    # 'sesiones' ({id_sesion: (entradas antiguas, entradas nuevas)}) guarda las sesiones ya re-envueltas: los demas
+    # sobres de la sesion reciben las mismas entradas, asi el receptor sigue abriendo la sesion con una sola
+    # operacion RSA (cada cifrado RSA-OAEP es distinto, y la cache del receptor se consulta por entrada cifrada)
+    # Nunca lanza excepciones: retorna un diccionario con el resultado ("rotado", "ya rotado" o el error)
+    resultado = {"archivo": ruta_sobre, "ok": False, "estado": None, "error": None}
+
+    try:
+        with open(ruta_sobre, "rb") as archivo:
+            contenido = archivo.read()
+        _, entradas = leer_sobre(contenido)
+        sesion = leer_sesion(contenido)     # En un sobre de sesion se re-envuelve la clave de sesion
+
+        previa = sesiones.get(sesion[0]) if sesiones is not None and sesion is not None else None
+        if previa is not None and previa[0] == entradas:
+            # Otro sobre de la misma sesion ya se re-envolvio: se reutilizan sus entradas, sin operaciones RSA
+            escribir_atomico(ruta_sobre, crear_sobre_destinatarios(previa[1], sesion))
+            resultado.update(ok=True, estado="rotado")
+            return resultado
+
+        password = None
+        conservar = []
+        for huella, password_cifrada in entradas:
+            if huella is None:
+                # Sobre legado (sin huella): se prueba con cada clave antigua
+                for contexto in anillo.values():
+                    password = contexto.descifrar(password_cifrada)
+                    if password is not None:
+                        break
+            elif huella in anillo:
+                if password is None:
+                    password = anillo[huella].descifrar(password_cifrada)
+            else:
+                conservar.append((huella, password_cifrada))
+
+        huellas_nuevas = {huella for huella, _ in destinos}
+        if password is None:
+            if huellas_nuevas <= {huella for huella, _ in conservar}:
+                resultado.update(ok=True, estado="ya rotado")
+            else:
+                resultado["error"] = "El sobre no tiene una entrada que se pueda abrir con la clave antigua."
+            return resultado
+
+        # Las entradas de otros destinatarios se conservan; las de las claves nuevas se reemplazan
+        nuevas_entradas = [(huella, cifrada) for huella, cifrada in conservar if huella not in huellas_nuevas]
+        nuevas_entradas += [(huella, contexto.cifrar(password)) for huella, contexto in destinos]
+        if sesiones is not None and sesion is not None:
+            sesiones[sesion[0]] = (entradas, nuevas_entradas)
+
+        escribir_atomico(ruta_sobre, crear_sobre_destinatarios(nuevas_entradas, sesion))
+        resultado.update(ok=True, estado="rotado")
+    except Exception as error:
+        resultado["error"] = f"{type(error).__name__}: {error}"
+
+    return resultado
+
+
+def leer_id_sesion(ruta_sobre):
+    # Lee solo la cabecera del sobre y retorna el identificador de su sesion, o None si no es un sobre de sesion
+    # Un sobre que no se puede leer retorna None: el error se informa despues, al rotarlo
+    try:
+        with open(ruta_sobre, "rb") as archivo:
+            sesion = leer_sesion(archivo.read(SIZE_CABECERA_SESION))
+    except (OSError, ValueError):
+        return None
+    return sesion[0] if sesion is not None else None
+
+
+def _lotes(rutas, procesos):
+    # Divide las rutas en lotes, para no pagar la comunicacion entre procesos por cada sobre
+    tamano_lote = max(1, min(256, len(rutas) // (procesos * 4)))
+    return [rutas[indice:indice + tamano_lote] for indice in range(0, len(rutas), tamano_lote)]
+
+
+def _rotar_en_pool(pool, pendientes, procesos, futuros):
+    # Rota los sobres en el pool y genera sus resultados, en dos fases:
+    # 1. El primer sobre de cada sesion (y los sobres sin sesion): la clave de sesion se re-envuelve una sola vez
+    # 2. El resto de los sobres de cada sesion, que reciben las entradas ya re-envueltas de su sesion
+    # Los futuros se agregan a 'futuros', para que quien llama pueda cancelarlos si la rotacion se interrumpe
+    ids = {ruta: leer_id_sesion(ruta) for ruta in pendientes}
+    primeros = {}
+    for ruta in pendientes:
+        if ids[ruta] is not None:
+            primeros.setdefault(ids[ruta], ruta)
+    iniciales = set(primeros.values())
+    fase_1 = [ruta for ruta in pendientes if ids[ruta] is None or ruta in iniciales]
+    fase_2 = [ruta for ruta in pendientes if ids[ruta] is not None and ruta not in iniciales]
+
+    sesiones = {}
+    lotes = [pool.submit(_rotar_en_proceso, lote, {}) for lote in _lotes(fase_1, procesos)]
+    futuros += lotes
+    for futuro in lotes:
+        resultados, nuevas = futuro.result()
+        sesiones.update(nuevas)
+        yield from resultados
+
+    lotes = [pool.submit(_rotar_en_proceso, lote, {ids[ruta]: sesiones[ids[ruta]] for ruta in lote if ids[ruta] in sesiones})
+             for lote in _lotes(fase_2, procesos)]
+    futuros += lotes
+    for futuro in lotes:
+        yield from futuro.result()[0]
+
+
+def recolectar_sobres(rutas):
+    # Expande la lista de rutas: en los directorios se buscan los .envelope, los archivos se toman tal cual
+    # Las rutas se retornan absolutas, para que el checkpoint sirva aunque se ejecute desde otro directorio
+    sobres = []
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            for raiz, _, nombres in os.walk(ruta):
+                sobres += [os.path.abspath(os.path.join(raiz, nombre)) for nombre in sorted(nombres) if nombre.endswith(ENVELOPE_EXT)]
+        else:
+            sobres.append(os.path.abspath(ruta))
+    return sobres
+
+
+def leer_checkpoint(ruta_checkpoint):
+    # Retorna el conjunto de sobres que ya se terminaron en una ejecucion anterior
+    terminados = set()
+    if not os.path.isfile(ruta_checkpoint):
+        return terminados
+
+    with open(ruta_checkpoint) as archivo:
+        for linea in archivo:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue    # Ultima linea incompleta si el proceso se detuvo mientras escribia
+            if registro.get("ok"):
+                terminados.add(registro["archivo"])
+    return terminados
+
+
+def rotar_sobres(rutas, ruta_clave_privada_antigua, ruta_clave_publica_nueva, procesos=None, ruta_checkpoint=None):
+    # Rota la clave de todos los sobres de 'rutas' (archivos .envelope o directorios)
+    # Las claves pueden ser una ruta o nombre de host, o una lista de ellos (ej: varias claves antiguas)
+    # Por defecto el checkpoint es .rotacion_<huella antigua>_<huella nueva>.jsonl en el directorio que se rota
+    # (o en el del primer sobre), asi no depende del directorio desde el que se ejecute
+    # Retorna la lista de resultados por sobre y un resumen, o (None, None) si las claves no se pudieron cargar
+    antiguas = ruta_clave_privada_antigua if isinstance(ruta_clave_privada_antigua, (list, tuple)) else [ruta_clave_privada_antigua]
+    nuevas = ruta_clave_publica_nueva if isinstance(ruta_clave_publica_nueva, (list, tuple)) else [ruta_clave_publica_nueva]
+
+    claves_antiguas = [cargar_clave_privada(ruta) for ruta in antiguas]
+    claves_nuevas = [cargar_clave_publica(ruta) for ruta in nuevas]
+    if not claves_antiguas or not claves_nuevas or any(clave is None for clave in claves_antiguas + claves_nuevas):
+        reportar_error("Debe indicar las claves privadas antiguas y las claves publicas nuevas.")
+        return None, None
+
+    sobres = recolectar_sobres(rutas)
+
+    if ruta_checkpoint is None:
+        base = rutas[0] if rutas and os.path.isdir(rutas[0]) else os.path.dirname(sobres[0]) if sobres else "."
+        nombre = f".rotacion_{huella_clave(claves_antiguas[0])[:4].hex()}_{huella_clave(claves_nuevas[0])[:4].hex()}.jsonl"
+        ruta_checkpoint = os.path.join(base, nombre)
+
+    terminados = leer_checkpoint(ruta_checkpoint)
+    pendientes = [ruta for ruta in sobres if ruta not in terminados]
+    procesos = procesos or os.cpu_count() or 1
+
+    mostrar(f"\nRotando {len(pendientes)} sobres ({len(sobres) - len(pendientes)} ya terminados segun {ruta_checkpoint})...")
+
+    inicio = time.perf_counter()
+    resultados = []
+    with open(ruta_checkpoint, "a") as checkpoint:
+        if procesos == 1 or len(pendientes) < MIN_LOTE_PARALELO:
+            claves = preparar_claves(claves_antiguas, claves_nuevas)
+            sesiones = {}
+            iterador = (rotar_sobre(ruta, *claves, sesiones) for ruta in pendientes)
+            pool = None
+        else:
+            # Las claves viajan a cada proceso una sola vez (en formato DER), no con cada sobre
+            pool = ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso,
+                                       initargs=([clave.export_key("DER") for clave in claves_antiguas],
+                                                 [clave.export_key("DER") for clave in claves_nuevas]))
+            futuros = []
+            iterador = _rotar_en_pool(pool, pendientes, procesos, futuros)
+
+        try:
+            for resultado in iterador:
+                resultados.append(resultado)
+                checkpoint.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+                checkpoint.flush()
+
+                if not resultado["ok"]:
+                    print(f"  [ERROR] {resultado['archivo']}: {resultado['error']}")
+        finally:
+            if pool is not None:
+                # Si la rotacion se interrumpe, los lotes que aun no empiezan se cancelan a mano
+                # (Executor.shutdown(cancel_futures=True) requiere Python 3.9)
+                for futuro in futuros:
+                    futuro.cancel()
+                pool.shutdown()
+
+    segundos = time.perf_counter() - inicio
+    rotados = sum(1 for r in resultados if r["estado"] == "rotado")
+    fallidos = sum(1 for r in resultados if not r["ok"])
+
+    resumen = {
+        "sobres": len(sobres),
+        "rotados": rotados,
+        "ya_rotados": len(resultados) - rotados - fallidos,
+        "omitidos": len(sobres) - len(pendientes),
+        "fallidos": fallidos,
+        "segundos": segundos,
+        "sobres_por_segundo": len(resultados) / segundos if segundos > 0 else 0.0,
+        "checkpoint": ruta_checkpoint,
+    }
+
+    print(f"\n{'=' * 60}")
+    print("  ROTACION DE CLAVES FINALIZADA")
+    print(f"{'=' * 60}")
+    print(f"  Sobres: {resumen['sobres']} ({resumen['rotados']} rotados, {resumen['ya_rotados']} ya rotados, "
+          f"{resumen['omitidos']} omitidos por el checkpoint, {resumen['fallidos']} con error)")
+    print(f"  Tiempo: {resumen['segundos']:.2f} s ({resumen['sobres_por_segundo']:.1f} sobres/s)")
+    print(f"{'=' * 60}")
+
+    return resultados, resumen
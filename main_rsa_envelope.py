@@ -5,6 +5,37 @@ Universidad de los Andes
 ===================================================
 Programa principal con menu (CLI) para generar claves RSA, enviar archivos (crear sobre digital) y recibir archivos (abrir sobre digital).
 
+Sin argumentos se muestra el menu interactivo. Con argumentos funciona sin preguntas (para scripts) mediante subcomandos:
+    python main_rsa_envelope.py keygen student1 student2
+    python main_rsa_envelope.py keygen student3 --pool          (toma un par ya generado de keys/.pool/)
+    python main_rsa_envelope.py send archivo.txt --clave keys/student2_public.pem
+    python main_rsa_envelope.py send archivo.txt --clave student2          (nombre del host, se busca en el indice)
+    python main_rsa_envelope.py receive archivo.txt.enc archivo.txt.envelope --clave keys/student2_private.pem
+    python main_rsa_envelope.py send archivo.txt --clave keys/student2_public.pem --contenedor
+    python main_rsa_envelope.py receive archivo.txt.sobre --clave keys/student2_private.pem
+    python main_rsa_envelope.py receive archivo.txt.sobre          (la clave privada se elige por la huella del sobre)
+    python main_rsa_envelope.py list
+    python main_rsa_envelope.py bench --tamanos 1K,1M
+    python main_rsa_envelope.py batch trabajos.jsonl --salida resultados.jsonl
+    python main_rsa_envelope.py sync datos/ --clave student2          (solo cifra los archivos nuevos o modificados)
+    pg_dump bd | python main_rsa_envelope.py send - --clave student2 | ssh student2 "cat > bd.sobre"   ('-' = stdin/stdout)
+    ssh student1 "cat bd.sobre" | python main_rsa_envelope.py receive - > bd.sql
+    python main_rsa_envelope.py listen recibidos/ --clave student2            (receptor TCP, descifra al recibir)
+    python main_rsa_envelope.py transfer a.txt b.txt --clave student2 --host 127.0.0.1   (cifra mientras envia)
+    python main_rsa_envelope.py send logs/*.txt --clave student2 --sesion      (una operacion RSA por sesion, no por archivo)
+    python main_rsa_envelope.py daemon --clave student2 &                     (servicio residente con las claves cargadas)
+    python main_rsa_envelope.py batch trabajos.jsonl --daemon                 (ejecuta los trabajos en el servicio)
+    python main_rsa_envelope.py rotate recibidos/ --antigua student2_old --nueva student2   (re-envuelve los .envelope)
+    python main_rsa_envelope.py pack conf/ --clave student2 --salida conf.paquete       (muchos archivos, un solo sobre)
+    python main_rsa_envelope.py unpack conf.paquete --listar
+    python main_rsa_envelope.py unpack conf.paquete --miembro conf/app.ini --destino restaurado/
+
+Cada trabajo produce una linea JSON con su resultado. El subcomando 'batch' lee un manifiesto JSON-lines con un
+trabajo por linea, asi un solo proceso atiende miles de trabajos sin volver a iniciar el interprete por cada archivo:
+    {"id": 1, "comando": "send", "archivo": "a.txt", "claves": ["keys/student2_public.pem"]}
+    {"id": 2, "comando": "receive", "cifrado": "a.txt.enc", "sobre": "a.txt.envelope", "clave": "keys/student2_private.pem"}
+    {"id": 3, "comando": "keygen", "nombre": "student3", "pool": true}
+
 Autor: Juan David Daza
 Fecha: Febrero 2026
 """
@@ -12,19 +43,43 @@ Fecha: Febrero 2026
 #Imports
 
 import os   
+import io
 import sys  
+import json
+import time
+import argparse
+from contextlib import redirect_stdout, nullcontext
 
 # Importar funciones de gestión de claves RSA
 # generar_par_claves(): crea par de claves RSA y las guarda en formato PEM
-# listar_claves(): muestra todas las claves disponibles en el directorio keys/
+# listar_claves(): muestra las claves disponibles en el directorio keys/ (a partir del indice, por paginas)
+# sincronizar_indice(): pone al dia el indice de claves con el directorio
 # KEYS_DIR: constante con el nombre del directorio de claves ("keys")
-from rsa_key_manager import generar_par_claves, listar_claves, KEYS_DIR
+from rsa_key_manager import generar_par_claves, listar_claves, sincronizar_indice, KEYS_DIR
 
 # Importar función del emisor: crea el sobre digital (cifra archivo + cifra contraseña)
-from digital_envelope_sender import crear_sobre_digital
+from digital_envelope_sender import crear_sobre_digital, crear_sobres_masivos, enviar_flujo, CONTENEDOR_EXT
 
 # Importar función del receptor: abre el sobre digital (descifra contraseña + descifra archivo)
-from digital_envelope_receiver import abrir_sobre_digital
+from digital_envelope_receiver import abrir_sobre_digital, abrir_flujo
+
+# Sincronizacion incremental: solo se cifran los archivos nuevos o modificados de un directorio
+from directory_sync import sincronizar_directorio
+
+# Rotacion de claves: re-envuelve los sobres sin volver a cifrar los archivos
+from key_rotation import rotar_sobres
+
+# Transferencia por TCP: cifrado y envio al mismo tiempo, con un receptor que descifra al recibir
+from network_transfer import enviar_archivos, crear_servidor, HOST, PUERTO, CONEXIONES
+
+# Paquete cifrado: muchos archivos en un solo archivo, con un indice para extraer cada uno por separado
+from encrypted_archive import crear_paquete, extraer_paquete, listar_paquete
+
+# Modo silencioso: en los subcomandos solo se imprimen las lineas de resultado
+from metrics import silencioso, reportar_error, ultimo_error
+
+# Algoritmos de compresion disponibles antes del cifrado
+from compression import ALGORITMOS
 
 
 
@@ -72,21 +127,62 @@ def opcion_enviar_archivo():
 
     # Mostrar las claves públicas disponibles para que el usuario sepa cuáles hay
     print("\n  Claves disponibles:")
-    claves = listar_claves()
+    claves = listar_claves(pagina=0)
 
-    # Solicitar la ruta de la clave pública del receptor
+    # Solicitar la ruta de la clave pública del receptor (o varias separadas por coma)
+    # Tambien se acepta el nombre del host (ej: student2), que se busca en el indice de claves
     print()  
-    ruta_clave_pub = input("  Ruta de la clave PUBLICA del receptor (.pem): ").strip()
+    ruta_clave_pub = input("  Ruta o nombre de la clave PUBLICA del receptor (.pem, varias separadas por coma): ").strip()
 
     # Validar que la ruta no esté vacía
     if not ruta_clave_pub:
         print("  Error: La ruta de la clave publica no puede estar vacia.")
         return  
 
+    # Con varias claves el archivo se cifra una sola vez y el sobre lleva una entrada por destinatario
+    if "," in ruta_clave_pub:
+        ruta_clave_pub = [ruta.strip() for ruta in ruta_clave_pub.split(",") if ruta.strip()]
+
     # Crear el sobre digital: cifra el archivo con AES y la contraseña con RSA
     crear_sobre_digital(ruta_archivo, ruta_clave_pub)
 
 
+def opcion_envio_masivo():
+    # Esta funcion crea un sobre digital para cada archivo de un directorio (o lista de archivos) usando todos los nucleos disponibles
+    # Un error en un archivo no detiene el envio del resto
+
+    # Mostrar encabezado de la opción
+    print("\n" + "-" * 60)
+    print("  Envio masivo (directorio o lista de archivos)")
+    print("-" * 60)
+
+    # Solicitar el directorio o las rutas separadas por coma
+    entrada = input("\n  Directorio o rutas de archivos separadas por coma: ").strip()
+
+    # Validar que la entrada no esté vacía
+    if not entrada:
+        print("  Error: La ruta no puede estar vacia.")
+        return  
+
+    rutas = [ruta.strip() for ruta in entrada.split(",") if ruta.strip()]
+
+    # Mostrar las claves públicas disponibles
+    print("\n  Claves disponibles:")
+    claves = listar_claves(pagina=0)
+
+    # Solicitar la ruta (o el nombre del host) de la clave pública del receptor
+    print()  
+    ruta_clave_pub = input("  Ruta o nombre de la clave PUBLICA del receptor (.pem): ").strip()
+
+    # Validar que la ruta no esté vacía
+    if not ruta_clave_pub:
+        print("  Error: La ruta de la clave publica no puede estar vacia.")
+        return  
+
+    # Crear los sobres digitales en paralelo
+    crear_sobres_masivos(rutas, ruta_clave_pub)
+
+
 def opcion_recibir_archivo():
     # Esta funcion abre un sobre digital: descifra la contraseña con RSA y el archivo con AES
     # necesita la ruta del archivo cifrado (.enc), la ruta del sobre digital (.envelope) y la ruta de la clave privada del receptor para poder recuperar el archivo original descifrado.
@@ -96,34 +192,39 @@ def opcion_recibir_archivo():
     print("  Recibir archivo (abrir sobre digital)")
     print("-" * 60)
 
-    # Solicitar la ruta del archivo cifrado (.enc)
-    ruta_enc = input("\n  Ruta del archivo cifrado (.enc): ").strip()
+    # Solicitar la ruta del archivo cifrado (.enc) o del contenedor (.sobre)
+    ruta_enc = input("\n  Ruta del archivo cifrado (.enc o .sobre): ").strip()
 
     # Validar que la ruta no esté vacía
     if not ruta_enc:
         print("  Error: La ruta del archivo cifrado no puede estar vacia.")
         return  
 
-    # Solicitar la ruta del sobre digital (.envelope)
-    ruta_sobre = input("  Ruta del sobre digital (.envelope): ").strip()
+    # El contenedor ya incluye el sobre digital, solo se pide el .envelope para un .enc
+    ruta_sobre = None
+    if not ruta_enc.endswith(CONTENEDOR_EXT):
 
-    # Validar que la ruta no esté vacía
-    if not ruta_sobre:
-        print("  Error: La ruta del sobre digital no puede estar vacia.")
-        return  
+        # Solicitar la ruta del sobre digital (.envelope)
+        ruta_sobre = input("  Ruta del sobre digital (.envelope): ").strip()
+
+        # Validar que la ruta no esté vacía
+        if not ruta_sobre:
+            print("  Error: La ruta del sobre digital no puede estar vacia.")
+            return  
 
     # Mostrar las claves privadas disponibles para que el usuario sepa cuáles hay
     print("\n  Claves disponibles:")
-    claves = listar_claves()
+    claves = listar_claves(pagina=0)
 
-    # Solicitar la ruta de la clave privada propia del receptor
+    # Solicitar la ruta (o el nombre del host) de la clave privada propia del receptor
     print()  
-    ruta_clave_priv = input("  Ruta de SU clave PRIVADA (.pem): ").strip()
+    # Con varias claves separadas por coma se usa ese anillo de claves, y vacio se busca la clave por la huella del sobre
+    ruta_clave_priv = input("  Ruta o nombre de SU clave PRIVADA (.pem, varias separadas por coma, Enter para buscarla): ").strip()
 
-    # Validar que la ruta no esté vacía
     if not ruta_clave_priv:
-        print("  Error: La ruta de la clave privada no puede estar vacia.")
-        return  
+        ruta_clave_priv = None
+    elif "," in ruta_clave_priv:
+        ruta_clave_priv = [ruta.strip() for ruta in ruta_clave_priv.split(",") if ruta.strip()]
 
     # Abrir el sobre digital: descifra la contraseña con RSA y el archivo con AES
     abrir_sobre_digital(ruta_enc, ruta_sobre, ruta_clave_priv)
@@ -138,8 +239,12 @@ def opcion_ver_claves():
     print("  Claves RSA disponibles")
     print("-" * 60)
 
-    # Listar todas las claves disponibles
-    listar_claves()
+    # Listar las claves disponibles por paginas, Enter muestra la siguiente
+    pagina = 0
+    while listar_claves(pagina=pagina):
+        if input("\n  Enter para ver mas claves, 0 para volver: ").strip() == "0":
+            break
+        pagina += 1
 
 
 
@@ -161,6 +266,7 @@ def menu():
         print("  [2] Enviar archivo (crear sobre digital)")
         print("  [3] Recibir archivo (abrir sobre digital)")
         print("  [4] Ver claves disponibles")
+        print("  [5] Envio masivo (directorio o lista de archivos)")
         print("  [0] Salir")
         print()
 
@@ -179,6 +285,9 @@ def menu():
         elif opcion == "4":
             opcion_ver_claves()
 
+        elif opcion == "5":
+            opcion_envio_masivo()
+
         elif opcion == "0":
             print("\nSaliendo del programa.\nBye o/")
             sys.exit(0)  
@@ -186,5 +295,514 @@ def menu():
         else:
             print("\n  Opcion no valida, intente de nuevo.")
 
+def _trabajo_keygen(trabajo):
+    ruta_privada, ruta_publica = generar_par_claves(trabajo["nombre"], usar_pool=trabajo.get("pool", False))
+    return {"privada": ruta_privada, "publica": ruta_publica}
+
+
+def _ruta_salida_flujo(trabajo):
+    # Ruta de salida de un trabajo send/receive en modo flujo ('-' es la salida estandar), o None si no es un flujo
+    # Un trabajo es un flujo si indica "salida", o si lee de la entrada estandar ('-')
+    origen = trabajo.get("archivo") if trabajo.get("comando") == "send" else trabajo.get("cifrado")
+    salida = trabajo.get("salida")
+    if salida is None and origen == "-":
+        return "-"
+    return salida
+
+
+def _abrir_binario(ruta, modo):
+    # Abre un archivo binario; '-' es la entrada o la salida estandar
+    # Se usa sys.__stdout__ porque la salida de texto de cada trabajo se captura (ver ejecutar_trabajo)
+    if ruta == "-":
+        return nullcontext(sys.stdin.buffer if "r" in modo else sys.__stdout__.buffer)
+    return open(ruta, modo)
+
+
+def _ejecutar_flujo(origen, destino, funcion, *argumentos):
+    # Ejecuta funcion(entrada, salida, *argumentos) sobre los flujos de 'origen' y 'destino'
+    # Un archivo de destino se escribe en un temporal que solo lo reemplaza si la funcion termina bien: si falla o
+    # lanza una excepcion el temporal se borra, sin dejar un resultado a medias ni tocar un archivo anterior
+    # La salida estandar y los destinos especiales (ej: /dev/null, un FIFO) se escriben directamente
+    if destino == "-" or (os.path.exists(destino) and not os.path.isfile(destino)):
+        with _abrir_binario(origen, "rb") as entrada, _abrir_binario(destino, "wb") as salida:
+            return funcion(entrada, salida, *argumentos)
+
+    temporal = destino + ".tmp"
+    try:
+        with _abrir_binario(origen, "rb") as entrada, open(temporal, "wb") as salida:
+            size = funcion(entrada, salida, *argumentos)
+        if size is not None:
+            os.replace(temporal, destino)
+        return size
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def _trabajo_send(trabajo):
+    # 'claves' puede ser una ruta o una lista de rutas (un sobre con varios destinatarios)
+    claves = trabajo.get("claves", trabajo.get("clave"))
+    if claves is None:
+        raise KeyError("claves")
+    if isinstance(claves, list) and len(claves) == 1:
+        claves = claves[0]
+
+    # Modo flujo: el contenedor se escribe directo en "salida" (o en la salida estandar), sin archivos intermedios
+    destino = _ruta_salida_flujo(trabajo)
+    if destino is not None:
+        if trabajo.get("segmentado"):
+            raise ValueError("El formato segmentado no se puede escribir en un flujo (requiere acceso aleatorio).")
+        size = _ejecutar_flujo(trabajo["archivo"], destino, enviar_flujo, claves, trabajo.get("compresion"),
+                               trabajo.get("autenticado", True), trabajo.get("sesion", False))
+        if size is None:
+            return None
+        return {"salida": destino, "bytes": size}
+
+    ruta_cifrada, ruta_sobre = crear_sobre_digital(trabajo["archivo"], claves, segmentado=trabajo.get("segmentado", False),
+                                                   contenedor=trabajo.get("contenedor", False),
+                                                   compresion=trabajo.get("compresion"),
+                                                   autenticado=trabajo.get("autenticado", True),
+                                                   sesion=trabajo.get("sesion", False))
+    if ruta_cifrada is None:
+        return None
+    return {"cifrado": ruta_cifrada, "sobre": ruta_sobre, "bytes": os.path.getsize(trabajo["archivo"])}
+
+
+def _trabajo_receive(trabajo):
+    # Sin "sobre", "cifrado" es un contenedor (.sobre)
+    # "clave" puede ser una lista (anillo de claves); sin "clave" se busca por la huella del sobre en el indice
+    # Modo flujo: solo contenedores, los datos originales se escriben en "salida" (o en la salida estandar)
+    destino = _ruta_salida_flujo(trabajo)
+    if destino is not None:
+        if trabajo.get("sobre"):
+            raise ValueError("En un flujo solo se pueden abrir contenedores (.sobre), sin .envelope separado.")
+        size = _ejecutar_flujo(trabajo["cifrado"], destino, abrir_flujo, trabajo.get("clave"))
+        if size is None:
+            return None
+        return {"descifrado": destino, "bytes": size}
+
+    ruta_descifrada = abrir_sobre_digital(trabajo["cifrado"], trabajo.get("sobre"), trabajo.get("clave"))
+    if ruta_descifrada is None:
+        return None
+    return {"descifrado": ruta_descifrada, "bytes": os.path.getsize(ruta_descifrada)}
+
+
+def _trabajo_list(trabajo):
+    # Sin "pagina" se listan todas las claves; con "reindexar" se recorre el directorio completo antes de listar
+    if trabajo.get("reindexar"):
+        sincronizar_indice(forzar=True)
+    archivos = listar_claves(pagina=trabajo.get("pagina"), por_pagina=trabajo.get("por_pagina", 50))
+    return {"claves": [os.path.join(KEYS_DIR, nombre) for nombre in archivos]}
+
+
+def _trabajo_sync(trabajo):
+    claves = trabajo.get("claves", trabajo.get("clave"))
+    if claves is None:
+        raise KeyError("claves")
+    if isinstance(claves, list) and len(claves) == 1:
+        claves = claves[0]
+
+    return sincronizar_directorio(trabajo["directorio"], claves, procesos=trabajo.get("procesos"),
+                                  contenedor=trabajo.get("contenedor", False), compresion=trabajo.get("compresion"),
+                                  eliminar=trabajo.get("eliminar", True))
+
+
+def _trabajo_rotate(trabajo):
+    resultados, resumen = rotar_sobres(trabajo["rutas"], trabajo["antigua"], trabajo["nueva"], procesos=trabajo.get("procesos"),
+                                       ruta_checkpoint=trabajo.get("checkpoint"))
+    if resumen is None:
+        return None
+    resumen["errores"] = [{"archivo": r["archivo"], "error": r["error"]} for r in resultados if not r["ok"]]
+    return resumen
+
+
+def _trabajo_transfer(trabajo):
+    claves = trabajo.get("claves", trabajo.get("clave"))
+    if claves is None:
+        raise KeyError("claves")
+    if isinstance(claves, list) and len(claves) == 1:
+        claves = claves[0]
+
+    archivos = trabajo["archivos"] if "archivos" in trabajo else [trabajo["archivo"]]
+    resultados, resumen = enviar_archivos(archivos, claves, trabajo.get("host", HOST), trabajo.get("puerto", PUERTO),
+                                          trabajo.get("conexiones") or CONEXIONES, trabajo.get("compresion"),
+                                          trabajo.get("sesion", False))
+    if resumen is None:
+        return None
+    if resumen["fallidos"]:
+        # El resultado del trabajo reporta el primer archivo con error
+        fallido = next(r for r in resultados if not r["ok"])
+        reportar_error(f"{fallido['archivo']}: {fallido['error']}")
+        return None
+    resumen["archivos_enviados"] = [{"archivo": r["archivo"], "destino": r["destino"], "bytes": r["bytes"]} for r in resultados]
+    return resumen
+
+
+def _trabajo_pack(trabajo):
+    claves = trabajo.get("claves", trabajo.get("clave"))
+    if claves is None:
+        raise KeyError("claves")
+    if isinstance(claves, list) and len(claves) == 1:
+        claves = claves[0]
+
+    archivos = trabajo["archivos"] if "archivos" in trabajo else [trabajo["archivo"]]
+    ruta_paquete = crear_paquete(archivos, claves, trabajo.get("salida"), trabajo.get("compresion"))
+    if ruta_paquete is None:
+        return None
+    return {"paquete": ruta_paquete, "bytes": os.path.getsize(ruta_paquete)}
+
+
+def _trabajo_unpack(trabajo):
+    # Con "listar" solo se lee el indice; "miembros" indica los archivos a extraer (por defecto todos)
+    if trabajo.get("listar"):
+        miembros = listar_paquete(trabajo["paquete"], trabajo.get("clave"))
+        if miembros is None:
+            return None
+        return {"miembros": miembros}
+
+    extraidos = extraer_paquete(trabajo["paquete"], trabajo.get("clave"), trabajo.get("miembros"), trabajo.get("destino", "."))
+    if extraidos is None:
+        return None
+    return {"extraidos": extraidos}
+
+
+def _trabajo_bench(trabajo):
+    # Mismas opciones que benchmark.py: "tamanos" ("1K,1M" o una lista), "repeticiones", "repeticiones_generacion",
+    # "salida" (JSON con los resultados) y "comparar" (JSON de una ejecucion anterior, el trabajo falla si hay regresiones)
+    import benchmark     # Import local: solo se carga si se pide el benchmark
+    tamanos = trabajo.get("tamanos", benchmark.TAMANOS_DEFECTO)
+    if isinstance(tamanos, str):
+        tamanos = tamanos.split(",")
+    tamanos = [benchmark.leer_tamano(str(texto)) for texto in tamanos if str(texto).strip()]
+
+    informe = benchmark.ejecutar_benchmark(tamanos, trabajo.get("repeticiones", benchmark.REPETICIONES_DEFECTO),
+                                           trabajo.get("repeticiones_generacion", 3))
+    if trabajo.get("salida"):
+        with open(trabajo["salida"], "w") as archivo:
+            json.dump(informe, archivo, indent=2)
+
+    if trabajo.get("comparar"):
+        with open(trabajo["comparar"]) as archivo:
+            base = json.load(archivo)
+        regresiones = benchmark.comparar(informe, base, trabajo.get("tolerancia", benchmark.TOLERANCIA_DEFECTO))
+        if regresiones:
+            reportar_error(f"Regresiones respecto a {trabajo['comparar']}: " + ", ".join(etapa for etapa, *_ in regresiones))
+            return None
+
+    return {"informe": informe}
+
+
+TRABAJOS = {
+    "keygen": _trabajo_keygen,
+    "send": _trabajo_send,
+    "receive": _trabajo_receive,
+    "list": _trabajo_list,
+    "sync": _trabajo_sync,
+    "rotate": _trabajo_rotate,
+    "transfer": _trabajo_transfer,
+    "pack": _trabajo_pack,
+    "unpack": _trabajo_unpack,
+    "bench": _trabajo_bench,
+}
+
+
+def ejecutar_trabajo(trabajo, detalle=None):
+    # Ejecuta un trabajo (diccionario con "comando" y sus argumentos) y retorna su resultado como diccionario
+    # Nunca lanza excepciones: cualquier error queda registrado en el resultado para no detener el lote
+    # Los mensajes impresos por el trabajo se capturan; si se indica 'detalle' (ej: sys.stderr) se copian ahi
+    inicio = time.perf_counter()
+    comando = trabajo.get("comando")
+    resultado = {"id": trabajo["id"]} if "id" in trabajo else {}
+    resultado.update(comando=comando, ok=False)
+
+    salida = io.StringIO()
+    ultimo_error(limpiar=True)
+    try:
+        if comando not in TRABAJOS:
+            raise ValueError(f"Comando no soportado: {comando}")
+
+        with redirect_stdout(salida):
+            datos = TRABAJOS[comando](trabajo)
+
+        if datos is None:
+            # La causa es el error que reporto la funcion del sobre digital (ver reportar_error)
+            resultado["error"] = ultimo_error(limpiar=True) or "El trabajo no se pudo completar."
+        else:
+            resultado.update(datos)
+            resultado["ok"] = True
+    except KeyError as error:
+        resultado["error"] = f"Falta el campo {error} en el trabajo."
+    except Exception as error:
+        resultado["error"] = f"{type(error).__name__}: {error}"
+
+    if detalle is not None and salida.getvalue():
+        detalle.write(salida.getvalue())
+
+    resultado["segundos"] = time.perf_counter() - inicio
+    return resultado
+
+
+def leer_manifiesto(archivo):
+    # Genera los trabajos de un manifiesto JSON-lines. Las lineas vacias y las que empiezan con '#' se ignoran
+    # Una linea que no es JSON valido genera un trabajo invalido, que se reporta como error sin detener el resto
+    for numero, linea in enumerate(archivo, start=1):
+        linea = linea.strip()
+        if not linea or linea.startswith("#"):
+            continue
+        try:
+            trabajo = json.loads(linea)
+            if not isinstance(trabajo, dict):
+                raise ValueError("se esperaba un objeto JSON")
+        except ValueError as error:
+            trabajo = {"comando": None, "id": f"linea {numero}", "_error": f"Linea {numero} invalida: {error}"}
+        yield trabajo
+
+
+def ejecutar_trabajos(trabajos, salida, detalle=None):
+    # Ejecuta los trabajos en orden y escribe una linea JSON de resultado por cada uno
+    # Retorna la cantidad de trabajos con error
+    errores = 0
+    for trabajo in trabajos:
+        if "_error" in trabajo:
+            resultado = {"comando": None, "id": trabajo["id"], "ok": False, "error": trabajo["_error"], "segundos": 0.0}
+        else:
+            resultado = ejecutar_trabajo(trabajo, detalle)
+
+        if not resultado["ok"]:
+            errores += 1
+        salida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+        salida.flush()
+
+    return errores
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Sobre digital RSA + AES. Sin argumentos se muestra el menu interactivo.")
+    parser.add_argument("--detalle", action="store_true", help="Mostrar en stderr los mensajes de cada paso")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    keygen = subcomandos.add_parser("keygen", help="Generar pares de claves RSA")
+    keygen.add_argument("nombres", nargs="+", help="Nombre de cada maquina (ej: student1)")
+    keygen.add_argument("--pool", action="store_true", help="Tomar pares ya generados de keys/.pool/ (ver rsa_key_pool.py)")
+
+    send = subcomandos.add_parser("send", help="Crear el sobre digital de uno o varios archivos")
+    send.add_argument("archivos", nargs="+", help="Archivos a enviar ('-' para la entrada estandar)")
+    send.add_argument("--clave", action="append", required=True, help="Clave PUBLICA del receptor (repetir para varios destinatarios)")
+    send.add_argument("--segmentado", action="store_true", help="Usar el formato segmentado (AES-GCM) con acceso aleatorio")
+    send.add_argument("--contenedor", action="store_true", help="Generar un solo archivo .sobre en lugar de .enc + .envelope")
+    send.add_argument("--compresion", choices=sorted(ALGORITMOS), help="Comprimir antes de cifrar (se omite si los datos no son comprimibles)")
+    send.add_argument("--salida", help="Escribir el contenedor en esta ruta ('-' para la salida estandar, por defecto con 'send -')")
+    send.add_argument("--sesion", action="store_true", help="Reutilizar la clave de sesion del destinatario (una operacion RSA por sesion)")
+    send.add_argument("--sin-autenticar", action="store_true", help="No agregar el MAC por bloque (archivos .enc legibles por versiones anteriores)")
+
+    receive = subcomandos.add_parser("receive", help="Abrir un sobre digital")
+    receive.add_argument("cifrado", help="Archivo cifrado (.enc) o contenedor (.sobre), '-' para leer el contenedor de la entrada estandar")
+    receive.add_argument("sobre", nargs="?", help="Sobre digital (.envelope), se omite con un contenedor")
+    receive.add_argument("--clave", action="append", help="Clave PRIVADA del receptor (repetir para usar un anillo de claves, "
+                                                           "sin --clave se busca por la huella del sobre)")
+    receive.add_argument("--salida", help="Escribir los datos descifrados en esta ruta ('-' para la salida estandar, por defecto con 'receive -')")
+
+    listar = subcomandos.add_parser("list", help="Listar las claves disponibles")
+    listar.add_argument("--pagina", type=int, help="Pagina a mostrar (la primera es la 0), por defecto todas")
+    listar.add_argument("--por-pagina", type=int, default=50, help="Claves de cada tipo por pagina")
+    listar.add_argument("--reindexar", action="store_true", help="Recorrer el directorio de claves y reconstruir el indice")
+
+    sync = subcomandos.add_parser("sync", help="Crear los sobres de un directorio, solo para los archivos nuevos o modificados")
+    sync.add_argument("directorio", help="Directorio a sincronizar (el manifiesto se guarda en el mismo directorio)")
+    sync.add_argument("--clave", action="append", required=True, help="Clave PUBLICA del receptor (repetir para varios destinatarios)")
+    sync.add_argument("--contenedor", action="store_true", help="Generar un solo archivo .sobre por archivo")
+    sync.add_argument("--compresion", choices=sorted(ALGORITMOS), help="Comprimir antes de cifrar (se omite si los datos no son comprimibles)")
+    sync.add_argument("--procesos", type=int, help="Procesos para cifrar (por defecto uno por nucleo)")
+    sync.add_argument("--conservar-eliminados", action="store_true", help="No borrar los archivos cifrados de los archivos eliminados")
+
+    transfer = subcomandos.add_parser("transfer", help="Cifrar y enviar archivos por TCP a un receptor ('listen')")
+    transfer.add_argument("archivos", nargs="+", help="Archivos a enviar")
+    transfer.add_argument("--clave", action="append", required=True, help="Clave PUBLICA del receptor (repetir para varios destinatarios)")
+    transfer.add_argument("--host", default=HOST, help=f"Host del receptor (por defecto {HOST})")
+    transfer.add_argument("--puerto", type=int, default=PUERTO, help=f"Puerto del receptor (por defecto {PUERTO})")
+    transfer.add_argument("--conexiones", type=int, default=CONEXIONES, help="Conexiones persistentes en paralelo")
+    transfer.add_argument("--compresion", choices=sorted(ALGORITMOS), help="Comprimir antes de cifrar (se omite si los datos no son comprimibles)")
+    transfer.add_argument("--sesion", action="store_true", help="Usar una sola clave de sesion para todos los archivos (una operacion RSA)")
+
+    listen = subcomandos.add_parser("listen", help="Recibir archivos por TCP y descifrarlos a medida que llegan")
+    listen.add_argument("directorio", help="Directorio donde guardar los archivos descifrados")
+    listen.add_argument("--clave", action="append", help="Clave PRIVADA (repetir para un anillo, sin --clave se busca por huella)")
+    listen.add_argument("--host", default=HOST, help=f"Direccion donde escuchar (por defecto {HOST})")
+    listen.add_argument("--puerto", type=int, default=PUERTO, help=f"Puerto donde escuchar (por defecto {PUERTO})")
+
+    rotate = subcomandos.add_parser("rotate", help="Re-envolver los sobres con una clave nueva, sin volver a cifrar los archivos")
+    rotate.add_argument("rutas", nargs="+", help="Sobres (.envelope) o directorios donde buscarlos")
+    rotate.add_argument("--antigua", action="append", required=True, help="Clave PRIVADA antigua (repetir para varias)")
+    rotate.add_argument("--nueva", action="append", required=True, help="Clave PUBLICA nueva (repetir para varios destinatarios)")
+    rotate.add_argument("--procesos", type=int, help="Procesos a usar (por defecto uno por nucleo)")
+    rotate.add_argument("--checkpoint", help="Archivo JSON-lines con el progreso, para continuar si se interrumpe")
+
+    pack = subcomandos.add_parser("pack", help="Empaquetar varios archivos en un solo paquete cifrado (.paquete)")
+    pack.add_argument("archivos", nargs="+", help="Archivos o directorios a empaquetar")
+    pack.add_argument("--clave", action="append", required=True, help="Clave PUBLICA del receptor (repetir para varios destinatarios)")
+    pack.add_argument("--salida", help="Ruta del paquete (por defecto el primer archivo con la extension .paquete)")
+    pack.add_argument("--compresion", choices=sorted(ALGORITMOS), help="Comprimir cada archivo antes de cifrar (se omite si no es comprimible)")
+
+    unpack = subcomandos.add_parser("unpack", help="Listar o extraer los archivos de un paquete cifrado")
+    unpack.add_argument("paquete", help="Paquete cifrado (.paquete)")
+    unpack.add_argument("--clave", action="append", help="Clave PRIVADA (repetir para un anillo, sin --clave se busca por huella)")
+    unpack.add_argument("--listar", action="store_true", help="Solo mostrar los archivos del paquete")
+    unpack.add_argument("--miembro", action="append", help="Archivo a extraer (repetir para varios, por defecto todos)")
+    unpack.add_argument("--destino", default=".", help="Directorio donde extraer los archivos")
+
+    # Las opciones de 'bench' no se declaran aqui: main() entrega a benchmark.py los argumentos que no reconoce
+    subcomandos.add_parser("bench", help="Ejecutar el benchmark (acepta las opciones de benchmark.py, ej: --tamanos 1K,1M)")
+
+    batch = subcomandos.add_parser("batch", help="Ejecutar los trabajos de un manifiesto JSON-lines")
+    batch.add_argument("manifiesto", help="Archivo con un trabajo JSON por linea ('-' para leer de la entrada estandar)")
+    batch.add_argument("--salida", help="Archivo donde escribir los resultados (por defecto la salida estandar)")
+    batch.add_argument("--daemon", nargs="?", const=True, metavar="SOCKET",
+                       help="Ejecutar los trabajos en el servicio residente ('daemon'), opcionalmente en otro socket")
+
+    daemon = subcomandos.add_parser("daemon", help="Servicio residente: atiende trabajos por un socket Unix con las claves ya cargadas")
+    daemon.add_argument("--socket", help="Ruta del socket Unix (por defecto keys/.daemon.sock)")
+    daemon.add_argument("--procesos", type=int, help="Procesos que ejecutan los trabajos (por defecto uno por nucleo)")
+    daemon.add_argument("--clave", action="append", default=[], help="Clave a cargar al iniciar (ruta o nombre de host, repetir para varias)")
+
+    return parser
+
+
+def escuchar(opciones):
+    # Receptor TCP: atiende conexiones hasta que se interrumpe con Ctrl+C
+    # Los archivos recibidos se reportan en stdout con --detalle; los errores siempre se imprimen
+    clave = opciones.clave[0] if opciones.clave and len(opciones.clave) == 1 else opciones.clave
+    servidor = crear_servidor(opciones.directorio, clave, opciones.host, opciones.puerto)
+    if servidor is None:
+        return 1
+
+    print(json.dumps({"comando": "listen", "ok": True, "host": servidor.server_address[0], "puerto": servidor.server_address[1],
+                      "directorio": opciones.directorio}), flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return 0
+
+
+def servicio(opciones):
+    # Servicio residente: atiende trabajos por el socket Unix hasta recibir "detener" o Ctrl+C
+    import envelope_daemon      # Import local: el servicio usa las funciones de este modulo
+    servidor = envelope_daemon.crear_daemon(opciones.socket, opciones.procesos, opciones.clave)
+    if servidor is None:
+        return 1
+
+    print(json.dumps({"comando": "daemon", "ok": True, "socket": servidor.ruta_socket, "procesos": servidor.procesos,
+                      "claves": servidor.claves}, ensure_ascii=False), flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.cerrar()
+    return 0
+
+
+def ejecutar_en_daemon(trabajos, salida, ruta_socket=None):
+    # Como ejecutar_trabajos(), pero los trabajos se ejecutan en el servicio residente (en paralelo)
+    # Los resultados se escriben a medida que terminan. Retorna la cantidad de trabajos con error
+    import envelope_daemon
+    errores = 0
+    try:
+        for resultado in envelope_daemon.enviar_trabajos(trabajos, ruta_socket):
+            errores += not resultado["ok"]
+            salida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+            salida.flush()
+    except OSError as error:
+        print(f"Error: No se pudo usar el servicio residente: {error}", file=sys.stderr)
+        return errores + 1
+    return errores
+
+
+def main(argumentos=None):
+    # Punto de entrada no interactivo. Retorna 0 si todos los trabajos terminaron bien y 1 si alguno fallo
+    parser = crear_parser()
+    # argparse.REMAINDER no captura argumentos que empiezan con '-' en un subcomando: las opciones de benchmark.py
+    # (ej: --tamanos) llegan como argumentos no reconocidos, y solo se aceptan con 'bench'
+    opciones, otros = parser.parse_known_args(argumentos)
+
+    if opciones.comando == "bench":
+        import benchmark     # Import local: solo se carga si se pide el benchmark
+        return benchmark.main(otros)
+    if otros:
+        parser.error(f"argumentos no reconocidos: {' '.join(otros)}")
+
+    # Los mensajes de cada paso solo se generan si se piden con --detalle, y en ese caso van a stderr
+    silencioso(not opciones.detalle)
+    detalle = sys.stderr if opciones.detalle else None
+
+    if opciones.comando == "listen":
+        return escuchar(opciones)
+
+    if opciones.comando == "daemon":
+        return servicio(opciones)
+
+    if opciones.comando == "keygen":
+        trabajos = [{"comando": "keygen", "nombre": nombre, "pool": opciones.pool} for nombre in opciones.nombres]
+    elif opciones.comando == "send":
+        if len(opciones.archivos) > 1 and (opciones.salida or "-" in opciones.archivos):
+            parser.error("--salida y '-' solo se pueden usar con un archivo.")
+        trabajos = [{"comando": "send", "archivo": archivo, "claves": opciones.clave, "segmentado": opciones.segmentado,
+                     "contenedor": opciones.contenedor, "compresion": opciones.compresion,
+                     "autenticado": not opciones.sin_autenticar, "salida": opciones.salida, "sesion": opciones.sesion}
+                    for archivo in opciones.archivos]
+    elif opciones.comando == "receive":
+        clave = opciones.clave[0] if opciones.clave and len(opciones.clave) == 1 else opciones.clave
+        trabajos = [{"comando": "receive", "cifrado": opciones.cifrado, "sobre": opciones.sobre, "clave": clave,
+                     "salida": opciones.salida}]
+    elif opciones.comando == "sync":
+        trabajos = [{"comando": "sync", "directorio": opciones.directorio, "claves": opciones.clave,
+                     "contenedor": opciones.contenedor, "compresion": opciones.compresion, "procesos": opciones.procesos,
+                     "eliminar": not opciones.conservar_eliminados}]
+    elif opciones.comando == "transfer":
+        trabajos = [{"comando": "transfer", "archivos": opciones.archivos, "claves": opciones.clave, "host": opciones.host,
+                     "puerto": opciones.puerto, "conexiones": opciones.conexiones, "compresion": opciones.compresion,
+                     "sesion": opciones.sesion}]
+    elif opciones.comando == "rotate":
+        trabajos = [{"comando": "rotate", "rutas": opciones.rutas, "antigua": opciones.antigua, "nueva": opciones.nueva,
+                     "procesos": opciones.procesos, "checkpoint": opciones.checkpoint}]
+    elif opciones.comando == "pack":
+        trabajos = [{"comando": "pack", "archivos": opciones.archivos, "claves": opciones.clave, "salida": opciones.salida,
+                     "compresion": opciones.compresion}]
+    elif opciones.comando == "unpack":
+        clave = opciones.clave[0] if opciones.clave and len(opciones.clave) == 1 else opciones.clave
+        trabajos = [{"comando": "unpack", "paquete": opciones.paquete, "clave": clave, "listar": opciones.listar,
+                     "miembros": opciones.miembro, "destino": opciones.destino}]
+    elif opciones.comando == "list":
+        trabajos = [{"comando": "list", "pagina": opciones.pagina, "por_pagina": opciones.por_pagina,
+                     "reindexar": opciones.reindexar}]
+    else:
+        trabajos = None
+
+    if trabajos is not None:
+        # Si los datos van a la salida estandar, las lineas de resultado se escriben en stderr
+        resultados = sys.stderr if any(_ruta_salida_flujo(trabajo) == "-" for trabajo in trabajos) else sys.stdout
+        return 1 if ejecutar_trabajos(trabajos, resultados, detalle) else 0
+
+    # batch: el manifiesto se lee linea por linea, sin cargarlo completo en memoria
+    entrada = sys.stdin if opciones.manifiesto == "-" else open(opciones.manifiesto)
+    salida = open(opciones.salida, "w") if opciones.salida else sys.stdout
+    try:
+        if opciones.daemon:
+            errores = ejecutar_en_daemon(leer_manifiesto(entrada), salida, None if opciones.daemon is True else opciones.daemon)
+        else:
+            errores = ejecutar_trabajos(leer_manifiesto(entrada), salida, detalle)
+    finally:
+        if entrada is not sys.stdin:
+            entrada.close()
+        if salida is not sys.stdout:
+            salida.close()
+
+    return 1 if errores else 0
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(main())
     menu()
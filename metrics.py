@@ -0,0 +1,222 @@
+"""
+Metricas e Instrumentacion - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+Este modulo permite observar cada etapa del sobre digital (carga de claves, derivacion de clave, cifrado AES,
+operaciones RSA y escritura de archivos) sin depender de los mensajes impresos en consola.
+
+'Observadores': Cualquier funcion que reciba un diccionario puede registrarse con registrar_observador().
+Por cada etapa terminada se le entrega un evento con el nombre de la etapa, su duracion, los bytes procesados,
+el throughput y si termino con error.
+'Exportadores': ExportadorJSONL escribe un evento por linea en formato JSON, y ExportadorPrometheus acumula
+contadores por etapa y los exporta en el formato de texto de Prometheus.
+'Modo silencioso': Con silencioso(True) se dejan de imprimir los mensajes de progreso (los errores se siguen
+mostrando), lo cual evita el costo de imprimir en procesos por lotes.
+
+Uso:
+    exportador = ExportadorPrometheus()
+    registrar_observador(exportador)
+    silencioso(True)
+    crear_sobre_digital("archivo.txt", "keys/student2_public.pem")
+    print(exportador.texto())
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+# Estado del modulo
+_observadores = []
+_lock = threading.Lock()
+_silencioso = False
+_hilo = threading.local()       # Por hilo: ultimo error reportado y archivo de los mensajes (ver reportar_error)
+
+
+def registrar_observador(observador):
+    # Registra una funcion que recibira un evento (diccionario) por cada etapa terminada
+    with _lock:
+        _observadores.append(observador)
+    return observador
+
+
+def quitar_observador(observador):
+    # Deja de enviar eventos al observador indicado
+    with _lock:
+        if observador in _observadores:
+            _observadores.remove(observador)
+
+
+def silencioso(activo=True):
+    # Activa o desactiva el modo silencioso (sin mensajes de progreso)
+    global _silencioso
+    _silencioso = activo
+
+
+def es_silencioso():
+    return _silencioso
+
+
+def mostrar(*args, **kwargs):
+    # Reemplazo de print() para los mensajes de progreso: no imprime nada en modo silencioso
+    if not _silencioso:
+        kwargs.setdefault("file", getattr(_hilo, "archivo", None))
+        print(*args, **kwargs)
+
+
+def reportar_error(mensaje, *detalles):
+    # Reemplazo de print(f"Error: ...") para el error que hace fallar una operacion (que luego retorna None)
+    # El error (y las lineas de 'detalles') siempre se imprime, y queda como el ultimo error del hilo para quien
+    # ejecuta la operacion
+    _hilo.ultimo = mensaje
+    archivo = getattr(_hilo, "archivo", None)
+    print(f"Error: {mensaje}", file=archivo)
+    for linea in detalles:
+        print(linea, file=archivo)
+
+
+def ultimo_error(limpiar=False):
+    # Retorna el ultimo error reportado en este hilo, o None. Con limpiar=True ademas lo olvida
+    mensaje = getattr(_hilo, "ultimo", None)
+    if limpiar:
+        _hilo.ultimo = None
+    return mensaje
+
+
+@contextmanager
+def mensajes_fuera_de(salida):
+    # Si 'salida' (un flujo de datos binarios) escribe en la salida estandar, los mensajes de progreso y de error
+    # de este hilo se escriben en stderr mientras dura el bloque, para no mezclarse con los datos
+    try:
+        misma = salida.fileno() == sys.stdout.fileno()
+    except (AttributeError, ValueError, OSError):
+        misma = False     # No es un archivo del sistema, o sys.stdout esta capturado (ej: ejecutar_trabajo)
+
+    anterior = getattr(_hilo, "archivo", None)
+    if misma:
+        _hilo.archivo = sys.stderr
+    try:
+        yield
+    finally:
+        _hilo.archivo = anterior
+
+
+def emitir(evento):
+    # Entrega el evento a todos los observadores. Un observador que falla no afecta la operacion medida
+    with _lock:
+        observadores = list(_observadores)
+
+    for observador in observadores:
+        try:
+            observador(evento)
+        except Exception:
+            pass
+
+
+@contextmanager
+def etapa(nombre, bytes_procesados=0, **etiquetas):
+    # Mide la duracion de una etapa y emite su evento al terminar
+    # Quien la usa puede actualizar 'bytes' u 'ok' en el diccionario que se entrega, por ejemplo:
+    #     with etapa("aes_cifrar", formato="CBC") as medicion:
+    #         medicion["bytes"] = cifrar_flujo(...)
+    # Si la etapa lanza una excepcion se marca como error y la excepcion se propaga
+    medicion = {"etapa": nombre, "bytes": bytes_procesados, "ok": True}
+    medicion.update(etiquetas)
+
+    # Sin observadores no se mide nada, para no agregar costo
+    if not _observadores:
+        yield medicion
+        return
+
+    inicio = time.perf_counter()
+    try:
+        yield medicion
+    except BaseException as error:
+        medicion["ok"] = False
+        medicion["error"] = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        medicion["segundos"] = segundos
+        medicion["mb_por_segundo"] = medicion["bytes"] / (1024 * 1024) / segundos if segundos > 0 and medicion["bytes"] else None
+        medicion["timestamp"] = time.time()
+        emitir(medicion)
+
+
+class ExportadorJSONL:
+    # Observador que escribe cada evento como una linea JSON en un archivo (o en cualquier objeto con write())
+
+    def __init__(self, destino):
+        self._propio = isinstance(destino, str)
+        self._archivo = open(destino, "a") if self._propio else destino
+        self._lock = threading.Lock()
+
+    def __call__(self, evento):
+        linea = json.dumps(evento, default=str)
+        with self._lock:
+            self._archivo.write(linea + "\n")
+            self._archivo.flush()
+
+    def cerrar(self):
+        if self._propio:
+            self._archivo.close()
+
+
+class ExportadorPrometheus:
+    # Observador que acumula por etapa: cantidad, duracion total, bytes procesados y errores
+    # texto() retorna las metricas en el formato de exposicion de texto de Prometheus
+
+    PREFIJO = "sobre_digital"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._etapas = {}
+
+    def __call__(self, evento):
+        with self._lock:
+            datos = self._etapas.setdefault(evento["etapa"], {"cantidad": 0, "segundos": 0.0, "bytes": 0, "errores": 0})
+            datos["cantidad"] += 1
+            datos["segundos"] += evento.get("segundos", 0.0)
+            datos["bytes"] += evento.get("bytes") or 0
+            if not evento.get("ok", True):
+                datos["errores"] += 1
+
+    def resumen(self):
+        # Copia de los contadores acumulados por etapa
+        with self._lock:
+            return {nombre: dict(datos) for nombre, datos in self._etapas.items()}
+
+    def texto(self):
+        lineas = []
+        etapas = sorted(self.resumen().items())
+        metricas = [
+            ("etapa_duracion_segundos", "summary", "Duracion de cada etapa", None),
+            ("etapa_bytes_total", "counter", "Bytes procesados por etapa", "bytes"),
+            ("etapa_errores_total", "counter", "Etapas terminadas con error", "errores"),
+        ]
+
+        for nombre, tipo, ayuda, campo in metricas:
+            metrica = f"{self.PREFIJO}_{nombre}"
+            lineas.append(f"# HELP {metrica} {ayuda}")
+            lineas.append(f"# TYPE {metrica} {tipo}")
+            for etapa_nombre, datos in etapas:
+                etiqueta = f'{{etapa="{etapa_nombre}"}}'
+                if campo is None:
+                    lineas.append(f"{metrica}_sum{etiqueta} {datos['segundos']:.9f}")
+                    lineas.append(f"{metrica}_count{etiqueta} {datos['cantidad']}")
+                else:
+                    lineas.append(f"{metrica}{etiqueta} {datos[campo]}")
+
+        return "\n".join(lineas) + "\n"
+
+    def guardar(self, ruta):
+        # Escribe las metricas en un archivo (ej: para el textfile collector de node_exporter)
+        with open(ruta, "w") as archivo:
+            archivo.write(self.texto())
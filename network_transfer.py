@@ -0,0 +1,441 @@
+"""
+Transferencia por Red - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+Este modulo envia los sobres digitales directamente a un receptor por TCP, en lugar de cifrar todo primero y luego
+copiar los archivos con scp. El cifrado y el envio se hacen al mismo tiempo:
+
+'Pipeline': Un hilo cifra el archivo (formato contenedor) y deja los bloques en una cola acotada, mientras otro hilo
+los envia por la red. La cola limita la memoria usada y frena al cifrado si la red es mas lenta. El tiempo total es
+aproximadamente max(cifrado, red) en lugar de la suma de ambos.
+'Conexiones persistentes': Los archivos se reparten entre un pool de conexiones que se reutilizan de un archivo al
+siguiente, sin abrir una conexion nueva por archivo.
+'Receptor': El servidor descifra cada archivo a medida que llega (formato autenticado) y lo guarda con su nombre en
+el directorio de destino. Un archivo incompleto o corrupto no se guarda.
+
+Protocolo (sobre una conexion TCP):
+    cliente: MAGIC_TRANSFERENCIA + version, luego por cada archivo:
+        [largo del nombre (2 bytes)][nombre] N veces: [largo (4 bytes)][bloque del contenedor] [0 (4 bytes)]
+    servidor: una linea JSON con el resultado de cada archivo
+
+Los datos viajan cifrados y autenticados (el receptor rechaza el formato sin autenticar), pero el servidor no
+autentica a los clientes: por defecto escucha solo en 127.0.0.1.
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import os
+import io
+import json
+import time
+import queue
+import socket
+import struct
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+
+# Contenedor en flujo: el emisor lo escribe y el receptor lo lee sin archivos intermedios
+from digital_envelope_sender import escribir_contenedor_flujo, cargar_claves_publicas, CONTENEDOR_EXT
+from digital_envelope_receiver import leer_contenedor_flujo, cargar_claves_privadas
+
+# Medicion de etapas y mensajes de progreso (modo silencioso)
+from metrics import etapa, mostrar, ultimo_error
+
+
+# Constantes
+MAGIC_TRANSFERENCIA = b"SOBRENET"
+VERSION_TRANSFERENCIA = 1
+HOST = "127.0.0.1"
+PUERTO = 9443
+CONEXIONES = 4
+SIZE_BLOQUE_RED = 256 * 1024   # Tamaño de cada bloque enviado
+BLOQUES_EN_COLA = 8            # Bloques cifrados que pueden esperar en la cola antes de frenar el cifrado
+FIN_ARCHIVO = 0
+CANCELADO = 0xFFFFFFFF         # El emisor no pudo terminar de cifrar el archivo
+SIZE_MAX_NOMBRE = 4096
+
+
+class TransferenciaCancelada(Exception):
+    # El emisor cancelo el archivo a mitad del envio
+    pass
+
+
+def leer_exacto(entrada, cantidad):
+    # Lee exactamente 'cantidad' bytes de la conexion. Lanza ConnectionError si se cierra antes
+    datos = entrada.read(cantidad)
+    if len(datos) != cantidad:
+        raise ConnectionError("La conexion se cerro a mitad de un mensaje.")
+    return datos
+
+
+# Emisor
+
+class EscritorCola:
+    # Objeto tipo archivo que agrupa lo que escribe el cifrado en bloques de SIZE_BLOQUE_RED y los deja en una cola
+    # Si la cola esta llena, write() espera (el cifrado se frena al ritmo de la red)
+    # Si el envio falla, 'cancelado' se activa y write() lanza ConnectionError para detener el cifrado
+
+    def __init__(self, cola, cancelado):
+        self._cola = cola
+        self._cancelado = cancelado
+        self._pendiente = bytearray()
+
+    def write(self, datos):
+        self._pendiente += datos
+        if len(self._pendiente) >= SIZE_BLOQUE_RED:
+            self._entregar()
+        return len(datos)
+
+    def flush(self):
+        if self._pendiente:
+            self._entregar()
+
+    def _entregar(self):
+        bloque = bytes(self._pendiente)
+        self._pendiente.clear()
+        while True:
+            if self._cancelado.is_set():
+                raise ConnectionError("El envio fue cancelado.")
+            try:
+                self._cola.put(bloque, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+
+class ConexionTransferencia:
+    # Conexion persistente con el receptor, se reutiliza para varios archivos
+
+    def __init__(self, host, puerto, timeout=None):
+        self.socket = socket.create_connection((host, puerto), timeout=timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.lector = self.socket.makefile("rb")
+        self.socket.sendall(MAGIC_TRANSFERENCIA + bytes([VERSION_TRANSFERENCIA]))
+
+    def cerrar(self):
+        self.lector.close()
+        self.socket.close()
+
+
+class PoolConexiones:
+    # Pool de conexiones persistentes con el receptor. Las conexiones se crean a medida que se necesitan
+    # Una conexion que fallo no se devuelve al pool: se cierra y la siguiente vez se crea otra
+
+    def __init__(self, host, puerto, cantidad=CONEXIONES):
+        self.host = host
+        self.puerto = puerto
+        self._libres = queue.LifoQueue()
+        self._disponibles = threading.Semaphore(cantidad)
+        self.creadas = 0
+
+    def tomar(self):
+        self._disponibles.acquire()
+        try:
+            return self._libres.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            conexion = ConexionTransferencia(self.host, self.puerto)
+        except OSError:
+            self._disponibles.release()
+            raise
+        self.creadas += 1
+        return conexion
+
+    def devolver(self, conexion, valida=True):
+        if valida:
+            self._libres.put(conexion)
+        else:
+            conexion.cerrar()
+        self._disponibles.release()
+
+    def cerrar(self):
+        while True:
+            try:
+                self._libres.get_nowait().cerrar()
+            except queue.Empty:
+                return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.cerrar()
+
+
+def enviar_archivo(conexion, ruta_archivo, claves_publicas, compresion=None, nombre=None, sesion=False):
+    # Cifra y envia un archivo por una conexion abierta: un hilo cifra y deja los bloques en la cola, y este hilo
+    # los envia a medida que estan listos. Retorna la respuesta del receptor (diccionario)
+    # Lanza OSError (ConnectionError) si la conexion falla; en ese caso la conexion no se debe reutilizar
+    nombre = (nombre or os.path.basename(ruta_archivo)).encode("utf-8")
+    if len(nombre) > SIZE_MAX_NOMBRE:
+        raise ValueError("Nombre de archivo demasiado largo.")
+    cola = queue.Queue(maxsize=BLOQUES_EN_COLA)
+    cancelado = threading.Event()
+    cifrado = {}
+
+    def cifrar():
+        # Productor: cifra el archivo en formato contenedor y deja los bloques en la cola
+        escritor = EscritorCola(cola, cancelado)
+        try:
+            with open(ruta_archivo, "rb") as entrada:
+                cifrado["bytes"] = escribir_contenedor_flujo(entrada, escritor, claves_publicas, compresion, True, sesion)
+            final = None
+        except Exception as error:
+            final = error
+        # Al final se deja el marcador de fin (None) o el error
+        while not cancelado.is_set():
+            try:
+                cola.put(final, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    productor = threading.Thread(target=cifrar, daemon=True)
+    productor.start()
+
+    try:
+        conexion.socket.sendall(struct.pack(">H", len(nombre)) + nombre)
+
+        # Consumidor: envia cada bloque con su largo, hasta el marcador de fin
+        while True:
+            bloque = cola.get()
+            if isinstance(bloque, bytes):
+                conexion.socket.sendall(struct.pack(">I", len(bloque)))
+                conexion.socket.sendall(bloque)
+            elif bloque is None:
+                conexion.socket.sendall(struct.pack(">I", FIN_ARCHIVO))
+                break
+            else:
+                conexion.socket.sendall(struct.pack(">I", CANCELADO))
+                cifrado["error"] = f"{type(bloque).__name__}: {bloque}"
+                break
+
+        respuesta = conexion.lector.readline()
+        if not respuesta:
+            raise ConnectionError("El receptor cerro la conexion.")
+    except BaseException:
+        # Detener el cifrado y liberar la cola para que el productor termine
+        cancelado.set()
+        raise
+    finally:
+        productor.join()
+
+    resultado = json.loads(respuesta)
+    if "error" in cifrado:
+        resultado["error"] = cifrado["error"]
+    resultado["bytes"] = cifrado.get("bytes", 0)
+    return resultado
+
+
+def enviar_archivos(rutas, ruta_clave_publica_receptor, host=HOST, puerto=PUERTO, conexiones=CONEXIONES,
+                    compresion=None, sesion=False):
+    # Envia cada archivo de 'rutas' al receptor, cifrandolo mientras se transfiere
+    # Los archivos se reparten entre 'conexiones' hilos, cada uno con una conexion persistente del pool
+    # Con sesion=True todos los archivos comparten la clave de sesion de los destinatarios (ver session_keys.py),
+    # asi el receptor hace una sola operacion RSA privada en lugar de una por archivo
+    # Un error en un archivo no detiene el resto. Retorna la lista de resultados y un resumen, o (None, None)
+    # si las claves no se pudieron cargar
+    claves_publicas = cargar_claves_publicas(ruta_clave_publica_receptor)
+    if claves_publicas is None:
+        return None, None
+
+    def enviar(ruta):
+        inicio = time.perf_counter()
+        resultado = {"archivo": ruta, "ok": False, "bytes": 0, "error": None}
+        if not os.path.isfile(ruta):
+            resultado["error"] = f"El archivo '{ruta}' no existe."
+            return resultado
+
+        try:
+            conexion = pool.tomar()
+        except OSError as error:
+            resultado["error"] = f"No se pudo conectar con {host}:{puerto}: {error}"
+            return resultado
+
+        valida = False
+        try:
+            with etapa("transferir", formato="contenedor") as medicion:
+                respuesta = enviar_archivo(conexion, ruta, claves_publicas, compresion, sesion=sesion)
+                medicion["bytes"] = respuesta["bytes"]
+            valida = True
+            resultado.update(ok=bool(respuesta.get("ok")) and not respuesta.get("error"), bytes=respuesta["bytes"],
+                             destino=respuesta.get("archivo"), error=respuesta.get("error"))
+        except (OSError, ValueError) as error:
+            resultado["error"] = f"{type(error).__name__}: {error}"
+        finally:
+            pool.devolver(conexion, valida)
+
+        resultado["segundos"] = time.perf_counter() - inicio
+        return resultado
+
+    mostrar(f"\nEnviando {len(rutas)} archivos a {host}:{puerto} con {conexiones} conexiones...")
+    inicio = time.perf_counter()
+    resultados = []
+    with PoolConexiones(host, puerto, conexiones) as pool, ThreadPoolExecutor(max_workers=conexiones) as hilos:
+        for resultado in hilos.map(enviar, rutas):
+            resultados.append(resultado)
+            if resultado["ok"]:
+                mostrar(f"  [OK]    {resultado['archivo']} ({resultado['bytes']} bytes, {resultado['segundos']:.3f} s)")
+            else:
+                print(f"  [ERROR] {resultado['archivo']}: {resultado['error']}")
+
+    segundos = time.perf_counter() - inicio
+    exitosos = [r for r in resultados if r["ok"]]
+    total_bytes = sum(r["bytes"] for r in exitosos)
+    resumen = {
+        "archivos": len(resultados),
+        "exitosos": len(exitosos),
+        "fallidos": len(resultados) - len(exitosos),
+        "bytes": total_bytes,
+        "conexiones": pool.creadas,
+        "segundos": segundos,
+        "mb_por_segundo": total_bytes / (1024 * 1024) / segundos if segundos > 0 else 0.0,
+    }
+
+    print(f"\n{'=' * 60}")
+    print("  TRANSFERENCIA FINALIZADA")
+    print(f"{'=' * 60}")
+    print(f"  Archivos: {resumen['archivos']} ({resumen['exitosos']} exitosos, {resumen['fallidos']} con error)")
+    print(f"  Datos: {resumen['bytes']} bytes en {resumen['segundos']:.2f} s ({resumen['mb_por_segundo']:.2f} MB/s), "
+          f"{resumen['conexiones']} conexiones")
+    print(f"{'=' * 60}")
+
+    return resultados, resumen
+
+
+# Receptor
+
+class LectorBloques(io.RawIOBase):
+    # Entrega mediante readinto() los datos de los bloques [largo][datos] de un archivo, hasta el bloque de fin
+    # Lanza TransferenciaCancelada si el emisor cancela el archivo
+
+    def __init__(self, entrada):
+        self._entrada = entrada
+        self._restante = 0
+        self.terminado = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._restante == 0:
+            if self.terminado:
+                return 0
+            (largo,) = struct.unpack(">I", leer_exacto(self._entrada, 4))
+            if largo == FIN_ARCHIVO:
+                self.terminado = True
+                return 0
+            if largo == CANCELADO:
+                self.terminado = True
+                raise TransferenciaCancelada("El emisor cancelo el archivo.")
+            self._restante = largo
+
+        cantidad = self._entrada.readinto(memoryview(buffer)[:min(len(buffer), self._restante)])
+        if not cantidad:
+            raise ConnectionError("La conexion se cerro a mitad de un archivo.")
+        self._restante -= cantidad
+        return cantidad
+
+    def descartar(self):
+        # Consume lo que queda del archivo (ej: despues de un error), para poder recibir el siguiente
+        buffer = bytearray(SIZE_BLOQUE_RED)
+        while self.readinto(buffer):
+            pass
+
+
+class ManejadorTransferencia(socketserver.StreamRequestHandler):
+    # Atiende una conexion persistente: recibe y descifra archivos hasta que el emisor cierra la conexion
+
+    def handle(self):
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        saludo = self.rfile.read(len(MAGIC_TRANSFERENCIA) + 1)
+        if saludo != MAGIC_TRANSFERENCIA + bytes([VERSION_TRANSFERENCIA]):
+            return
+
+        while True:
+            largo = self.rfile.read(2)
+            if not largo:
+                return      # El emisor cerro la conexion entre archivos
+            try:
+                (largo,) = struct.unpack(">H", largo)
+                if largo > SIZE_MAX_NOMBRE:
+                    return
+                nombre = leer_exacto(self.rfile, largo).decode("utf-8")
+                resultado = self.recibir_archivo(nombre)
+            except (ConnectionError, struct.error, UnicodeDecodeError):
+                # Mensaje invalido o conexion cerrada a mitad de un archivo: se cierra la conexion
+                return
+
+            self.wfile.write((json.dumps(resultado, ensure_ascii=False) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+    def recibir_archivo(self, nombre):
+        # Descifra el archivo a medida que llega, en un temporal que solo se renombra si el archivo es valido
+        # Solo se usa el nombre base: el emisor no puede escribir fuera del directorio de destino
+        servidor = self.server
+        nombre = os.path.basename(nombre)
+        if nombre.endswith(CONTENEDOR_EXT):
+            nombre = nombre[:-len(CONTENEDOR_EXT)]
+        resultado = {"archivo": nombre, "ok": False}
+        lector = LectorBloques(self.rfile)
+
+        if not nombre or nombre.startswith("."):
+            lector.descartar()
+            resultado["error"] = "Nombre de archivo invalido."
+            return resultado
+
+        ruta = os.path.join(servidor.directorio, nombre)
+        temporal = os.path.join(servidor.directorio, f".{nombre}.{threading.get_ident()}.parcial")
+        size = None
+        ultimo_error(limpiar=True)
+        try:
+            with etapa("recibir", formato="contenedor") as medicion, open(temporal, "wb") as salida:
+                # BufferedReader completa las lecturas de tamaño fijo (cabeceras) aunque crucen de un bloque al siguiente
+                # Solo se acepta el formato autenticado: los datos de la red no se descifran ni descomprimen sin verificarlos
+                size = leer_contenedor_flujo(io.BufferedReader(lector, SIZE_BLOQUE_RED), salida, servidor.claves_privadas,
+                                             requerir_autenticado=True)
+                medicion["bytes"] = size or 0
+                medicion["ok"] = size is not None
+            lector.descartar()
+        except TransferenciaCancelada as error:
+            resultado["error"] = str(error)
+        finally:
+            if size is None or not lector.terminado:
+                os.remove(temporal)
+
+        if size is None:
+            resultado.setdefault("error", ultimo_error(limpiar=True) or "No se pudo descifrar el archivo (clave incorrecta o datos corruptos).")
+            return resultado
+
+        os.replace(temporal, ruta)
+        mostrar(f"  [RECIBIDO] {ruta} ({size} bytes)")
+        resultado.update(ok=True, bytes=size)
+        return resultado
+
+
+class ServidorTransferencia(socketserver.ThreadingTCPServer):
+    # Receptor: un hilo por conexion, las claves privadas se cargan una sola vez al iniciar
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, directorio, claves_privadas, host=HOST, puerto=PUERTO):
+        self.directorio = directorio
+        self.claves_privadas = claves_privadas
+        super().__init__((host, puerto), ManejadorTransferencia)
+
+
+def crear_servidor(directorio, ruta_clave_privada=None, host=HOST, puerto=PUERTO):
+    # Crea el receptor que guarda los archivos descifrados en 'directorio' (puerto=0 elige un puerto libre)
+    # 'ruta_clave_privada' es una clave, una lista de claves, o None para buscarlas por huella en el indice
+    # Retorna el servidor (usar serve_forever() o iniciarlo en un hilo), o None si hubo un error
+    claves_privadas = cargar_claves_privadas(ruta_clave_privada)
+    if claves_privadas is None:
+        return None
+
+    os.makedirs(directorio, exist_ok=True)
+    return ServidorTransferencia(directorio, claves_privadas, host, puerto)
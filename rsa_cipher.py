@@ -12,9 +12,47 @@ Fecha: Febrero 2026
 """
 
 # Includes
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from Crypto.Cipher import PKCS1_OAEP  # Implementación del cifrado RSA con padding OAEP
 from Crypto.Hash import SHA256         # Función hash SHA-256, usada internamente por OAEP
+from Crypto.PublicKey import RSA       # Para reconstruir la clave en los procesos del pool
+
+from metrics import etapa, mostrar     # Medicion de etapas y mensajes de progreso (modo silencioso)
+
+
+# Constantes
+MIN_LOTE_PARALELO = 8   # Con menos elementos el lote se procesa en el mismo hilo, el pool no compensa su costo
+
+
+class ContextoRSA:
+    # Contexto de cifrado RSA-OAEP-SHA256 asociado a una clave
+    # Reutiliza el objeto PKCS1_OAEP en lugar de crearlo en cada llamada. Cada hilo tiene su propio objeto,
+    # por lo que un mismo contexto se puede usar desde varios hilos a la vez
+
+    def __init__(self, clave):
+        self.clave = clave
+        self._local = threading.local()
+
+    def _cifrador(self):
+        cifrador = getattr(self._local, "cifrador", None)
+        if cifrador is None:
+            cifrador = PKCS1_OAEP.new(self.clave, hashAlgo=SHA256)
+            self._local.cifrador = cifrador
+        return cifrador
+
+    def cifrar(self, datos_planos):
+        # Cifra datos con la clave del contexto (publica o privada, se usa su parte publica)
+        return self._cifrador().encrypt(datos_planos)
+
+    def descifrar(self, datos_cifrados):
+        # Descifra datos con la clave privada del contexto. Retorna None si la clave no es correcta o los datos estan corruptos
+        try:
+            return self._cifrador().decrypt(datos_cifrados)
+        except (ValueError, TypeError):
+            return None
 
 
 
@@ -22,11 +60,12 @@ def cifrar_con_rsa(datos_planos, clave_publica):
     # Esta funcion cifra datos usando RSA-OAEP con SHA 256 y la clave publica del destinatario
     # El resultado es un bloque de datos cifrados con el mismo tamaño que la clave RSA (384 bytes para RSA 3072 bits)
 
-    # Crear el objeto cifrador RSA-OAEP
-    cifrador = PKCS1_OAEP.new(clave_publica, hashAlgo=SHA256)
+    with etapa("rsa_cifrar", len(datos_planos)):
+        # Crear el objeto cifrador RSA-OAEP
+        cifrador = PKCS1_OAEP.new(clave_publica, hashAlgo=SHA256)
 
-    # Cifrar los datos con RSA-OAEP
-    datos_cifrados = cifrador.encrypt(datos_planos)
+        # Cifrar los datos con RSA-OAEP
+        datos_cifrados = cifrador.encrypt(datos_planos)
 
     return datos_cifrados
 
@@ -36,13 +75,84 @@ def descifrar_con_rsa(datos_cifrados, clave_privada):
     
     # Crear el objeto descifrador RSA-OAEP con la misma configuracion que el cifrador
 
-    descifrador = PKCS1_OAEP.new(clave_privada, hashAlgo=SHA256)
+    with etapa("rsa_descifrar", len(datos_cifrados)) as medicion:
+        descifrador = PKCS1_OAEP.new(clave_privada, hashAlgo=SHA256)
 
-    # Intentar descifrar los datos, si la clave no es correcta o los datos estan corruptos, lanza una excepcion ValueError
-    try:
-        datos_planos = descifrador.decrypt(datos_cifrados)
-    except ValueError as error:
-        print(f"Error al descifrar con RSA: clave privada incorrecta o datos corruptos.")
-        return None  
+        # Intentar descifrar los datos, si la clave no es correcta o los datos estan corruptos, lanza una excepcion ValueError
+        try:
+            datos_planos = descifrador.decrypt(datos_cifrados)
+        except ValueError as error:
+            mostrar("Error al descifrar con RSA: clave privada incorrecta o datos corruptos.")
+            medicion["ok"] = False
+            return None  
     # Retornar los datos originales descifrados
     return datos_planos
+
+
+# Contexto de cada proceso del pool, se crea una sola vez por proceso en _iniciar_proceso
+_contexto_proceso = None
+
+
+def _iniciar_proceso(clave_der):
+    global _contexto_proceso
+    _contexto_proceso = ContextoRSA(RSA.import_key(clave_der))
+
+
+def _cifrar_en_proceso(datos_planos):
+    try:
+        return _contexto_proceso.cifrar(datos_planos)
+    except (ValueError, TypeError):
+        return None
+
+
+def _descifrar_en_proceso(datos_cifrados):
+    return _contexto_proceso.descifrar(datos_cifrados)
+
+
+def _procesar_lote(lista_datos, clave, operacion, trabajadores, procesos):
+    # Aplica 'operacion' ("cifrar" o "descifrar") a cada elemento, manteniendo el orden de la lista
+    # Un error en un elemento deja None en su posicion y no detiene el resto del lote
+    contexto = clave if isinstance(clave, ContextoRSA) else ContextoRSA(clave)
+    lista_datos = list(lista_datos)
+
+    def funcion_local(datos):
+        try:
+            return getattr(contexto, operacion)(datos)
+        except (ValueError, TypeError):
+            return None
+
+    if len(lista_datos) < MIN_LOTE_PARALELO or trabajadores == 1:
+        return [funcion_local(datos) for datos in lista_datos]
+
+    trabajadores = trabajadores or os.cpu_count() or 1
+
+    if procesos:
+        # La clave se envia a cada proceso una sola vez, en formato DER
+        funcion = _cifrar_en_proceso if operacion == "cifrar" else _descifrar_en_proceso
+        tamano_tarea = max(1, len(lista_datos) // (trabajadores * 4))
+        with ProcessPoolExecutor(max_workers=trabajadores, initializer=_iniciar_proceso,
+                                 initargs=(contexto.clave.export_key(format='DER'),)) as pool:
+            return list(pool.map(funcion, lista_datos, chunksize=tamano_tarea))
+
+    # Las operaciones de RSA se hacen en GMP, que libera el GIL, por lo que los hilos si corren en paralelo
+    with ThreadPoolExecutor(max_workers=trabajadores) as pool:
+        return list(pool.map(funcion_local, lista_datos))
+
+
+def cifrar_lote(lista_datos, clave_publica, trabajadores=None, procesos=False):
+    # Cifra una lista de datos con la misma clave publica (o ContextoRSA) y retorna la lista de resultados en el mismo orden
+    # Los elementos que no se pudieron cifrar (ej: datos muy largos para la clave) quedan como None
+    lista_datos = list(lista_datos)
+    with etapa("rsa_cifrar_lote", sum(len(datos) for datos in lista_datos), cantidad=len(lista_datos)):
+        return _procesar_lote(lista_datos, clave_publica, "cifrar", trabajadores, procesos)
+
+
+def descifrar_lote(lista_datos, clave_privada, trabajadores=None, procesos=False):
+    # Descifra una lista de datos con la misma clave privada (o ContextoRSA) y retorna la lista de resultados en el mismo orden
+    # Los elementos que no se pudieron descifrar (clave incorrecta o datos corruptos) quedan como None
+    # Con procesos=True se usa un pool de procesos en lugar de hilos
+    lista_datos = list(lista_datos)
+    with etapa("rsa_descifrar_lote", sum(len(datos) for datos in lista_datos), cantidad=len(lista_datos)) as medicion:
+        resultados = _procesar_lote(lista_datos, clave_privada, "descifrar", trabajadores, procesos)
+        medicion["errores"] = resultados.count(None)
+        return resultados
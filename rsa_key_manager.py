@@ -17,8 +17,17 @@ Fecha: Febrero 2026
 
 import os   
 import sys  
+import struct
+import threading
+import sqlite3
+from collections import OrderedDict
 
 from Crypto.PublicKey import RSA  # Modulo de PyCryptodome para generar, importar y exportar claves RSA
+from Crypto.Util.asn1 import DerSequence  # Lectura de la clave privada en DER (PKCS#1) del cache en disco
+from Crypto.Hash import SHA256     # Hash usado para calcular la huella de las claves
+
+from metrics import etapa, mostrar, reportar_error  # Medicion de etapas y mensajes de progreso (modo silencioso)
+import key_index                    # Indice persistente de claves (busqueda por nombre o huella, listado por paginas)
 
 
 #Const
@@ -26,16 +35,36 @@ from Crypto.PublicKey import RSA  # Modulo de PyCryptodome para generar, importa
 RSA_KEY_SIZE = 3072  # Tamaño de la clave RSA
 KEYS_DIR = "keys"    # Drectorio donde se guardan las claves RSA generadas
 
+# Cache de claves ya parseadas, para no repetir RSA.import_key en cada envio/recepcion
+MAX_CACHE_CLAVES = 32       # Cantidad maxima de claves en memoria (se descarta la usada hace mas tiempo)
+CACHE_DER = False           # Si es True se guarda una copia DER junto a cada PEM para acelerar el primer cargue del proceso
+CACHE_DIR = ".cache"        # Subdirectorio (junto al PEM) donde se guardan las copias DER
+
+_cache_claves = OrderedDict()   # ruta absoluta -> (mtime_ns, size, passphrase, clave)
+_lock_cache = threading.Lock()
+
+# Sufijos de los archivos de claves y tipo que se guarda en el indice
+SUFIJOS_CLAVES = {"_public.pem": "publica", "_private.pem": "privada"}
 
 
-def generar_par_claves(nombre_maquina):
+
+def generar_par_claves(nombre_maquina, pool=None, usar_pool=False):
     # Genera las claves RSA con el nombre del host y las guarda en el directorio keys
+    # Si se indica un pool (rsa_key_pool.PoolClaves) el par se toma de este. Con usar_pool=True se usa un par ya
+    # generado de keys/.pool/ si hay alguno disponible. Por defecto el par se genera en el momento
 
-    # Crear el directorio keys
+    # Crear el directorio keys, y poner el indice al dia antes de agregar las claves nuevas
     os.makedirs(KEYS_DIR, exist_ok=True)
+    sincronizar_indice()
 
-    # Generar el par de claves RSA usando PyCryptodome
-    par_claves = RSA.generate(RSA_KEY_SIZE)
+    # Obtener el par de claves RSA del pool, o generarlo usando PyCryptodome
+    if pool is not None:
+        par_claves = pool.tomar()
+    elif usar_pool:
+        from rsa_key_pool import tomar_par     # Import local: rsa_key_pool depende de este modulo
+        par_claves = tomar_par() or RSA.generate(RSA_KEY_SIZE)
+    else:
+        par_claves = RSA.generate(RSA_KEY_SIZE)
 
     # Exportar la clave privada 
     clave_privada_pem = par_claves.export_key(format='PEM')
@@ -60,6 +89,13 @@ def generar_par_claves(nombre_maquina):
     with open(ruta_publica, 'wb') as archivo_publico:
         archivo_publico.write(clave_publica_pem)
 
+    # Si ya existian claves con este nombre, descartar las versiones del cache
+    invalidar_clave(ruta_privada)
+    invalidar_clave(ruta_publica)
+
+    # Registrar ambas claves en el indice sin recorrer el directorio
+    _indexar_claves([(ruta_privada, par_claves), (ruta_publica, par_claves.publickey())])
+
     # Info para al usuario
     print(f"\n  Clave privada guardada en: {ruta_privada}")
     print(f"  Clave publica guardada en: {ruta_publica}")
@@ -69,71 +105,340 @@ def generar_par_claves(nombre_maquina):
     return ruta_privada, ruta_publica
 
 
+def _ruta_cache_der(ruta):
+    # Ruta de la copia DER de una clave: keys/.cache/<nombre>.der
+    directorio, nombre = os.path.split(os.path.abspath(ruta))
+    return os.path.join(directorio, CACHE_DIR, nombre + ".der")
+
+
+def _leer_cache_der(ruta, estado):
+    # Lee la copia DER de la clave si existe y corresponde al PEM actual (mismo mtime y tamaño)
+    # Retorna None si no hay copia valida
+    try:
+        with open(_ruta_cache_der(ruta), 'rb') as archivo:
+            contenido = archivo.read()
+    except OSError:
+        return None
+
+    if len(contenido) < 16 or struct.unpack(">QQ", contenido[:16]) != (estado.st_mtime_ns, estado.st_size):
+        return None
+
+    der = contenido[16:]
+    try:
+        enteros = DerSequence().decode(der)
+        if len(enteros) == 9:
+            # Clave privada PKCS#1: [version, n, e, d, p, q, ...]. Ya fue validada al crear la copia,
+            # por lo que se omite la verificacion de consistencia que es la parte costosa de import_key
+            return RSA.construct(tuple(enteros[1:6]), consistency_check=False)
+        return RSA.import_key(der)
+    except (ValueError, IndexError, TypeError):
+        return None
+
+
+def _escribir_cache_der(ruta, estado, clave):
+    # Guarda la copia DER de la clave junto al PEM, con los mismos permisos restrictivos (600)
+    ruta_der = _ruta_cache_der(ruta)
+    os.makedirs(os.path.dirname(ruta_der), mode=0o700, exist_ok=True)
+
+    der = clave.export_key(format='DER', pkcs=1) if clave.has_private() else clave.export_key(format='DER')
+    ruta_temporal = ruta_der + ".tmp"
+    with open(os.open(ruta_temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as archivo:
+        archivo.write(struct.pack(">QQ", estado.st_mtime_ns, estado.st_size))
+        archivo.write(der)
+    os.replace(ruta_temporal, ruta_der)
+
+
+def _cargar_clave(ruta, passphrase=None):
+    # Carga una clave desde el cache si el archivo no cambio (mismo mtime y tamaño), si no la parsea del PEM
+    ruta_absoluta = os.path.abspath(ruta)
+    estado = os.stat(ruta_absoluta)
+
+    with _lock_cache:
+        entrada = _cache_claves.get(ruta_absoluta)
+        if entrada is not None and entrada[:3] == (estado.st_mtime_ns, estado.st_size, passphrase):
+            _cache_claves.move_to_end(ruta_absoluta)
+            return entrada[3]
+
+    # La copia DER solo se usa con claves sin passphrase, para no dejar en disco una clave protegida sin cifrar
+    clave = _leer_cache_der(ruta_absoluta, estado) if CACHE_DER and passphrase is None else None
+
+    if clave is None:
+        # Abrir el archivo en modo binario y leer su contenido 
+        with open(ruta_absoluta, 'rb') as archivo:
+            contenido_pem = archivo.read() 
+
+        # import_key() parsea el formato PEM y reconstruye el objeto de clave RSA
+        # Tambien detecte si es la clave publica o privada automaticamente por el header del archivo PEM
+        clave = RSA.import_key(contenido_pem, passphrase=passphrase)
+
+        if CACHE_DER and passphrase is None:
+            _escribir_cache_der(ruta_absoluta, estado, clave)
+
+    with _lock_cache:
+        _cache_claves[ruta_absoluta] = (estado.st_mtime_ns, estado.st_size, passphrase, clave)
+        _cache_claves.move_to_end(ruta_absoluta)
+        while len(_cache_claves) > MAX_CACHE_CLAVES:
+            _cache_claves.popitem(last=False)
+
+    return clave
+
+
+def invalidar_clave(ruta):
+    # Elimina una clave del cache en memoria y su copia DER en disco (ej: despues de rotar o borrar la clave)
+    with _lock_cache:
+        _cache_claves.pop(os.path.abspath(ruta), None)
+
+    try:
+        os.remove(_ruta_cache_der(ruta))
+    except OSError:
+        pass
+
+
+def limpiar_cache_claves():
+    # Vacia el cache de claves en memoria
+    with _lock_cache:
+        _cache_claves.clear()
+
+
 def cargar_clave_publica(ruta):
 
     #Carga una clave publica RSA desde la ruta de un archivo .PEM. Retorna un objeto de clave RSA para cifrar con RSA-OAEP
 
-    # Verificar que el archivo existe antes de intentar leerlo
-    if not os.path.isfile(ruta):
-        print(f"Error: El archivo de clave publica '{ruta}' no existe.")
-        return None  
+    with etapa("cargar_clave", tipo="publica") as medicion:
 
-    # Abrir el archivo en modo binario y leer su contenido 
-    with open(ruta, 'rb') as archivo:
-        contenido_pem = archivo.read() 
+        # Si la ruta no existe se busca en el indice como nombre de host o huella (ej: "student2")
+        if not os.path.isfile(ruta):
+            ruta = buscar_clave(ruta, "publica") or ruta
 
-    # import_key() parsea el formato PEM y reconstruye el objeto de clave RSA
-    # Tambien detecte si es la clave publica o privada automaticamente por el header del archivo PEM
-    clave_publica = RSA.import_key(contenido_pem)
+        # Verificar que el archivo existe antes de intentar leerlo
+        if not os.path.isfile(ruta):
+            reportar_error(f"El archivo de clave publica '{ruta}' no existe.")
+            medicion["ok"] = False
+            return None  
 
-    print(f"Clave publica cargada desde: {ruta}")
+        # Se obtiene del cache de claves si ya fue parseada y el archivo no cambio
+        clave_publica = _cargar_clave(ruta)
+
+    mostrar(f"Clave publica cargada desde: {ruta}")
 
     # Return del objeto de clave RSA 
     return clave_publica
 
 
-def cargar_clave_privada(ruta):
+def cargar_clave_privada(ruta, passphrase=None):
     #Carga una clave privada RSA desde la ruta de un archivo .PEM. Retorna un objeto de clave RSA para descifrar con RSA-OAEP
+    #Si la clave esta protegida se debe indicar la passphrase, gracias al cache su derivacion se hace una sola vez
     
-    # Verificar que el archivo existe antes de intentar leerlo
-    if not os.path.isfile(ruta):
-        print(f"Error: El archivo de clave privada '{ruta}' no existe.")
-        return None  
+    with etapa("cargar_clave", tipo="privada") as medicion:
+
+        # Si la ruta no existe se busca en el indice como nombre de host o huella
+        if not os.path.isfile(ruta):
+            ruta = buscar_clave(ruta, "privada") or ruta
 
-    # Abrir el archivo en modo binario y leer su contenido
-    with open(ruta, 'rb') as archivo:
-        contenido_pem = archivo.read() 
+        # Verificar que el archivo existe antes de intentar leerlo
+        if not os.path.isfile(ruta):
+            reportar_error(f"El archivo de clave privada '{ruta}' no existe.")
+            medicion["ok"] = False
+            return None  
 
-    # import_key() parsea el formato PEM y reconstruye el objeto de clave RSA
-    # Para claves privadas, el objeto resultante contiene tanto la parte privada como la pública
-    clave_privada = RSA.import_key(contenido_pem)
+        # Se obtiene del cache de claves si ya fue parseada y el archivo no cambio
+        # Para claves privadas, el objeto resultante contiene tanto la parte privada como la pública
+        try:
+            clave_privada = _cargar_clave(ruta, passphrase)
+        except ValueError:
+            reportar_error(f"No se pudo leer la clave privada '{ruta}' (passphrase incorrecta o archivo corrupto).")
+            medicion["ok"] = False
+            return None
 
-    print(f"Clave privada cargada desde: {ruta}")
+    mostrar(f"Clave privada cargada desde: {ruta}")
 
     # Return del objeto de clave RSA
     return clave_privada
 
 
-def listar_claves():
-    # Lista las claves RSA en el directorio keys 
+def huella_clave(clave):
+    # Calcula la huella (identificador) de una clave RSA: SHA-256 de la clave publica en formato DER
+    # Para una clave privada se usa su parte publica, de manera que ambas claves del par tienen la misma huella
+    clave_publica_der = clave.publickey().export_key(format='DER')
+    return SHA256.new(clave_publica_der).digest()
+
+
+def nombre_y_tipo(archivo):
+    # Obtiene el nombre del host y el tipo de clave a partir del nombre del archivo (ej: student1_public.pem)
+    # Los archivos que no siguen la convencion usan el nombre completo, y el tipo se detecta al parsear la clave
+    for sufijo, tipo in SUFIJOS_CLAVES.items():
+        if archivo.endswith(sufijo):
+            return archivo[:-len(sufijo)], tipo
+    return archivo[:-len(".pem")], None
+
+
+def _indexar_claves(claves):
+    # Registra en el indice una lista de (ruta, clave) recien escritas, y marca el indice como actualizado
+    filas = []
+    for ruta, clave in claves:
+        estado = os.stat(ruta)
+        archivo = os.path.basename(ruta)
+        nombre, _ = nombre_y_tipo(archivo)
+        tipo = "privada" if clave.has_private() else "publica"
+        filas.append((archivo, nombre, tipo, huella_clave(clave), clave.size_in_bits(), estado.st_mtime_ns, estado.st_size))
+
+    key_index.registrar(KEYS_DIR, filas)
+    key_index.guardar_meta(KEYS_DIR, "mtime_directorio", os.stat(KEYS_DIR).st_mtime_ns)
+
+
+def _fila_indice(archivo, ruta, estado):
+    # Fila del indice de un archivo de clave: (archivo, nombre, tipo, huella, bits, mtime_ns, size)
+    nombre, tipo = nombre_y_tipo(archivo)
+    try:
+        clave = _cargar_clave(ruta)
+        huella, bits = huella_clave(clave), clave.size_in_bits()
+        tipo = "privada" if clave.has_private() else "publica"
+    except (ValueError, OSError):
+        # Clave protegida con passphrase, corrupta o sin permisos de lectura: se indexa sin huella, solo por nombre
+        huella, bits = None, None
+        tipo = tipo or "privada"
+    return (archivo, nombre, tipo, huella, bits, estado.st_mtime_ns, estado.st_size)
+
+
+def sincronizar_indice(forzar=False):
+    # Pone al dia el indice de claves con el contenido del directorio keys
+    # Si el mtime del directorio no cambio desde la ultima sincronizacion no se agregaron ni borraron claves,
+    # y basta un stat() para saberlo. Si cambio (o con forzar=True) se recorre el directorio y solo se parsean las
+    # claves nuevas o con otro mtime o tamaño. Una clave reescrita en el mismo archivo no cambia el mtime del
+    # directorio: buscar_clave() la detecta al comparar el mtime y el tamaño del archivo con su fila del indice
+    # Retorna False si el directorio de claves no existe o el indice no se pudo actualizar
+    if not os.path.isdir(KEYS_DIR):
+        return False
+
+    try:
+        # Abrir el indice antes del stat: al crearlo por primera vez se agrega keys/.indice/ y cambia el mtime del directorio
+        key_index.conectar(KEYS_DIR)
+        estado_directorio = os.stat(KEYS_DIR)
+
+        if not forzar and key_index.leer_meta(KEYS_DIR, "mtime_directorio") == estado_directorio.st_mtime_ns:
+            return True
+
+        indexadas = key_index.entradas(KEYS_DIR)
+        presentes = set()
+        filas = []
+
+        for entrada in os.scandir(KEYS_DIR):
+            if not entrada.name.endswith('.pem') or not entrada.is_file():
+                continue
+            try:
+                estado = entrada.stat()
+            except OSError:
+                continue    # Se borro mientras se recorria el directorio
+            presentes.add(entrada.name)
+
+            if indexadas.get(entrada.name) != (estado.st_mtime_ns, estado.st_size):
+                filas.append(_fila_indice(entrada.name, entrada.path, estado))
+
+        key_index.registrar(KEYS_DIR, filas)
+        key_index.quitar(KEYS_DIR, set(indexadas) - presentes)
+
+        key_index.guardar_meta(KEYS_DIR, "mtime_directorio", estado_directorio.st_mtime_ns)
+    except (OSError, sqlite3.Error) as error:
+        reportar_error(f"No se pudo actualizar el indice de claves: {error}")
+        return False
+    return True
+
+
+def _buscar_en_indice(referencia, tipo):
+    # Busca la clave por huella o por nombre en el indice, y retorna su ruta solo si el archivo no cambio desde
+    # que se indexo (mismo mtime y tamaño). Si se borro se quita del indice. Retorna None si no esta o cambio
+    archivo = None
+    try:
+        huella = bytes.fromhex(referencia)
+    except ValueError:
+        huella = None
+    if huella is not None and len(huella) == SHA256.digest_size:
+        archivo = key_index.buscar_huella(KEYS_DIR, huella, tipo)
+    if archivo is None:
+        archivo = key_index.buscar_nombre(KEYS_DIR, referencia, tipo)
+    if archivo is None:
+        return None
+
+    ruta = os.path.join(KEYS_DIR, archivo)
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError:
+        key_index.quitar(KEYS_DIR, [archivo])
+        return None
+    if key_index.estado_entrada(KEYS_DIR, archivo) != (estado.st_mtime_ns, estado.st_size):
+        return None
+    return ruta
+
+
+def buscar_clave(referencia, tipo="publica"):
+    # Busca en el indice la clave de un host por su nombre (ej: "student2") o por su huella en hexadecimal
+    # Si no la encuentra, o el archivo cambio desde que se indexo (ej: una clave reescrita en el mismo archivo
+    # conserva la huella anterior en el indice), se revisan todos los archivos por mtime y tamaño y se busca de nuevo
+    # Retorna la ruta del archivo .pem, o None si no existe
+    if not sincronizar_indice():
+        return None
+
+    try:
+        ruta = _buscar_en_indice(referencia, tipo)
+        if ruta is None and sincronizar_indice(forzar=True):
+            ruta = _buscar_en_indice(referencia, tipo)
+    except sqlite3.Error as error:
+        reportar_error(f"No se pudo leer el indice de claves: {error}")
+        return None
+    return ruta
+
+
+def buscar_clave_privada_por_huella(huella):
+    # Busca en el indice la clave privada que corresponde a una huella (la huella de su clave publica)
+    # Las claves privadas protegidas con passphrase no tienen huella en el indice: se buscan por el nombre
+    # del host de la clave publica con esa huella. Retorna la ruta o None
+    ruta = buscar_clave(huella.hex(), "privada")
+    if ruta is None:
+        ruta_publica = buscar_clave(huella.hex(), "publica")
+        if ruta_publica is not None:
+            nombre, _ = nombre_y_tipo(os.path.basename(ruta_publica))
+            ruta = buscar_clave(nombre, "privada")
+    return ruta
+
+
+def eliminar_par_claves(nombre_maquina):
+    # Borra las claves de un host del directorio keys, del cache y del indice
+    # Retorna la lista de rutas borradas
+    sincronizar_indice()
+    borradas = []
+    for sufijo in SUFIJOS_CLAVES:
+        ruta = os.path.join(KEYS_DIR, f"{nombre_maquina}{sufijo}")
+        if os.path.isfile(ruta):
+            os.remove(ruta)
+            invalidar_clave(ruta)
+            borradas.append(ruta)
+
+    if borradas:
+        key_index.quitar(KEYS_DIR, [os.path.basename(ruta) for ruta in borradas])
+        key_index.guardar_meta(KEYS_DIR, "mtime_directorio", os.stat(KEYS_DIR).st_mtime_ns)
+    return borradas
+
+
+def listar_claves(pagina=None, por_pagina=key_index.POR_PAGINA):
+    # Lista las claves RSA en el directorio keys, a partir del indice (sin recorrer el directorio)
+    # Con 'pagina' (la primera es la 0) se muestran solo 'por_pagina' claves de cada tipo
 
     # Verificar si el directorio de claves existe
-    if not os.path.isdir(KEYS_DIR):
+    if not sincronizar_indice():
         print("No se han generado claves aun. Use la opcion [1] para generar un par.")
         return []  
 
-    # Obtener lista de archivos .pem en el directorio, ordenados 
-    archivos = sorted([f for f in os.listdir(KEYS_DIR) if f.endswith('.pem')])
+    # Obtener las claves del indice, ordenadas y separadas por tipo
+    limite = por_pagina if pagina is not None else None
+    publicas = [fila["archivo"] for fila in key_index.listar(KEYS_DIR, "publica", pagina or 0, limite)]
+    privadas = [fila["archivo"] for fila in key_index.listar(KEYS_DIR, "privada", pagina or 0, limite)]
+    archivos = sorted(publicas + privadas)
 
     # Verificar si hay archivos
     if not archivos:
-        print("No hay claves disponibles en el directorio 'keys/'.")
+        print("No hay claves disponibles en el directorio 'keys/'." if not pagina else "No hay mas claves.")
         return []  
 
-    # Separar claves públicas y privadas para mostrarlas organizadamente
-    publicas = [f for f in archivos if '_public.pem' in f]   # Filtrar claves públicas
-    privadas = [f for f in archivos if '_private.pem' in f]  # Filtrar claves privadas
-
     # Mostrar claves públicas
     print("\n  Claves publicas:")
     for nombre in publicas:
@@ -145,8 +450,12 @@ def listar_claves():
     for nombre in privadas:
         ruta_completa = os.path.join(KEYS_DIR, nombre)
         print(f"    - {ruta_completa}")
+
+    if pagina is not None:
+        total = key_index.contar(KEYS_DIR)
+        print(f"\n  Pagina {pagina + 1} ({total} claves en total)")
     
-    # Return de la lista completa de claves RSA
+    # Return de la lista de claves RSA mostradas
     return archivos
 
 
@@ -162,7 +471,7 @@ if __name__ == "__main__":
     nombre = input("\nNombre del host (ej: student1): ").strip()
 
     if not nombre:
-        print("Error: El nombre no puede estar vacio.")
+        reportar_error("El nombre no puede estar vacio.")
         sys.exit(1)  
 
     # Generar el par de claves
@@ -0,0 +1,327 @@
+"""
+Pool de Claves RSA - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+Generar un par RSA de 3072 bits toma varios segundos y el tiempo varia mucho de una clave a otra.
+Este modulo mantiene un pool de pares de claves ya generados, para que crear las claves de un host
+sea entregar un par listo en lugar de esperar a RSA.generate().
+
+Los pares se generan en segundo plano en un pool de procesos (uno por nucleo) hasta completar el tamaño
+configurado, y se guardan en keys/.pool/ con los mismos permisos restrictivos de la clave privada:
+el directorio con 700 y cada clave con 600. Cada par se entrega una sola vez: al tomarlo se renombra
+(operacion atomica) y se borra del pool, aunque varios procesos tomen claves al mismo tiempo.
+
+Uso:
+    python rsa_key_pool.py --tamano 50 --procesos 4     (llena el pool y termina)
+    python rsa_key_pool.py --tamano 50 --continuo       (mantiene el pool lleno hasta Ctrl+C)
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import os
+import sys
+import time
+import argparse
+import threading
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from Crypto.PublicKey import RSA
+from Crypto.Random import get_random_bytes
+
+import rsa_key_manager
+from rsa_key_manager import RSA_KEY_SIZE
+from metrics import emitir, mostrar
+
+
+# Constantes
+POOL_DIR = ".pool"                  # Subdirectorio de KEYS_DIR donde se guardan los pares listos
+TAMANO_POOL = 10                    # Cantidad de pares que se mantienen disponibles
+INTERVALO_REVISION = 1.0            # Segundos entre revisiones del pool cuando no hay generaciones en curso
+BUCKETS_GENERACION = (0.5, 1, 2, 4, 8, 16, 32)   # Limites (segundos) del histograma de tiempos de generacion
+EXTENSION_TOMADA = ".tomada"
+
+
+def ruta_pool():
+    # Directorio del pool, dentro del directorio de claves actual
+    return os.path.join(rsa_key_manager.KEYS_DIR, POOL_DIR)
+
+
+def preparar_directorio(directorio):
+    # Crea el directorio del pool con permisos 700 (solo el dueño puede listar y leer las claves)
+    os.makedirs(directorio, mode=0o700, exist_ok=True)
+    os.chmod(directorio, 0o700)
+
+
+def claves_disponibles(directorio=None):
+    # Lista los archivos de claves listas en el pool (ordenados del mas antiguo al mas nuevo)
+    directorio = directorio or ruta_pool()
+    try:
+        return sorted(nombre for nombre in os.listdir(directorio) if nombre.endswith(".pem"))
+    except OSError:
+        return []
+
+
+def guardar_en_pool(directorio, clave_privada_pem):
+    # Escribe un par en el pool de forma atomica: primero en un archivo temporal con permisos 600 y luego se renombra
+    # El nombre empieza con el tiempo en nanosegundos para que las claves se entreguen en orden de llegada
+    nombre = f"{time.time_ns():020d}_{get_random_bytes(4).hex()}.pem"
+    ruta = os.path.join(directorio, nombre)
+    ruta_temporal = ruta + ".tmp"
+
+    with open(os.open(ruta_temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as archivo:
+        archivo.write(clave_privada_pem)
+    os.replace(ruta_temporal, ruta)
+    return ruta
+
+
+def tomar_par(directorio=None):
+    # Toma un par del pool y lo elimina de este. Retorna la clave RSA o None si el pool esta vacio
+    directorio = directorio or ruta_pool()
+
+    for nombre in claves_disponibles(directorio):
+        ruta = os.path.join(directorio, nombre)
+        ruta_tomada = ruta + EXTENSION_TOMADA
+
+        # Renombrar es atomico: si otro proceso tomo esta clave primero, el rename falla y se intenta con la siguiente
+        try:
+            os.rename(ruta, ruta_tomada)
+        except OSError:
+            continue
+
+        try:
+            with open(ruta_tomada, 'rb') as archivo:
+                return RSA.import_key(archivo.read())
+        except ValueError:
+            print(f"Error: La clave '{ruta}' del pool esta corrupta, se descarta.")
+        finally:
+            os.remove(ruta_tomada)
+
+    return None
+
+
+def _generar_en_proceso(bits):
+    # Se ejecuta en un proceso del pool: genera un par y retorna (clave privada en PEM, segundos que tomo)
+    inicio = time.perf_counter()
+    clave = RSA.generate(bits)
+    return clave.export_key(format='PEM'), time.perf_counter() - inicio
+
+
+class PoolClaves:
+    # Mantiene 'tamano' pares de claves listos en el directorio del pool, generandolos en segundo plano
+    # Uso:
+    #     with PoolClaves(tamano=20) as pool:
+    #         generar_par_claves("student1", pool=pool)
+
+    def __init__(self, tamano=TAMANO_POOL, procesos=None, directorio=None, bits=RSA_KEY_SIZE):
+        self.tamano = tamano
+        self.procesos = procesos or os.cpu_count() or 1
+        self.directorio = directorio or ruta_pool()
+        self.bits = bits
+
+        self._condicion = threading.Condition()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._inicio = None
+        self._generando = 0
+
+        # Estadisticas expuestas por estado()
+        self._buckets = [0] * (len(BUCKETS_GENERACION) + 1)   # El ultimo bucket es +Inf
+        self._segundos_total = 0.0
+        self._generadas = 0
+        self._entregadas = 0
+        self._sincronas = 0
+        self._errores = 0
+
+    def iniciar(self):
+        # Arranca el hilo que mantiene el pool lleno
+        if self._hilo is not None and self._hilo.is_alive():
+            return self
+
+        preparar_directorio(self.directorio)
+        self._detener.clear()
+        self._inicio = time.monotonic()
+        self._hilo = threading.Thread(target=self._reponer, name="pool-claves-rsa", daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        # Detiene la reposicion. Las generaciones en curso se descartan, las claves ya guardadas quedan en el pool
+        self._detener.set()
+        with self._condicion:
+            self._condicion.notify_all()
+        if self._hilo is not None:
+            self._hilo.join()
+            self._hilo = None
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, tipo, valor, traza):
+        self.detener()
+
+    def _reponer(self):
+        # Hilo de reposicion: mantiene a lo sumo un trabajo por proceso, hasta completar el tamaño del pool
+        ejecutor = ProcessPoolExecutor(max_workers=self.procesos)
+        pendientes = set()
+
+        try:
+            while not self._detener.is_set():
+                faltan = self.tamano - len(claves_disponibles(self.directorio)) - len(pendientes)
+                for _ in range(max(0, min(faltan, self.procesos - len(pendientes)))):
+                    pendientes.add(ejecutor.submit(_generar_en_proceso, self.bits))
+                self._generando = len(pendientes)
+
+                if not pendientes:
+                    self._detener.wait(INTERVALO_REVISION)
+                    continue
+
+                terminadas, pendientes = wait(pendientes, timeout=INTERVALO_REVISION, return_when=FIRST_COMPLETED)
+                for futuro in terminadas:
+                    try:
+                        clave_privada_pem, segundos = futuro.result()
+                    except Exception as error:
+                        print(f"Error: No se pudo generar una clave para el pool: {error}")
+                        self._errores += 1
+                        continue
+
+                    guardar_en_pool(self.directorio, clave_privada_pem)
+                    self._registrar_generacion(segundos)
+        finally:
+            self._generando = 0
+            # Se cancelan a mano las generaciones que aun no empiezan (cancel_futures requiere Python 3.9)
+            for futuro in pendientes:
+                futuro.cancel()
+            ejecutor.shutdown(wait=False)
+
+    def _registrar_generacion(self, segundos):
+        # Actualiza el histograma y avisa a quien este esperando una clave
+        with self._condicion:
+            self._buckets[bisect_left(BUCKETS_GENERACION, segundos)] += 1
+            self._segundos_total += segundos
+            self._generadas += 1
+            self._condicion.notify_all()
+
+        emitir({"etapa": "generar_clave_pool", "bytes": 0, "ok": True, "segundos": segundos,
+                "mb_por_segundo": None, "timestamp": time.time(), "bits": self.bits})
+
+    def esperar_lleno(self, espera=None):
+        # Bloquea hasta que el pool tenga 'tamano' claves disponibles. Retorna False si se cumplio la espera
+        limite = None if espera is None else time.monotonic() + espera
+        with self._condicion:
+            while len(claves_disponibles(self.directorio)) < self.tamano:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._condicion.wait(INTERVALO_REVISION if restante is None else min(restante, INTERVALO_REVISION))
+        return True
+
+    def tomar(self, espera=0):
+        # Entrega un par del pool. Si esta vacio espera hasta 'espera' segundos a que se genere uno
+        # y si aun no hay, genera el par en el momento (como lo haria generar_par_claves sin pool)
+        limite = time.monotonic() + espera
+        while True:
+            clave = tomar_par(self.directorio)
+            if clave is not None:
+                with self._condicion:
+                    self._entregadas += 1
+                return clave
+
+            restante = limite - time.monotonic()
+            if restante <= 0 or self._hilo is None:
+                break
+            with self._condicion:
+                self._condicion.wait(min(restante, INTERVALO_REVISION))
+
+        with self._condicion:
+            self._sincronas += 1
+        return RSA.generate(self.bits)
+
+    def estado(self):
+        # Tamaño del pool, claves disponibles, tasa de reposicion e histograma de tiempos de generacion
+        with self._condicion:
+            transcurrido = time.monotonic() - self._inicio if self._inicio is not None else 0
+            acumulado = 0
+            histograma = {}
+            for limite, cantidad in zip(list(BUCKETS_GENERACION) + ["+Inf"], self._buckets):
+                acumulado += cantidad
+                histograma[str(limite)] = acumulado
+
+            return {
+                "tamano": self.tamano,
+                "disponibles": len(claves_disponibles(self.directorio)),
+                "generando": self._generando,
+                "procesos": self.procesos,
+                "generadas": self._generadas,
+                "entregadas": self._entregadas,
+                "generadas_sin_pool": self._sincronas,
+                "errores": self._errores,
+                "pares_por_minuto": self._generadas * 60 / transcurrido if transcurrido > 0 else 0.0,
+                "segundos_generacion_total": self._segundos_total,
+                "histograma_segundos": histograma,
+            }
+
+    def texto(self):
+        # Estado del pool en el formato de texto de Prometheus (histograma acumulado, como lo espera Prometheus)
+        datos = self.estado()
+        prefijo = "sobre_digital_pool_claves"
+        lineas = [
+            f"# HELP {prefijo}_disponibles Pares de claves listos en el pool",
+            f"# TYPE {prefijo}_disponibles gauge",
+            f"{prefijo}_disponibles {datos['disponibles']}",
+            f"# HELP {prefijo}_tamano Cantidad de pares que se mantienen disponibles",
+            f"# TYPE {prefijo}_tamano gauge",
+            f"{prefijo}_tamano {datos['tamano']}",
+            f"# HELP {prefijo}_pares_por_minuto Tasa de reposicion del pool",
+            f"# TYPE {prefijo}_pares_por_minuto gauge",
+            f"{prefijo}_pares_por_minuto {datos['pares_por_minuto']:.3f}",
+            f"# HELP {prefijo}_entregadas_total Pares entregados desde el pool",
+            f"# TYPE {prefijo}_entregadas_total counter",
+            f"{prefijo}_entregadas_total {datos['entregadas']}",
+            f"# HELP {prefijo}_generacion_segundos Tiempo de generacion de cada par",
+            f"# TYPE {prefijo}_generacion_segundos histogram",
+        ]
+        for limite, cantidad in datos["histograma_segundos"].items():
+            lineas.append(f'{prefijo}_generacion_segundos_bucket{{le="{limite}"}} {cantidad}')
+        lineas.append(f"{prefijo}_generacion_segundos_sum {datos['segundos_generacion_total']:.6f}")
+        lineas.append(f"{prefijo}_generacion_segundos_count {datos['generadas']}")
+        return "\n".join(lineas) + "\n"
+
+
+def mostrar_estado(pool):
+    # Imprime una linea con el estado actual del pool
+    datos = pool.estado()
+    mostrar(f"  Pool: {datos['disponibles']}/{datos['tamano']} disponibles, {datos['generando']} generando, "
+            f"{datos['pares_por_minuto']:.1f} pares/min")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Genera y mantiene un pool de pares de claves RSA listos para entregar.")
+    parser.add_argument("--tamano", type=int, default=TAMANO_POOL, help=f"Pares a mantener disponibles (defecto {TAMANO_POOL})")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos generando claves (defecto: uno por nucleo)")
+    parser.add_argument("--continuo", action="store_true", help="Seguir reponiendo el pool hasta Ctrl+C")
+    parser.add_argument("--estado", action="store_true", help="Mostrar el estado del pool sin generar claves")
+    argumentos = parser.parse_args()
+
+    if argumentos.estado:
+        print(f"  {len(claves_disponibles())} pares disponibles en {ruta_pool()}")
+        sys.exit(0)
+
+    pool = PoolClaves(tamano=argumentos.tamano, procesos=argumentos.procesos).iniciar()
+    try:
+        while argumentos.continuo or not pool.esperar_lleno(espera=5):
+            mostrar_estado(pool)
+            if argumentos.continuo:
+                time.sleep(5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.detener()
+
+    mostrar_estado(pool)
+    print()
+    print(pool.texto())
@@ -0,0 +1,343 @@
+"""
+Cifrado Segmentado con Acceso Aleatorio - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+Este modulo implementa un formato de archivo .enc (version 3) en el que el archivo se divide en segmentos
+de tamaño fijo, y cada segmento se cifra y autentica de forma independiente con AES-256-GCM.
+
+A diferencia del formato CBC, en el que para leer cualquier parte hay que descifrar todo el archivo desde el
+inicio, aqui se puede descifrar solo el rango de bytes que se necesita: como todos los segmentos miden lo mismo,
+la posicion de cada uno en el archivo se calcula directamente (el indice es implicito).
+
+'Nonce': Cada segmento usa el nonce base del archivo (8 bytes) seguido del numero de segmento (4 bytes), asi
+ningun par clave/nonce se repite.
+'Tag': GCM genera un tag de 16 bytes por segmento, que detecta si el segmento fue modificado o si la clave es incorrecta.
+'Datos asociados': Cada segmento autentica la cabecera, su numero y si es el ultimo, de manera que no se pueden
+reordenar segmentos ni truncar el archivo sin que se detecte.
+
+Estructura:
+[MAGIC (8 bytes)][version (1 byte)][modo (1 byte)][flags (1 byte)][salt (16 bytes)][nonce base (8 bytes)][tamaño de segmento (4 bytes)]
+N veces: [segmento cifrado (tamaño de segmento, el ultimo puede ser menor)][tag (16 bytes)]
+
+'Paralelismo': Como los segmentos son independientes, el cifrado y descifrado de un archivo grande se reparten entre
+varios hilos (PyCryptodome libera el GIL mientras cifra). Cada hilo lee y escribe sus segmentos directamente en la
+posicion que les corresponde, por lo que el resultado es identico al del cifrado secuencial.
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from Crypto.Cipher import AES               # AES en modo GCM (cifrado autenticado)
+from Crypto.Random import get_random_bytes  # Generador de bytes aleatorios seguros
+
+from metrics import etapa, mostrar          # Medicion de etapas y mensajes de progreso (modo silencioso)
+
+# Derivacion de clave, cabecera y errores compartidos con el formato CBC
+from aes_file_encryptor import (
+    derivar_clave_modo, nombre_descifrado, ErrorCifrado,
+    MAGIC_ENC, VERSION_SEGMENTADO, MODO_PASSWORD, MODO_CLAVE, SIZE_SALT, ENC,
+)
+
+
+# Constantes
+SIZE_NONCE_BASE = 8
+SIZE_TAG = 16
+SIZE_SEGMENTO = 64 * 1024   # Tamaño de cada segmento de datos (granularidad del acceso aleatorio)
+SEGMENTOS_POR_TAREA = 64    # Segmentos que procesa cada tarea del pool de hilos (4 MiB con el tamaño por defecto)
+FORMATO_CABECERA = ">8sBBB16s8sI"
+SIZE_CABECERA_SEGMENTADA = struct.calcsize(FORMATO_CABECERA)
+
+
+def crear_cabecera_segmentada(modo, salt, nonce_base, size_segmento, flags=0):
+    # Construye la cabecera de un archivo segmentado
+    return struct.pack(FORMATO_CABECERA, MAGIC_ENC, VERSION_SEGMENTADO, modo, flags, salt, nonce_base, size_segmento)
+
+
+def leer_cabecera_segmentada(cabecera):
+    # Interpreta la cabecera y retorna (modo, flags, salt, nonce_base, size_segmento)
+    # Lanza ValueError si no es un archivo segmentado valido
+    if len(cabecera) != SIZE_CABECERA_SEGMENTADA:
+        raise ValueError("Archivo corrupto, o muy pequeño para ser valido.")
+
+    magic, version, modo, flags, salt, nonce_base, size_segmento = struct.unpack(FORMATO_CABECERA, cabecera)
+
+    if magic != MAGIC_ENC or version != VERSION_SEGMENTADO or modo not in (MODO_PASSWORD, MODO_CLAVE):
+        raise ValueError("El archivo no tiene el formato segmentado.")
+    if flags:
+        # El formato segmentado no comprime ni usa el MAC de registros del formato CBC: no define ninguna opcion
+        raise ValueError(f"Opciones de archivo no soportadas: {flags:#04x}")
+    if size_segmento == 0:
+        raise ValueError("Tamaño de segmento invalido.")
+
+    return modo, flags, salt, nonce_base, size_segmento
+
+
+def _cifrador_segmento(clave, nonce_base, cabecera, indice, final):
+    # Crea el cifrador GCM del segmento 'indice'. El nonce y los datos asociados dependen del numero de segmento
+    cifrador = AES.new(clave, AES.MODE_GCM, nonce=nonce_base + struct.pack(">I", indice), mac_len=SIZE_TAG)
+    cifrador.update(cabecera + struct.pack(">QB", indice, 1 if final else 0))
+    return cifrador
+
+
+def cifrar_segmento(clave, nonce_base, cabecera, indice, datos, final):
+    # Cifra un segmento y retorna [datos cifrados][tag]
+    cifrador = _cifrador_segmento(clave, nonce_base, cabecera, indice, final)
+    datos_cifrados, tag = cifrador.encrypt_and_digest(datos)
+    return datos_cifrados + tag
+
+
+def descifrar_segmento(clave, nonce_base, cabecera, indice, bloque, final):
+    # Descifra y verifica un segmento [datos cifrados][tag]
+    # Lanza ValueError si el tag no coincide (clave incorrecta, segmento modificado, reordenado o archivo truncado)
+    cifrador = _cifrador_segmento(clave, nonce_base, cabecera, indice, final)
+    return cifrador.decrypt_and_verify(bloque[:-SIZE_TAG], bloque[-SIZE_TAG:])
+
+
+def calcular_segmentos(size_datos, size_segmento):
+    # A partir del tamaño de los datos cifrados (sin cabecera) calcula (cantidad de segmentos, tamaño original)
+    # Lanza ValueError si el tamaño no corresponde a una secuencia valida de segmentos
+    size_bloque = size_segmento + SIZE_TAG
+    if size_datos < SIZE_TAG:
+        raise ValueError("Archivo corrupto, o muy pequeño para ser valido.")
+
+    cantidad = -(-size_datos // size_bloque)
+    size_ultimo = size_datos - (cantidad - 1) * size_bloque - SIZE_TAG
+    if size_ultimo < 0:
+        raise ValueError("Archivo truncado.")
+
+    return cantidad, (cantidad - 1) * size_segmento + size_ultimo
+
+
+def cifrar_segmentos(clave, nonce_base, cabecera, entrada, salida, size_segmento):
+    # Lee 'entrada' por segmentos, cifra cada uno y lo escribe en 'salida'
+    # Siempre se escribe al menos un segmento (vacio si la entrada esta vacia) para marcar el final
+    # Retorna la cantidad de bytes originales leidos
+    total = 0
+    indice = 0
+    datos = entrada.read(size_segmento)
+
+    while True:
+        siguiente = entrada.read(size_segmento)
+        final = not siguiente
+
+        salida.write(cifrar_segmento(clave, nonce_base, cabecera, indice, datos, final))
+        total += len(datos)
+
+        if final:
+            return total
+
+        datos = siguiente
+        indice += 1
+
+
+def _cifrar_tarea(ruta_archivo, ruta_cifrado, clave, nonce_base, cabecera, size_segmento, primero, ultimo, cantidad):
+    # Cifra los segmentos [primero, ultimo) y los escribe en su posicion del archivo de salida
+    # Cada tarea abre sus propios descriptores, asi los hilos no comparten la posicion de lectura/escritura
+    with open(ruta_archivo, "rb") as entrada, open(ruta_cifrado, "r+b") as salida:
+        entrada.seek(primero * size_segmento)
+        salida.seek(len(cabecera) + primero * (size_segmento + SIZE_TAG))
+
+        for indice in range(primero, ultimo):
+            datos = entrada.read(size_segmento)
+            salida.write(cifrar_segmento(clave, nonce_base, cabecera, indice, datos, indice == cantidad - 1))
+
+
+def _repartir_tareas(funcion, cantidad, trabajadores, *argumentos):
+    # Divide los segmentos en tareas de SEGMENTOS_POR_TAREA y las ejecuta en un pool de hilos
+    # Si una tarea falla se cancelan las pendientes y la excepcion se propaga
+    with ThreadPoolExecutor(max_workers=trabajadores) as pool:
+        tareas = [
+            pool.submit(funcion, *argumentos, primero, min(primero + SEGMENTOS_POR_TAREA, cantidad), cantidad)
+            for primero in range(0, cantidad, SEGMENTOS_POR_TAREA)
+        ]
+        try:
+            for tarea in tareas:
+                tarea.result()
+        except BaseException:
+            for tarea in tareas:
+                tarea.cancel()
+            raise
+
+
+def cifrar_archivo_segmentado(ruta_archivo, password, modo=MODO_PASSWORD, size_segmento=SIZE_SEGMENTO, trabajadores=None):
+    """
+    Cifra el archivo con AES-256-GCM por segmentos independientes y lo guarda con la extension .enc
+    Estructura:
+    [cabecera (39 bytes)] N x [segmento cifrado][tag (16 bytes)]
+    Los archivos grandes se cifran en paralelo con 'trabajadores' hilos (por defecto uno por nucleo).
+    """
+    if not os.path.isfile(ruta_archivo):
+        raise ErrorCifrado(f"El archivo '{ruta_archivo}' no existe.")
+
+    size_original = os.path.getsize(ruta_archivo)
+    mostrar(f"Archivo leido: {ruta_archivo} ({size_original} bytes)")
+
+    # Generar salt y nonce base aleatorios, y derivar la clave segun el modo
+    salt = get_random_bytes(SIZE_SALT)
+    nonce_base = get_random_bytes(SIZE_NONCE_BASE)
+    clave = derivar_clave_modo(password, salt, modo)
+    cabecera = crear_cabecera_segmentada(modo, salt, nonce_base, size_segmento)
+
+    # Siempre hay al menos un segmento (vacio si el archivo esta vacio)
+    cantidad = max(1, -(-size_original // size_segmento))
+    trabajadores = trabajadores or os.cpu_count() or 1
+
+    # Cifrar por segmentos y guardar el archivo cifrado
+    # Si algo falla se borra la salida: con la reserva del tamaño final quedaria un .enc del tamaño correcto con huecos
+    ruta_cifrado = ruta_archivo + ENC
+    try:
+        with etapa("aes_cifrar", size_original, formato="GCM", trabajadores=trabajadores):
+            with open(ruta_archivo, "rb") as entrada, open(ruta_cifrado, "wb") as salida:
+                salida.write(cabecera)
+
+                if trabajadores == 1 or cantidad <= SEGMENTOS_POR_TAREA:
+                    cifrar_segmentos(clave, nonce_base, cabecera, entrada, salida, size_segmento)
+                else:
+                    # Reservar el tamaño final para que cada hilo escriba sus segmentos en su posicion
+                    salida.truncate(len(cabecera) + size_original + cantidad * SIZE_TAG)
+
+            if trabajadores > 1 and cantidad > SEGMENTOS_POR_TAREA:
+                _repartir_tareas(_cifrar_tarea, cantidad, trabajadores,
+                                 ruta_archivo, ruta_cifrado, clave, nonce_base, cabecera, size_segmento)
+    except BaseException:
+        if os.path.exists(ruta_cifrado):
+            os.remove(ruta_cifrado)
+        raise
+
+    size_final = os.path.getsize(ruta_cifrado)
+    mostrar(f"Archivo cifrado: {ruta_cifrado} ({size_final} bytes)")
+
+    return ruta_cifrado
+
+
+class LectorSegmentado:
+    # Permite leer cualquier rango de bytes de un archivo segmentado, descifrando solo los segmentos necesarios
+    # Uso:
+    #   with LectorSegmentado("archivo.tar.enc", password) as lector:
+    #       datos = lector.leer(inicio, largo)
+
+    def __init__(self, ruta_cifrado, password=None, clave=None):
+        # Se puede indicar la clave AES ya derivada ('clave') en lugar de la contraseña, para no repetir la derivacion
+        if not os.path.isfile(ruta_cifrado):
+            raise ErrorCifrado(f"El archivo '{ruta_cifrado}' no existe.")
+
+        self.ruta = ruta_cifrado
+        self._archivo = open(ruta_cifrado, "rb")
+
+        try:
+            self.cabecera = self._archivo.read(SIZE_CABECERA_SEGMENTADA)
+            modo, self.flags, salt, self.nonce_base, self.size_segmento = leer_cabecera_segmentada(self.cabecera)
+            size_datos = os.fstat(self._archivo.fileno()).st_size - SIZE_CABECERA_SEGMENTADA
+            self.cantidad_segmentos, self.size = calcular_segmentos(size_datos, self.size_segmento)
+        except ValueError as error:
+            self._archivo.close()
+            raise ErrorCifrado(str(error))
+
+        self._clave = clave if clave is not None else derivar_clave_modo(password, salt, modo)
+
+        # Ultimo segmento descifrado, para que las lecturas secuenciales pequeñas no lo descifren varias veces
+        self._ultimo_indice = None
+        self._ultimo_segmento = None
+
+    def descifrar_segmento(self, indice):
+        # Lee, verifica y descifra el segmento 'indice'. Lanza ErrorCifrado si no es autentico
+        if not 0 <= indice < self.cantidad_segmentos:
+            raise IndexError(f"Segmento fuera de rango: {indice}")
+
+        if indice == self._ultimo_indice:
+            return self._ultimo_segmento
+
+        size_bloque = self.size_segmento + SIZE_TAG
+        self._archivo.seek(SIZE_CABECERA_SEGMENTADA + indice * size_bloque)
+        bloque = self._archivo.read(size_bloque)
+
+        try:
+            segmento = descifrar_segmento(self._clave, self.nonce_base, self.cabecera, indice, bloque,
+                                          indice == self.cantidad_segmentos - 1)
+        except ValueError:
+            raise ErrorCifrado(f"Contraseña incorrecta o segmento {indice} corrupto.")
+
+        self._ultimo_indice, self._ultimo_segmento = indice, segmento
+        return segmento
+
+    def duplicar(self):
+        # Abre otro lector del mismo archivo con la clave ya derivada (cada hilo debe usar su propio lector)
+        return LectorSegmentado(self.ruta, clave=self._clave)
+
+    def leer(self, inicio, largo):
+        # Retorna los bytes originales del rango [inicio, inicio + largo), recortado al tamaño del archivo
+        inicio = max(0, inicio)
+        fin = min(self.size, inicio + max(0, largo))
+        if inicio >= fin:
+            return b""
+
+        partes = []
+        for indice in range(inicio // self.size_segmento, (fin - 1) // self.size_segmento + 1):
+            segmento = self.descifrar_segmento(indice)
+            base = indice * self.size_segmento
+            partes.append(segmento[max(inicio - base, 0):fin - base])
+
+        return b"".join(partes)
+
+    def cerrar(self):
+        self._archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.cerrar()
+
+
+def _descifrar_tarea(lector, ruta_descifrado, primero, ultimo, cantidad):
+    # Descifra los segmentos [primero, ultimo) con un lector propio y los escribe en su posicion del archivo de salida
+    with lector.duplicar() as propio, open(ruta_descifrado, "r+b") as salida:
+        salida.seek(primero * lector.size_segmento)
+        for indice in range(primero, ultimo):
+            salida.write(propio.descifrar_segmento(indice))
+
+
+def descifrar_archivo_segmentado(ruta_cifrado, password, trabajadores=None):
+    # Descifra un archivo segmentado completo y lo guarda como <nombre>_descifrado<ext>
+    # Los archivos grandes se descifran en paralelo con 'trabajadores' hilos (por defecto uno por nucleo)
+    # Un segmento no autentico detiene el proceso, sin dejar un archivo descifrado a medias
+    trabajadores = trabajadores or os.cpu_count() or 1
+
+    with LectorSegmentado(ruta_cifrado, password) as lector:
+        mostrar(f"Archivo cifrado leido: {ruta_cifrado} ({os.path.getsize(ruta_cifrado)} bytes)")
+
+        ruta_descifrado = nombre_descifrado(ruta_cifrado)
+        cantidad = lector.cantidad_segmentos
+
+        # Verificar primero el ultimo segmento (autenticado como final): una contraseña incorrecta o un archivo
+        # truncado se detectan antes de crear la salida y de repartir el trabajo entre los hilos
+        lector.descifrar_segmento(cantidad - 1)
+
+        # Se descifra en un temporal que reemplaza al archivo descifrado solo al terminar: cualquier error (no solo
+        # un segmento no autentico) lo borra, sin dejar un archivo a medias ni tocar uno descifrado antes
+        temporal = ruta_descifrado + ".tmp"
+        try:
+            with etapa("aes_descifrar", lector.size, formato="GCM", trabajadores=trabajadores):
+                with open(temporal, "wb") as salida:
+                    if trabajadores == 1 or cantidad <= SEGMENTOS_POR_TAREA:
+                        for indice in range(cantidad):
+                            salida.write(lector.descifrar_segmento(indice))
+                    else:
+                        salida.truncate(lector.size)
+
+                if trabajadores > 1 and cantidad > SEGMENTOS_POR_TAREA:
+                    _repartir_tareas(_descifrar_tarea, cantidad, trabajadores, lector, temporal)
+            os.replace(temporal, ruta_descifrado)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    mostrar(f"Archivo descifrado: {ruta_descifrado} ({lector.size} bytes)")
+
+    return ruta_descifrado
@@ -0,0 +1,109 @@
+"""
+Claves de Sesion - Laboratorio 03
+Ciberseguridad
+Universidad de los Andes
+===================================================
+Cada sobre digital cuesta una operacion RSA al emisor (cifrar la contraseña) y otra al receptor (descifrarla con la
+clave privada de 3072 bits, mucho mas lenta). Cuando el mismo emisor envia miles de archivos al mismo destinatario
+ese costo domina. En el modo sesion (opcional):
+
+'Emisor': Genera una clave de sesion aleatoria por cada grupo de destinatarios y la cifra con RSA una sola vez por
+ventana de tiempo (DURACION_SESION). Cada archivo usa una contraseña distinta, derivada con HKDF de la clave de
+sesion y un nonce aleatorio del archivo. El sobre lleva el identificador de la sesion, el nonce y la clave de sesion
+cifrada con RSA, por lo que cualquier sobre se puede abrir por si solo.
+'Receptor': Guarda en memoria las claves de sesion ya descifradas, por identificador de sesion, huella de la clave
+privada y entrada cifrada, y las descarta al vencer su tiempo de vida. Solo el primer sobre de cada sesion requiere
+la operacion RSA, pero cada sobre se abre solo con una clave privada del destinatario que tenga quien lo abre.
+
+Asi se hace una operacion RSA privada por sesion en lugar de una por archivo. A cambio, quien obtenga una clave de
+sesion puede abrir todos los archivos de esa sesion (no solo uno): la duracion de la sesion limita esa exposicion.
+Las claves de sesion solo se guardan en la memoria del proceso, nunca en disco.
+
+Autor: Juan David Daza
+Fecha: Febrero 2026
+"""
+
+# Includes
+import time
+import threading
+from collections import OrderedDict
+
+from Crypto.Protocol.KDF import HKDF    # Derivacion de la contraseña de cada archivo
+from Crypto.Hash import SHA256
+
+# Medicion de etapas
+from metrics import etapa
+
+
+# Constantes
+DURACION_SESION = 3600          # Segundos que se reutiliza una clave de sesion (emisor) o se conserva en cache (receptor)
+MAX_SESIONES = 1024             # Sesiones en cache como maximo, se descartan las usadas hace mas tiempo
+SIZE_CLAVE_SESION = 32
+CONTEXTO_SESION = b"AESFILE sesion"
+
+
+def derivar_password_archivo(clave_sesion, id_sesion, nonce):
+    # Contraseña AES de un archivo: HKDF-SHA256 de la clave de sesion con el nonce del archivo como salt
+    # El identificador de la sesion forma parte del contexto, asi la misma clave no sirve en otra sesion
+    with etapa("kdf", algoritmo="HKDF", uso="sesion"):
+        return HKDF(clave_sesion, SIZE_CLAVE_SESION, nonce, SHA256, context=CONTEXTO_SESION + id_sesion)
+
+
+class CacheSesiones:
+    # Cache de claves de sesion con tiempo de vida, compartido por los hilos del proceso
+    # Cada valor vence 'duracion' segundos despues de guardarse (usarlo no extiende su vida)
+    # Con mas de 'maximo' valores se descartan los usados hace mas tiempo
+
+    def __init__(self, duracion=DURACION_SESION, maximo=MAX_SESIONES):
+        self.duracion = duracion
+        self.maximo = maximo
+        self._valores = OrderedDict()     # clave -> (vencimiento, valor)
+        self._lock = threading.Lock()
+
+    def _buscar(self, clave, ahora):
+        entrada = self._valores.get(clave)
+        if entrada is None:
+            return None
+        if entrada[0] <= ahora:
+            del self._valores[clave]
+            return None
+        self._valores.move_to_end(clave)
+        return entrada[1]
+
+    def _guardar(self, clave, valor, ahora):
+        self._valores[clave] = (ahora + self.duracion, valor)
+        self._valores.move_to_end(clave)
+        while len(self._valores) > self.maximo:
+            self._valores.popitem(last=False)
+
+    def obtener(self, clave):
+        # Retorna el valor guardado, o None si no existe o ya vencio
+        with self._lock:
+            return self._buscar(clave, time.monotonic())
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._guardar(clave, valor, time.monotonic())
+
+    def obtener_o_crear(self, clave, crear):
+        # Retorna el valor guardado, o lo crea con crear() si no existe o ya vencio
+        # Se crea con el lock tomado, para que varios hilos no abran varias sesiones con los mismos destinatarios
+        with self._lock:
+            ahora = time.monotonic()
+            valor = self._buscar(clave, ahora)
+            if valor is None:
+                valor = crear()
+                self._guardar(clave, valor, ahora)
+            return valor
+
+    def limpiar(self):
+        with self._lock:
+            self._valores.clear()
+
+    def __len__(self):
+        return len(self._valores)
+
+
+# Caches del proceso: sesiones abiertas por el emisor (por destinatarios) y claves descifradas por el receptor
+sesiones_emisor = CacheSesiones()
+sesiones_receptor = CacheSesiones()